@@ -0,0 +1,543 @@
+#!/usr/bin/env python
+#
+# Benchmarks of the hot paths of superplotter on synthetic inputs
+# (see superplotter.benchmarks.synthetic), so that performance changes
+# can be measured without the real ntuples:
+#
+#   selection   the region selections and weights of superplotter.region
+#               evaluated over in-memory columns             [events/s]
+#   yields      get_region_yields of all regions on synthetic ntuples
+#                                                    [events/s, points/s]
+#   metadata    parsing and loading the metadata of a grid   [points/s]
+#   systables   parsing and summarizing SysTable .tex files  [tables/s]
+#   render      drawing and saving TGraph2D maps of a grid   [points/s]
+#   interpolation  the maps of 9 regions x 4 quantities of a grid, with
+#               a triangulation per map, a shared one or a cached one
+#               (and with TGraph2D if ROOT is available)       [maps/s]
+#   stat_tools  vectorized p-value <-> nsigma conversions, and their
+#               precision w.r.t. TMath (math.erfc without ROOT) [values/s]
+#   significance  Z_Asimov and Z_n of every point and region of a grid,
+#               and the best region of each point              [points/s]
+#   startup     time to start each script (with --help) and to import
+#               the library modules, and whether ROOT got loaded      [ms]
+#
+# The inputs are generated from a fixed seed and every benchmark is
+# repeated, the best time being reported. The benchmarks needing ROOT
+# (yields, render) are skipped when it is not available.
+#
+# e.g.
+#     ./run_benchmarks.py -b selection metadata systables -o bench.json
+#
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import math
+import subprocess
+import numpy as np
+
+from superplotter.region import regions
+from superplotter.selection import SelectionProgram, as_mask, as_weight
+from superplotter.columns import have_root_numpy, DEFAULT_CHUNK_SIZE
+from superplotter.benchmarks import synthetic
+
+benchmarks = [ 'selection', 'yields', 'metadata', 'systables', 'render', 'interpolation', 'stat_tools', 'significance',
+               'startup' ]
+
+def have_root() :
+    try :
+        import ROOT
+    except ImportError :
+        return False
+    return True
+
+def best_time(func, repeat) :
+    '''
+    The shortest wall time of "repeat" calls of func, and the
+    result of the last call
+    '''
+    best, result = None, None
+    for i in xrange(max(repeat, 1)) :
+        start = time.time()
+        result = func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best : best = elapsed
+    return best, result
+
+def result(benchmark, case, n, unit, seconds) :
+    ''' One line of the report: n "unit"s done in "seconds" '''
+    return { 'benchmark' : benchmark, 'case' : case, 'n' : n, 'unit' : unit,
+             'seconds' : seconds, 'rate' : (n / seconds if seconds > 0 else float('inf')) }
+
+''' -------------------------------------------'''
+'''  Benchmarks                                '''
+''' -------------------------------------------'''
+def bench_selection(args, workdir) :
+    '''
+    The per-chunk work of get_region_yields_from_columns, without the
+    reading of the tree: all regions and the weight over every chunk
+    '''
+    columns = synthetic.make_columns(args.events * args.points, args.seed)
+    n_events = len(columns['eventweight'])
+    region_names = sorted(regions.keys())
+    def run() :
+        program = SelectionProgram()
+        for reg in region_names :
+            program.add(reg, regions[reg])
+        program.add(('weight', 'eventweight'), 'eventweight')
+        sumw = dict((reg, 0.0) for reg in region_names)
+        for start in xrange(0, n_events, DEFAULT_CHUNK_SIZE) :
+            chunk = dict((name, c[start:start+DEFAULT_CHUNK_SIZE]) for name, c in columns.items())
+            n = len(chunk['eventweight'])
+            values = program.evaluate(chunk)
+            w = as_weight(values[('weight', 'eventweight')], n)
+            for reg in region_names :
+                sumw[reg] += float(w[as_mask(values[reg], n)].sum())
+        return sumw
+    seconds, sumw = best_time(run, args.repeat)
+    return [ result('selection', '%d regions + weight'%len(region_names), n_events, 'events', seconds) ]
+
+def bench_yields(args, workdir) :
+    '''
+    get_region_yields of all regions over the reco ntuples of the grid
+    '''
+    from superplotter.yields import get_region_yields
+    from superplotter.treepool import tree_pool
+    grid = synthetic.make_grid(os.path.join(workdir, 'grid'), args.points, args.events, args.seed, truth=False)
+    region_names = sorted(regions.keys())
+    trees = [(f, 'id_%s'%dsid) for f, (dsid, mX, mY) in zip(grid['reco'], grid['points'])]
+    def run() :
+        out = []
+        for f, tree_name in trees :
+            out.append(get_region_yields(tree_pool.get(f, tree_name), "eventweight", region_names))
+            tree_pool.release(f, tree_name)
+        return out
+    seconds, yields = best_time(run, args.repeat)
+    case = "%d regions, %s"%(len(region_names), "root_numpy" if have_root_numpy() else "TTree::Draw")
+    return [ result('yields', case, args.points * args.events, 'events', seconds),
+             result('yields', case, args.points, 'points', seconds) ]
+
+def bench_metadata(args, workdir) :
+    '''
+    Parsing the metadata files of a grid of args.metadata_points points,
+    loading them (from the pickled indices, then from memory) and
+    looking up every point
+    '''
+    from superplotter import metadata
+    points = synthetic.grid_points(args.metadata_points)
+    files = synthetic.write_metadata(os.path.join(workdir, 'info'), points, args.seed)
+    synthetic.register_grid(files)
+    dsids = [dsid for dsid, mX, mY in points]
+    kinds = sorted(files.keys())
+    cache_dir = metadata.default_cache_dir()
+
+    def parse() :
+        return [metadata.parsers[kind](files[kind]) for kind in kinds]
+    def load_cold() :
+        metadata.clear_indices()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        return [metadata.get_index(synthetic.GRID, kind) for kind in kinds]
+    def load_pickled() :
+        metadata.clear_indices()
+        return [metadata.get_index(synthetic.GRID, kind) for kind in kinds]
+    def lookup() :
+        found = 0
+        for dsid in dsids :
+            for kind in kinds :
+                if dsid in metadata.get_index(synthetic.GRID, kind) : found += 1
+        return found
+
+    n = len(points)
+    out = []
+    for case, func in [ ('parse', parse), ('load, no cache', load_cold), ('load, pickled', load_pickled),
+                        ('load, in memory + lookups', lookup) ] :
+        seconds, value = best_time(func, args.repeat)
+        out.append(result('metadata', case, n, 'points', seconds))
+    return out
+
+def bench_systables(args, workdir) :
+    '''
+    Parsing the SysTables of args.texdirs directories (all base regions
+    and flavours), loading them from the pickled tables and summarizing
+    them as systabler.py does
+    '''
+    from superplotter import systable
+    base_regions = [ "Super1a", "Super1b", "Super1c" ]
+    files = []
+    for i in xrange(args.texdirs) :
+        files += synthetic.make_systables(os.path.join(workdir, 'systables', 'd%d'%i), base_regions,
+                                          [ "sf", "em" ], seed=args.seed + i)
+    names = synthetic.default_systematics
+
+    def parse() :
+        return [systable.SysTable(f) for f in files]
+    def load_pickled() :
+        systable._tables.clear()
+        return [systable.load_systable(f) for f in files]
+    def summarize() :
+        out = []
+        for f in files :
+            table = systable.load_systable(f)
+            out.append((table.systematics(names), table.total_expectation(),
+                        table.total_stat_err(), table.total_sys_err()))
+        return out
+
+    # store the pickles once, so that load_pickled reads them
+    systable._tables.clear()
+    shutil.rmtree(systable.default_cache_dir(), ignore_errors=True)
+    for f in files : systable.load_systable(f)
+    out = []
+    for case, func in [ ('parse', parse), ('load, pickled', load_pickled),
+                        ('summarize, in memory', summarize) ] :
+        seconds, value = best_time(func, args.repeat)
+        out.append(result('systables', case, len(files), 'tables', seconds))
+    return out
+
+def draw_map(job) :
+    '''
+    Draw the TGraph2D map of a synthetic grid (a render_jobs draw function)
+    '''
+    import ROOT as r
+    name, points = job
+    c = r.TCanvas('c_' + name, '', 800, 600)
+    c.SetRightMargin(2.5 * c.GetRightMargin())
+    frame = r.TH2F('h_' + name, '', 50, 90, 250, 50, 0, 250)
+    g = r.TGraph2D(len(points))
+    g.SetName('g_' + name)
+    for i, (x, y, z) in enumerate(points) :
+        g.SetPoint(i, x, y, z)
+    frame.Draw('axis')
+    g.Draw('colz same')
+    c.Update()
+    c._keep = [frame, g]
+    return c, name
+
+def bench_render(args, workdir) :
+    '''
+    render_jobs of one acceptance-like map per region
+    '''
+    from superplotter.render import render_jobs
+    rng = np.random.RandomState(args.seed)
+    points = synthetic.grid_points(args.points)
+    jobs = [ ("map_%s"%reg, [(mX, mY, float(rng.uniform())) for dsid, mX, mY in points])
+             for reg in sorted(regions.keys()) ]
+    outdir = os.path.join(workdir, 'plots')
+    seconds, saved = best_time(lambda : render_jobs(draw_map, jobs, outdir, args.formats, args.jobs), args.repeat)
+    case = "%d maps, %s, %d job(s)"%(len(jobs), "/".join(args.formats), args.jobs)
+    return [ result('render', case, len(jobs) * len(points), 'points', seconds),
+             result('render', case, len(jobs), 'plots', seconds) ]
+
+# the maps of the mass plane drawn for each grid
+INTERPOLATION_MAPS = 9 * 4
+
+def bench_interpolation(args, workdir) :
+    '''
+    Interpolate INTERPOLATION_MAPS maps of a grid of args.interpolation_points
+    points onto the acceptance map binning
+    '''
+    from superplotter import interpolation
+    binning = (50, 90, 250, 50, 0, 250)
+    rng = np.random.RandomState(args.seed)
+    points = synthetic.grid_points(args.interpolation_points)
+    x = np.array([mX for dsid, mX, mY in points], dtype=np.float64)
+    y = np.array([mY for dsid, mX, mY in points], dtype=np.float64)
+    z = rng.uniform(size=(len(points), INTERPOLATION_MAPS))
+    cache_dir = os.path.join(workdir, 'interpolation')
+    def per_map() :
+        return [interpolation.MassPlaneInterpolator.build(x, y, binning).interpolate(z[:, i])
+                for i in xrange(INTERPOLATION_MAPS)]
+    def shared() :
+        interpolator = interpolation.InterpolationCache(persistent=False).get('SYNTH', x, y, binning)
+        return [interpolator.interpolate(z[:, i]) for i in xrange(INTERPOLATION_MAPS)]
+    def cached() :
+        interpolator = interpolation.InterpolationCache(cache_dir).get('SYNTH', x, y, binning)
+        return [interpolator.interpolate(z[:, i]) for i in xrange(INTERPOLATION_MAPS)]
+    cases = [ ('a triangulation per map', per_map), ('one shared triangulation', shared) ]
+    # fill the disk cache, the next runs read it
+    cached()
+    cases.append(('triangulation from the disk cache', cached))
+    if have_root() :
+        import ROOT
+        def tgraph2d() :
+            maps = []
+            for i in xrange(INTERPOLATION_MAPS) :
+                g = ROOT.TGraph2D(len(x), x, y, np.ascontiguousarray(z[:, i]))
+                g.SetNpx(binning[0])
+                g.SetNpy(binning[3])
+                maps.append(g.GetHistogram())
+            return maps
+        cases.append(('TGraph2D', tgraph2d))
+    out = []
+    for case, func in cases :
+        seconds, maps = best_time(func, args.repeat)
+        out.append(result('interpolation', case, INTERPOLATION_MAPS, 'maps', seconds))
+    return out
+
+# required agreement of the conversions with the reference
+SIGMA_TOLERANCE = 1e-8
+PVALUE_TOLERANCE = 1e-12
+
+# stored TMath::NormQuantile(1-p) values, so that the nsigma direction
+# is checked without ROOT too: [ (p, nsigma) ]
+NORM_QUANTILE_REFERENCE = [
+    (0.5,                    0.0),
+    (0.95,                   -1.6448536269514722),
+    (0.999,                  -3.090232306167813),
+    (0.15865525393145707,    1.0),
+    (0.05,                   1.6448536269514722),
+    (0.022750131948179195,   2.0),
+    (0.01,                   2.3263478740408408),
+    (1e-3,                   3.090232306167813),
+    (0.0013498980316301035,  3.0),
+    (3.1671241833119863e-05, 4.0),
+    (1e-6,                   4.753424308822899),
+    (2.866515718791939e-07,  5.0),
+    (1e-9,                   5.997807015007686),
+    (9.865876450376981e-10,  6.0),
+    (1.279812543885835e-12,  7.0),
+    (1e-12,                  7.034483825301132),
+    (1e-15,                  7.941345326170998),
+]
+# the +/-7.4 clamps of get_sigma_from_pvalue, p < 1e-16 and p > 1-1e-16,
+# and the unclamped p-values right at their edges: [ (p, nsigma) ]
+CLAMP_REFERENCE = [
+    (0.0,                    7.4),
+    (1e-17,                  7.4),
+    (9.999999999999999e-17,  7.4),
+    (1e-16,                  8.222082216130438),
+    (2e-16,                  8.138562060199721),
+    (1.0 - 2e-16,            -8.125890664701906),
+    (1.0 - 1e-16,            -8.209536151601387),
+    (1.0,                    -7.4),
+]
+
+def bench_stat_tools(args, workdir) :
+    '''
+    get_sigmas_from_pvalues and get_pvalues_from_sigmas over
+    args.conversions p-values spread over [1e-15, 1], and their
+    agreement with the scalar reference on a sample of them, and
+    of nsigma with stored NormQuantile values (ROOT not needed)
+    '''
+    from superplotter import stat_tools
+    rng = np.random.RandomState(args.seed)
+    pvalues = 10 ** rng.uniform(-15, 0, args.conversions)
+    seconds, sigmas = best_time(lambda : stat_tools.get_sigmas_from_pvalues(pvalues), args.repeat)
+    out = [ result('stat_tools', 'p-value -> nsigma, vectorized', len(pvalues), 'values', seconds) ]
+    seconds, back = best_time(lambda : stat_tools.get_pvalues_from_sigmas(sigmas), args.repeat)
+    out.append(result('stat_tools', 'nsigma -> p-value, vectorized', len(pvalues), 'values', seconds))
+
+    # the TMath based get_sigma_from_pvalue computes ErfInverse(1-2p),
+    # which loses precision for small p: compare nsigma for p > 1e-8 only,
+    # the p-values (through erfc) over the whole range
+    sample_p = pvalues[:args.precision_sample]
+    sample_z = sigmas[:args.precision_sample]
+    if have_root() :
+        import ROOT
+        reference = "TMath"
+        start = time.time()
+        ref_z = np.array([stat_tools.get_sigma_from_pvalue(p) for p in sample_p])
+        ref_seconds = time.time() - start
+        ref_p = np.array([0.5 * ROOT.TMath.Erfc(z / math.sqrt(2.0)) for z in sample_z])
+    else :
+        reference = "math.erfc"
+        ref_z = None
+        start = time.time()
+        ref_p = np.array([0.5 * math.erfc(z / math.sqrt(2.0)) for z in sample_z])
+        ref_seconds = time.time() - start
+    res = result('stat_tools', 'scalar reference (%s)'%reference, len(sample_p), 'values', ref_seconds)
+    checks = [ ('max rel. diff. of p-values', np.max(np.abs(stat_tools.get_pvalues_from_sigmas(sample_z) - ref_p) / ref_p),
+                PVALUE_TOLERANCE),
+               ('max rel. diff. of round-trip p-values', np.max(np.abs(back - pvalues) / pvalues), PVALUE_TOLERANCE) ]
+    if ref_z is not None :
+        ok = sample_p > 1e-8
+        checks.append(('max abs. diff. of nsigma (p > 1e-8)', np.max(np.abs(sample_z[ok] - ref_z[ok])), SIGMA_TOLERANCE))
+    for name, reference_values in [ ('nsigma vs. stored NormQuantile', NORM_QUANTILE_REFERENCE),
+                                    ('nsigma at the 1e-16 clamp edges', CLAMP_REFERENCE) ] :
+        p, z = np.array(reference_values).T
+        checks.append((name, np.max(np.abs(stat_tools.get_sigmas_from_pvalues(p) - z)), SIGMA_TOLERANCE))
+    res['checks'] = [ { 'check' : name, 'value' : float(value), 'tolerance' : tolerance } for name, value, tolerance in checks ]
+    out.append(res)
+    return out
+
+# target time of the evaluation of a whole grid (with the default
+# 10000 points, far more than any of the real grids): well under a second
+SIGNIFICANCE_TARGET = 0.25
+
+def bench_significance(args, workdir) :
+    '''
+    superplotter.significance over a grid of args.significance_points
+    points in all of the regions, with each of the methods
+    '''
+    from superplotter import significance
+    rng = np.random.RandomState(args.seed)
+    n_regions = len(regions)
+    signal = rng.exponential(5.0, (args.significance_points, n_regions))
+    background = rng.uniform(1.0, 50.0, n_regions)
+    background_err = background * rng.uniform(0.1, 0.5, n_regions)
+    out = []
+    for method in significance.methods :
+        def run() :
+            z = significance.significance_grid(signal, background, background_err, method)
+            return significance.best_regions(z)
+        seconds, best = best_time(run, args.repeat)
+        res = result('significance', "%s, %d regions"%(method, n_regions), len(signal), 'points', seconds)
+        res['target'] = SIGNIFICANCE_TARGET
+        out.append(res)
+    return out
+
+# the entry points timed by the startup benchmark: (name, script or module,
+# target start-up time in seconds or None). The tools that do not plot
+# should start well before ROOT could even be loaded.
+_scripts_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'root')
+STARTUP_TARGET = 0.1
+entry_points = [
+    ('systabler.py',              os.path.join(_scripts_dir, 'systabler', 'systabler.py'),        STARTUP_TARGET),
+    ('make_cutflows.py',          os.path.join(_scripts_dir, 'cutflows', 'make_cutflows.py'),     STARTUP_TARGET),
+    ('make_cutmasks.py',          os.path.join(_scripts_dir, 'cutmasks', 'make_cutmasks.py'),     STARTUP_TARGET),
+    ('make_acc_and_eff_plots.py', os.path.join(_scripts_dir, 'hep_plots', 'make_acc_and_eff_plots.py'), None),
+    ('make_some_hepdata.py',      os.path.join(_scripts_dir, 'hep_plots', 'make_some_hepdata.py'), None),
+    ('make_isr_plots.py',         os.path.join(_scripts_dir, 'isr_plots', 'make_isr_plots.py'),   None),
+    ('isr_pulls.py',              os.path.join(_scripts_dir, 'isr_plots', 'isr_pulls.py'),        None),
+    ('make_significance_map.py',  os.path.join(_scripts_dir, 'hep_plots', 'make_significance_map.py'), STARTUP_TARGET),
+    ('superplotter.metadata',     'superplotter.metadata',   STARTUP_TARGET),
+    ('superplotter.signal',       'superplotter.signal',     STARTUP_TARGET),
+    ('superplotter.systable',     'superplotter.systable',   STARTUP_TARGET),
+    ('superplotter.stat_tools',   'superplotter.stat_tools', STARTUP_TARGET),
+    ('superplotter.plot_utils',   'superplotter.plot_utils', STARTUP_TARGET),
+    ('superplotter.yields',       'superplotter.yields',     None),
+]
+
+# run a script with --help (or import a module) and tell whether ROOT got loaded
+_startup_code = '''
+import sys, runpy
+target = sys.argv[1]
+if target.endswith('.py') :
+    sys.argv = [target, '--help']
+    sys.stdout = open('/dev/null', 'w')
+    try :
+        runpy.run_path(target, run_name='__main__')
+    except SystemExit :
+        pass
+    sys.stdout = sys.__stdout__
+else :
+    __import__(target)
+print 'ROOT' in sys.modules
+'''
+
+def _start(target) :
+    ''' (seconds, ROOT loaded) of one start-up, None if it failed '''
+    start = time.time()
+    process = subprocess.Popen([sys.executable, '-c', _startup_code, target],
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = process.communicate()
+    elapsed = time.time() - start
+    if process.returncode != 0 : return None
+    return elapsed, out.strip().endswith('True')
+
+def bench_startup(args, workdir) :
+    '''
+    The start-up time of each entry point, beyond that of a bare interpreter
+    '''
+    base, loaded = best_time(lambda : _start('sys'), args.repeat)
+    out = []
+    for name, target, target_seconds in entry_points :
+        runs = [_start(target) for i in xrange(max(args.repeat, 1))]
+        if any(run is None for run in runs) :
+            print "bench_startup    %s failed to start, skipping it"%name
+            continue
+        seconds = max(min(run[0] for run in runs) - base, 0.0)
+        res = result('startup', name + (" (loads ROOT)" if runs[-1][1] else ""), 1, 'starts', seconds)
+        res['target'] = target_seconds
+        out.append(res)
+    return out
+
+bench_functions = { 'selection' : bench_selection, 'yields' : bench_yields, 'metadata' : bench_metadata,
+                    'systables' : bench_systables, 'render' : bench_render,
+                    'interpolation' : bench_interpolation, 'stat_tools' : bench_stat_tools,
+                    'significance' : bench_significance, 'startup' : bench_startup }
+needs_root = [ 'yields', 'render' ]
+
+def print_results(results) :
+    ''' Returns False if any of the precision checks failed '''
+    passed = True
+    print "--------------------------------------------------------------------------------------"
+    print " %-10s %-36s %10s %-7s %10s %14s"%("benchmark", "case", "n", "unit", "best [s]", "rate [/s]")
+    print "--------------------------------------------------------------------------------------"
+    for res in results :
+        print " %-10s %-36s %10d %-7s %10.4f %14.1f"%(res['benchmark'], res['case'], res['n'], res['unit'],
+                                                   res['seconds'], res['rate'])
+    print "--------------------------------------------------------------------------------------"
+    for res in results :
+        if res.get('target') is None : continue
+        status = "ok" if res['seconds'] <= res['target'] else "MISSED"
+        print " %-10s %-36s %7.1f ms (target %.0f ms) %s"%(res['benchmark'], res['case'], 1000*res['seconds'],
+                                                          1000*res['target'], status)
+    for res in results :
+        for check in res.get('checks', []) :
+            status = "ok" if check['value'] <= check['tolerance'] else "FAILED"
+            print " %-10s %-36s %9.2e (tolerance %.0e) %s"%(res['benchmark'], check['check'], check['value'],
+                                                           check['tolerance'], status)
+            if status != "ok" : passed = False
+    return passed
+
+if __name__=="__main__" :
+    parser = argparse.ArgumentParser(description="Benchmark superplotter on synthetic inputs")
+    parser.add_argument("-b", "--bench", nargs="+", default=benchmarks, choices=benchmarks, help="Benchmarks to run (default: all)")
+    parser.add_argument("-p", "--points", type=int, default=25, help="Number of signal points of the synthetic grid (default: 25)")
+    parser.add_argument("-n", "--events", type=int, default=20000, help="Number of events per signal point (default: 20000)")
+    parser.add_argument("--metadata-points", type=int, default=5000, help="Number of points in the metadata files (default: 5000)")
+    parser.add_argument("--texdirs", type=int, default=20, help="Number of directories of SysTables (default: 20)")
+    parser.add_argument("--interpolation-points", type=int, default=150, help="Number of signal points of the interpolation benchmark (default: 150)")
+    parser.add_argument("--conversions", type=int, default=1000000, help="Number of p-values converted by the stat_tools benchmark (default: 1000000)")
+    parser.add_argument("--precision-sample", type=int, default=20000, help="Number of them compared to the scalar reference (default: 20000)")
+    parser.add_argument("--significance-points", type=int, default=10000, help="Number of points of the significance benchmark (default: 10000)")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Number of repetitions, the best is reported (default: 3)")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Random seed of the synthetic inputs (default: 0)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of worker processes for the render benchmark (default: 1)")
+    parser.add_argument("-f", "--formats", nargs="+", default=["png"], help="Formats of the render benchmark (default: png)")
+    parser.add_argument("-w", "--workdir", default="", help="Directory for the synthetic inputs (default: a temporary directory, removed at the end)")
+    parser.add_argument("-o", "--output", default="", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = args.workdir if args.workdir else tempfile.mkdtemp(prefix="superplotter_bench_")
+    if not os.path.isdir(workdir) : os.makedirs(workdir)
+    # keep the caches of the benchmarks away from the user's
+    os.environ['SUPERPLOTTER_CACHE_DIR'] = os.path.join(workdir, 'cache')
+
+    print "--------------------------------------"
+    print " superplotter benchmarks              "
+    print "- - - - - - - - - - - - - - - - - - - "
+    print "  benchmarks: %s                      "%(" ".join(args.bench))
+    print "  points:     %d                      "%(args.points)
+    print "  events:     %d                      "%(args.events)
+    print "  workdir:    %s                      "%(workdir)
+    print "--------------------------------------\n"
+
+    root = have_root()
+    results = []
+    try :
+        for name in [b for b in benchmarks if b in args.bench] :
+            if name in needs_root and not root :
+                print "Skipping the '%s' benchmark: ROOT is not available"%name
+                continue
+            print "Running the '%s' benchmark..."%name
+            results += bench_functions[name](args, workdir)
+    finally :
+        if not args.workdir : shutil.rmtree(workdir, ignore_errors=True)
+
+    passed = print_results(results)
+    if args.output :
+        report = { 'results' : results, 'settings' : vars(args), 'python' : platform.python_version(),
+                   'numpy' : np.__version__, 'root' : root, 'root_numpy' : have_root_numpy(),
+                   'platform' : platform.platform() }
+        with open(args.output, 'w') as f :
+            json.dump(report, f, indent=2, sort_keys=True)
+        print "Wrote the results to %s"%args.output
+    if not passed :
+        print "Some of the precision checks FAILED"
+        sys.exit(1)
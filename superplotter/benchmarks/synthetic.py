@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+#
+# Synthetic inputs for the superplotter benchmarks
+#
+# Makes a small grid of signal points that looks like the real ones
+# (which live on /gdata) closely enough to exercise the same code:
+#
+#   - CENTRAL_<dsid>.root (tree id_<dsid>) and truthRazor_<dsid>.root
+#     (tree truthNt) ntuples holding every leaf used by the regions of
+#     superplotter.region, the ISR variables and the event weights
+#   - the mass, cross-section and number-of-generated-events text files
+#     of the grid, in the formats read by superplotter.metadata
+#   - SysTable_<flavour><region>.tex tables as written by HistFitter's
+#     SysTable.py, as read by superplotter.systable
+#
+# Everything is drawn from a RandomState seeded by the caller, so the
+# same arguments always give the same inputs. Writing the ntuples needs
+# ROOT (root_numpy is used if available); the columns themselves and the
+# text files do not.
+#
+# Run this module to write a grid to a directory, e.g.
+#     python -m superplotter.benchmarks.synthetic -o synth -p 25 -n 20000
+#
+
+import os
+import argparse
+import numpy as np
+from array import array
+
+from superplotter.region import regions
+from superplotter.selection import selection_variables
+from superplotter.variables import isr_variables
+from superplotter.cutmask import WEIGHT_LEAVES
+
+# the synthetic grid is registered in superplotter.metadata under this name
+GRID = "SYNTH"
+FIRST_DSID = 900000
+
+# leaves of the ISR selection that are not in the regions
+_isr_leaves = [ 'lept1Pt', 'lept2Pt', 'lept1Eta', 'lept2Eta', 'met' ]
+
+def required_leaves() :
+    '''
+    The leaves read by the regions, the ISR plots and the event weights
+    '''
+    leaves = set(WEIGHT_LEAVES) | set(_isr_leaves)
+    for cut in regions.values() :
+        leaves |= selection_variables(cut)
+    for v in isr_variables.values() :
+        leaves.add(v.branch)
+    return sorted(leaves)
+
+''' -------------------------------------------'''
+'''  Event columns                             '''
+''' -------------------------------------------'''
+# integer leaves (flags and multiplicities), all others are doubles
+int_leaves = [ 'isOS', 'isElEl', 'isMuMu', 'isElMu', 'nCentralLightJets', 'nForwardJets', 'nCentralBJets' ]
+
+def make_columns(n_events, seed=0) :
+    '''
+    { leaf : array } of n_events synthetic events (momenta and
+    masses in MeV, as in the real ntuples)
+    '''
+    rng = np.random.RandomState(seed)
+    c = {}
+    flavour = rng.randint(0, 3, n_events)
+    c['isElEl'] = (flavour == 0).astype(np.int32)
+    c['isMuMu'] = (flavour == 1).astype(np.int32)
+    c['isElMu'] = (flavour == 2).astype(np.int32)
+    c['isOS'] = (rng.uniform(size=n_events) < 0.85).astype(np.int32)
+    c['nCentralLightJets'] = rng.poisson(1.2, n_events).astype(np.int32)
+    c['nForwardJets'] = rng.poisson(0.3, n_events).astype(np.int32)
+    c['nCentralBJets'] = rng.poisson(0.2, n_events).astype(np.int32)
+    c['lept1Pt'] = 10000. + rng.exponential(40000., n_events)
+    c['lept2Pt'] = 10000. + (c['lept1Pt'] - 10000.) * rng.uniform(size=n_events)
+    c['lept1Eta'] = rng.uniform(-2.7, 2.7, n_events)
+    c['lept2Eta'] = rng.uniform(-2.7, 2.7, n_events)
+    c['jet1Pt'] = np.where(c['nCentralLightJets'] > 0, 20000. + rng.exponential(60000., n_events), 0.)
+    c['mll'] = np.where(rng.uniform(size=n_events) < 0.3, rng.normal(91200., 2500., n_events),
+                        20000. + rng.exponential(50000., n_events))
+    c['pTll'] = rng.exponential(35000., n_events)
+    c['mDeltaR'] = rng.exponential(35000., n_events)
+    c['met'] = rng.exponential(50000., n_events)
+    c['R2'] = rng.uniform(size=n_events) ** 0.7
+    c['dphi_ll_vBetaT'] = np.pi * rng.uniform(size=n_events) ** 0.5
+    c['isr_weight_nom'] = rng.normal(1.0, 0.1, n_events)
+    c['eventweight'] = rng.normal(1.0, 0.05, n_events) * c['isr_weight_nom']
+    c['syst_ISRUP'] = 1.0 + np.abs(rng.normal(0., 0.05, n_events))
+    c['syst_ISRDOWN'] = 1.0 - np.abs(rng.normal(0., 0.05, n_events))
+    missing = [leaf for leaf in required_leaves() if leaf not in c]
+    if missing :
+        raise KeyError("make_columns error: no generator for the leaves %s"%missing)
+    return c
+
+''' -------------------------------------------'''
+'''  Ntuples                                   '''
+''' -------------------------------------------'''
+def write_ntuple(path, tree_name, columns) :
+    '''
+    Write the columns { leaf : array } to the tree "tree_name" of "path"
+    '''
+    names = sorted(columns.keys())
+    try :
+        from root_numpy import array2root
+    except ImportError :
+        array2root = None
+    if array2root is not None :
+        dtype = [(name, np.int32 if name in int_leaves else np.float64) for name in names]
+        records = np.empty(len(columns[names[0]]), dtype=dtype)
+        for name in names :
+            records[name] = columns[name]
+        array2root(records, path, tree_name, mode='recreate')
+        return
+    import ROOT as r
+    f = r.TFile(path, "RECREATE")
+    tree = r.TTree(tree_name, tree_name)
+    buffers = {}
+    for name in names :
+        if name in int_leaves :
+            buffers[name] = array('i', [0])
+            tree.Branch(name, buffers[name], "%s/I"%name)
+        else :
+            buffers[name] = array('d', [0.])
+            tree.Branch(name, buffers[name], "%s/D"%name)
+    values = [(buffers[name], columns[name].tolist()) for name in names]
+    for i in xrange(len(columns[names[0]])) :
+        for buf, col in values :
+            buf[0] = col[i]
+        tree.Fill()
+    tree.Write()
+    f.Close()
+
+def grid_points(n_points) :
+    '''
+    [ (dsid, mX, mY) ] for n_points points on a triangle of
+    (chargino, neutralino) masses with mX > mY
+    '''
+    points = []
+    n = int(np.ceil(np.sqrt(2 * n_points))) + 1
+    for i in xrange(n) :
+        for j in xrange(i + 1) :
+            if len(points) == n_points : return points
+            mX = 100. + 20. * i
+            mY = 20. * j
+            points.append((str(FIRST_DSID + len(points)), mX, mY))
+    return points
+
+def write_metadata(outdir, points, seed=0) :
+    '''
+    Write the mass, cross-section and number-of-generated-events files
+    of the points in the formats of superplotter.metadata.
+    Returns { kind : path }
+    '''
+    rng = np.random.RandomState(seed)
+    if not os.path.isdir(outdir) : os.makedirs(outdir)
+    files = dict((kind, os.path.join(outdir, "%s_%s.txt"%(GRID, kind))) for kind in ['mass', 'xsec', 'ngen'])
+    with open(files['mass'], 'w') as f :
+        f.write("DS MC1,MN2[GeV] MN1[GeV]\n")
+        for dsid, mX, mY in points :
+            f.write("%s %.1f %.1f\n"%(dsid, mX, mY))
+    with open(files['xsec'], 'w') as f :
+        f.write("# synthetic cross-sections\n#\n#\n# id name xsec br eff rel_unc\n#\n")
+        for dsid, mX, mY in points :
+            xsec = 20. * np.exp(-mX / 60.) * rng.uniform(0.9, 1.1)
+            f.write("%s Synth_%s_%d_%d %.6g 1.0 %.4f 0.1\n"%(dsid, GRID, mX, mY, xsec, rng.uniform(0.3, 0.6)))
+    with open(files['ngen'], 'w') as f :
+        f.write("# dsid n_generated\n")
+        for dsid, mX, mY in points :
+            f.write("%s %d\n"%(dsid, 20000 * rng.randint(1, 9)))
+    return files
+
+def register_grid(metadata, name=GRID) :
+    '''
+    Make the metadata files { kind : path } those of the grid "name"
+    '''
+    from superplotter.metadata import metadata_files
+    metadata_files[name] = dict(metadata)
+
+def make_grid(outdir, n_points=25, n_events=20000, seed=0, truth=True, reco=True) :
+    '''
+    Write the ntuples and metadata of a synthetic grid of n_points
+    points with n_events events each to "outdir" (reco ntuples in
+    outdir/reco, truth ntuples in outdir/truth). Returns
+    { 'points' : [(dsid, mX, mY)], 'reco' : [files], 'truth' : [files], 'metadata' : { kind : path } }
+    '''
+    points = grid_points(n_points)
+    grid = { 'points' : points, 'reco' : [], 'truth' : [] }
+    for kind, make, prefix in [('reco', reco, 'CENTRAL'), ('truth', truth, 'truthRazor')] :
+        if not make : continue
+        subdir = os.path.join(outdir, kind)
+        if not os.path.isdir(subdir) : os.makedirs(subdir)
+        for i, (dsid, mX, mY) in enumerate(points) :
+            path = os.path.join(subdir, "%s_%s.root"%(prefix, dsid))
+            tree_name = 'truthNt' if kind == 'truth' else 'id_%s'%dsid
+            write_ntuple(path, tree_name, make_columns(n_events, seed + 2*i + (kind == 'truth')))
+            grid[kind].append(path)
+    grid['metadata'] = write_metadata(os.path.join(outdir, 'info'), points, seed)
+    return grid
+
+''' -------------------------------------------'''
+'''  SysTables                                 '''
+''' -------------------------------------------'''
+# the systematics of the tables (those summarized by systabler.py)
+default_systematics = [ 'JER', 'JES', 'MMS', 'EESZ', 'ESF', 'EESLOW', 'EESMAT', 'EER', 'MEFF', 'MID', 'TES',
+                        'EESPS', 'TRIGGERE', 'TRIGGERM', 'TT\\_PS', 'Top\\_SR\\_other', 'mu\\_Top',
+                        'Top\\_CR\\_other', 'mu\\_WW', 'WW\\_THEORY', 'mu\\_ZV', 'ZV\\_THEORY', 'BJET',
+                        'BMISTAG', 'CJET', 'RESOST', 'SCALEST', 'Fake\\_RelUnc', 'Lumi' ]
+default_processes = [ 'Top', 'WW', 'ZV', 'Fakes' ]
+
+def _pm(value, total) :
+    percent = 100. * value / total if total else 0.
+    return "$\\pm %.2f\\ [%.2f\\%%] $"%(value, percent)
+
+def systable_text(processes, systematics, rng) :
+    '''
+    The text of one SysTable .tex file
+    '''
+    yields = rng.uniform(0.5, 20., len(processes))
+    variations = dict((name, rng.uniform(0., 0.15, len(processes)) * yields) for name in systematics)
+    stat = rng.uniform(0.02, 0.2, len(processes)) * yields
+    total_sys = np.sqrt(sum(v * v for v in variations.values()) + stat * stat)
+    lines = [ "\\begin{table}", "\\centering", "\\small", "\\begin{tabular*}{\\textwidth}{@{\\extracolsep{\\fill}}l%s}"%("c"*len(processes)),
+              "\\noalign{\\smallskip}\\hline\\noalign{\\smallskip}",
+              "{\\bf Uncertainty of channel} & %s \\\\"%" & ".join(processes),
+              "\\noalign{\\smallskip}\\hline\\noalign{\\smallskip}",
+              "Total background expectation & %s \\\\"%" & ".join("$ %.2f $"%y for y in yields),
+              "\\noalign{\\smallskip}\\hline\\noalign{\\smallskip}",
+              "Total background systematic & %s \\\\"%" & ".join(_pm(s, y) for s, y in zip(total_sys, yields)),
+              "\\noalign{\\smallskip}\\hline\\noalign{\\smallskip}" ]
+    for i, process in enumerate(processes) :
+        values = np.zeros(len(processes))
+        values[i] = stat[i]
+        lines.append("mcstat\\_%s\\_SR & %s \\\\"%(process, " & ".join(_pm(v, y) for v, y in zip(values, yields))))
+    for name in systematics :
+        lines.append("alpha\\_%s & %s \\\\"%(name, " & ".join(_pm(v, y) for v, y in zip(variations[name], yields))))
+        # a commented-out row, which the parser must skip
+        if rng.uniform() < 0.1 :
+            lines.append("%% alpha\\_%s & %s \\\\"%(name, " & ".join(_pm(v, y) for v, y in zip(variations[name], yields))))
+    lines += [ "\\noalign{\\smallskip}\\hline\\noalign{\\smallskip}", "\\end{tabular*}", "\\end{table}" ]
+    return "\n".join(lines) + "\n"
+
+def make_systables(texdir, base_regions, flavours, processes=default_processes,
+                   systematics=default_systematics, seed=0) :
+    '''
+    Write SysTable_<flavour><region>.tex to texdir for each of the
+    base regions and flavours. Returns the files written.
+    '''
+    rng = np.random.RandomState(seed)
+    if not os.path.isdir(texdir) : os.makedirs(texdir)
+    files = []
+    for base_region in base_regions :
+        for flavour in flavours :
+            path = os.path.join(texdir, "SysTable_%s%s.tex"%(flavour, base_region))
+            with open(path, 'w') as f :
+                f.write(systable_text(processes, systematics, rng))
+            files.append(path)
+    return files
+
+if __name__=="__main__" :
+    parser = argparse.ArgumentParser(description="Write a synthetic signal grid and SysTables")
+    parser.add_argument("-o", "--outdir", required=True, help="Directory to write the inputs to")
+    parser.add_argument("-p", "--points", type=int, default=25, help="Number of signal points (default: 25)")
+    parser.add_argument("-n", "--events", type=int, default=20000, help="Number of events per ntuple (default: 20000)")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--no-ntuples", action="store_true", default=False, help="Only write the metadata and SysTables")
+    args = parser.parse_args()
+
+    print "--------------------------------------"
+    print " Writing a synthetic grid             "
+    print "- - - - - - - - - - - - - - - - - - - "
+    print "  outdir:    %s                       "%(args.outdir)
+    print "  points:    %d                       "%(args.points)
+    print "  events:    %d                       "%(args.events)
+    print "--------------------------------------\n"
+
+    make = not args.no_ntuples
+    grid = make_grid(args.outdir, args.points, args.events, args.seed, truth=make, reco=make)
+    tables = make_systables(os.path.join(args.outdir, 'systables'), ["Super1a", "Super1b", "Super1c"],
+                            ["sf", "em", "ee", "mm"], seed=args.seed)
+    print "Wrote %d reco and %d truth ntuples, %d SysTables and the metadata %s"%(
+        len(grid['reco']), len(grid['truth']), len(tables), " ".join(sorted(grid['metadata'].values())))
@@ -0,0 +1,146 @@
+#
+# Persistent cache of selected-entry lists
+#
+# The selected entries of a tree for a given cut are stored on disk
+# as compressed index arrays, keyed by
+#   - the identity of the input file (path, size and mtime) and the
+#     name of the tree, and
+#   - a hash of the cut in its canonical form (superplotter.selection),
+#     so that e.g. re-ordered or re-spaced cuts share an entry.
+# As long as neither the ntuple nor the cut changes, reruns can skip
+# the selection and read only the selected entries.
+#
+# The lists are in $SUPERPLOTTER_CACHE_DIR/entrylists (default
+# ~/.superplotter_cache/entrylists)
+#
+
+import os
+import hashlib
+import numpy as np
+
+from superplotter.lazy_root import ROOT as r
+
+from superplotter.selection import normalize_selection
+from superplotter.utils import cache_base_dir, atomic_write
+
+def default_cache_dir() :
+    return os.path.join(cache_base_dir(), 'entrylists')
+
+def file_key(root_file, tree_name) :
+    ''' Hash of the identity of an input file and its tree '''
+    path = os.path.realpath(root_file)
+    stat = os.stat(path)
+    return hashlib.sha1("%s:%d:%r:%s"%(path, stat.st_size, stat.st_mtime, tree_name)).hexdigest()
+
+def cut_key(cut) :
+    ''' Hash of the canonical form of a cut '''
+    return hashlib.sha1(normalize_selection(cut)).hexdigest()
+
+class EntryListCache :
+    '''
+    On-disk store of the entries of a tree passing a cut
+    '''
+    def __init__(self, cache_dir=None, dbg=False) :
+        self.cache_dir = cache_dir if cache_dir else default_cache_dir()
+        self.dbg = dbg
+        if not os.path.isdir(self.cache_dir) : os.makedirs(self.cache_dir)
+
+    def path(self, root_file, tree_name, cut) :
+        return os.path.join(self.cache_dir, "%s_%s.npz"%(file_key(root_file, tree_name), cut_key(cut)))
+
+    def get(self, root_file, tree_name, cut) :
+        '''
+        The sorted entry numbers of the tree passing the cut,
+        or None if they are not in the cache
+        '''
+        path = self.path(root_file, tree_name, cut)
+        if not os.path.isfile(path) : return None
+        data = np.load(path)
+        entries = data['entries']
+        data.close()
+        if self.dbg : print "EntryListCache    hit  %s (%d entries)"%(path, len(entries))
+        return entries
+
+    def put(self, root_file, tree_name, cut, entries) :
+        '''
+        Store the entry numbers of the tree passing the cut
+        '''
+        path = self.path(root_file, tree_name, cut)
+        with atomic_write(path) as f :
+            np.savez_compressed(f, entries=np.sort(np.asarray(entries, dtype=np.int64)))
+        if self.dbg : print "EntryListCache    put  %s (%d entries)"%(path, len(entries))
+
+    def select(self, tree, root_file, cut) :
+        '''
+        Restrict "tree" to the entries passing "cut" by attaching a
+        TEntryList to it (TTree::Draw, etc... then only read those
+        entries). The entries come from the cache if they are there,
+        otherwise they are selected with TTree::Draw and cached.
+        Use tree.SetEntryList(0) to undo.
+        '''
+        entries = self.get(root_file, tree.GetName(), cut)
+        if entries is None :
+            tree.SetEntryList(0)
+            name = "elist_selection"
+            tree.Draw(">>%s"%name, cut, "entrylist")
+            elist = r.gDirectory.Get(name)
+            # attach the list made by TTree::Draw as it is, owned by us
+            # rather than by the current directory
+            elist.SetDirectory(0)
+            r.SetOwnership(elist, True)
+            self.put(root_file, tree.GetName(), cut, entries_from_tentrylist(elist))
+            set_entry_list(tree, elist)
+            return elist
+        return attach_entries(tree, root_file, entries)
+
+def set_entry_list(tree, elist) :
+    ''' Attach the TEntryList to the tree (tree.SetEntryList(0) to undo) '''
+    tree.SetEntryList(elist)
+    # keep the list alive as long as the tree uses it
+    tree._cached_entry_list = elist
+
+def attach_entries(tree, root_file, entries) :
+    '''
+    Restrict "tree" (read from "root_file") to the sorted entry
+    numbers "entries". Returns the attached TEntryList.
+    '''
+    elist = to_tentrylist(entries, tree.GetName(), root_file)
+    set_entry_list(tree, elist)
+    return elist
+
+# bulk copies between a TEntryList and an array of entries, so that
+# lists of millions of entries are not filled one PyROOT call at a time
+_ENTRYLIST_HELPERS = '''
+#include "TEntryList.h"
+void superplotter_enter_entries(TEntryList* elist, const Long_t* entries, Long64_t n)
+{
+    for (Long64_t i = 0; i < n; ++i) elist->Enter(entries[i]);
+}
+void superplotter_read_entries(TEntryList* elist, Long_t* entries)
+{
+    Long64_t n = elist->GetN();
+    for (Long64_t i = 0; i < n; ++i) entries[i] = elist->GetEntry(i);
+}
+'''
+_helpers_declared = False
+
+def _entrylist_helpers() :
+    ''' The ROOT module, with the entry-list helpers declared '''
+    global _helpers_declared
+    if not _helpers_declared :
+        r.gInterpreter.Declare(_ENTRYLIST_HELPERS)
+        _helpers_declared = True
+    return r
+
+def entries_from_tentrylist(elist) :
+    ''' The entry numbers held in a TEntryList, as an array '''
+    entries = np.empty(elist.GetN(), dtype=np.int_)
+    if len(entries) : _entrylist_helpers().superplotter_read_entries(elist, entries)
+    return entries.astype(np.int64)
+
+def to_tentrylist(entries, tree_name, root_file) :
+    ''' Build a TEntryList for the tree "tree_name" of "root_file" '''
+    elist = r.TEntryList("elist_cached", "", tree_name, root_file)
+    entries = np.ascontiguousarray(entries, dtype=np.int_)
+    if len(entries) : _entrylist_helpers().superplotter_enter_entries(elist, entries, len(entries))
+    return elist
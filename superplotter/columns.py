@@ -0,0 +1,166 @@
+#
+# Read the leaves of a tree into NumPy arrays, one chunk of
+# entries at a time, for the array-based selections in
+# superplotter.selection
+#
+# root_numpy is used when it is available. Otherwise the
+# leaves are read with a (slow) PyROOT loop over the entries.
+#
+# Only the branches that are read are enabled on the tree while it
+# is looped over (see prune_branches), so baskets of the other
+# branches are neither read nor decompressed.
+#
+
+import numpy as np
+from contextlib import contextmanager
+
+from superplotter.selection import selection_variables, draw_variables
+
+# number of entries read into memory at a time
+DEFAULT_CHUNK_SIZE = 200000
+
+# TTree::Draw expression of the entry number (see iter_draw_chunks)
+ENTRY_NUMBER = "Entry$"
+
+# root_numpy's tree2array, looked for on first use (root_numpy
+# imports ROOT), None if root_numpy is not available
+_tree2array = None
+_looked_for_root_numpy = False
+
+def _get_tree2array() :
+    global _tree2array, _looked_for_root_numpy
+    if not _looked_for_root_numpy :
+        try :
+            from root_numpy import tree2array as _tree2array
+        except ImportError :
+            _tree2array = None
+        _looked_for_root_numpy = True
+    return _tree2array
+
+def have_root_numpy() :
+    return _get_tree2array() is not None
+
+def expression_variables(expressions) :
+    '''
+    The set of tree leaves used by a list of TCut strings, weight
+    expressions and TTree::Draw commands
+    '''
+    names = set()
+    for expression in expressions :
+        expression = str(expression)
+        if not expression.strip() : continue
+        if '>>' in expression : names |= draw_variables(expression)
+        else : names |= selection_variables(expression)
+    return names
+
+def prune_branches(tree, expressions) :
+    '''
+    Enable only the branches of the tree referenced by the
+    given TCut strings, weights and draw commands
+    '''
+    names = expression_variables(expressions)
+    tree.SetBranchStatus("*", 0)
+    tree.LoadTree(0)
+    available = tree.GetListOfBranches()
+    for name in sorted(names) :
+        if available and not available.FindObject(name) : continue
+        tree.SetBranchStatus(name, 1)
+    return names
+
+def restore_branches(tree) :
+    ''' Enable all of the branches of the tree again '''
+    tree.SetBranchStatus("*", 1)
+
+@contextmanager
+def only_branches(tree, expressions) :
+    '''
+    Context in which only the branches of the tree referenced
+    by "expressions" are enabled
+    '''
+    prune_branches(tree, expressions)
+    try :
+        yield
+    finally :
+        restore_branches(tree)
+
+def read_columns(tree, branches, start, stop) :
+    '''
+    Read entries [start, stop) of the requested leaves.
+    Returns { leaf name : array }
+    '''
+    branches = sorted(branches)
+    if not branches : return {}
+    tree2array = _get_tree2array()
+    if tree2array is not None :
+        array = tree2array(tree, branches=branches, start=start, stop=stop)
+        return dict((b, array[b]) for b in branches)
+    columns = dict((b, np.empty(stop-start, dtype=np.float64)) for b in branches)
+    for entry in xrange(start, stop) :
+        tree.GetEntry(entry)
+        for b in branches :
+            columns[b][entry-start] = getattr(tree, b)
+    return columns
+
+def iter_chunks(tree, branches, chunk_size=DEFAULT_CHUNK_SIZE) :
+    '''
+    Loop over the tree in chunks of "chunk_size" entries,
+    yielding (number of entries, { leaf name : array })
+    '''
+    n_entries = int(tree.GetEntries())
+    with only_branches(tree, branches) :
+        for start in xrange(0, n_entries, chunk_size) :
+            stop = min(start+chunk_size, n_entries)
+            yield stop-start, read_columns(tree, branches, start, stop)
+
+def iter_entry_chunks(tree, branches, entries, chunk_size=DEFAULT_CHUNK_SIZE) :
+    '''
+    Loop over the sorted entry numbers "entries" of the tree in chunks
+    of at most "chunk_size" entries of the tree, yielding (number of
+    entries, { leaf name : array }) for the given entries only. Only
+    the span of each chunk holding the entries is read, and chunks
+    without any of them are skipped.
+    '''
+    entries = np.asarray(entries, dtype=np.int64)
+    n_entries = int(tree.GetEntries())
+    with only_branches(tree, branches) :
+        for start in xrange(0, n_entries, chunk_size) :
+            lo, hi = np.searchsorted(entries, [start, start+chunk_size])
+            if lo == hi : continue
+            first, last = int(entries[lo]), int(entries[hi-1])
+            columns = read_columns(tree, branches, first, last+1)
+            rows = entries[lo:hi] - first
+            yield hi-lo, dict((b, column[rows]) for b, column in columns.items())
+
+def _draw_buffer(buffer, n) :
+    ''' The first n values of a TTree::Draw buffer (GetV1, ...), as an array '''
+    if n == 0 : return np.zeros(0, dtype=np.float64)
+    buffer.SetSize(n)
+    return np.frombuffer(buffer, dtype=np.float64, count=n).copy()
+
+def iter_draw_chunks(tree, expressions, chunk_size=DEFAULT_CHUNK_SIZE) :
+    '''
+    Loop over the tree (over its entry list, if it has one) in chunks
+    of "chunk_size" entries, with a single TTree::Draw of all of the
+    expressions per chunk. Yields the values of each expression for
+    the entries of the chunk, as a list of arrays read in bulk from
+    the TTree::Draw buffers. The expressions must have one value per
+    entry; ENTRY_NUMBER gives the entry numbers.
+    '''
+    elist = tree.GetEntryList()
+    n_entries = int(elist.GetN()) if elist else int(tree.GetEntries())
+    cmd = ":".join("(%s)"%e for e in expressions)
+    estimate = tree.GetEstimate()
+    tree.SetEstimate(chunk_size + 1)
+    try :
+        with only_branches(tree, [e for e in expressions if e != ENTRY_NUMBER]) :
+            for first in xrange(0, n_entries, chunk_size) :
+                n_chunk = min(chunk_size, n_entries - first)
+                # "goff": no histogram, the values are only kept in the buffers
+                n = tree.Draw(cmd, "", "goff", n_chunk, first)
+                if n < 0 :
+                    raise ValueError("Columns error: cannot draw '%s'"%cmd)
+                if n > n_chunk :
+                    raise ValueError("Columns error: one of '%s' has more than one value per entry"%cmd)
+                yield [_draw_buffer(tree.GetVal(i), n) for i in xrange(len(expressions))]
+    finally :
+        tree.SetEstimate(estimate)
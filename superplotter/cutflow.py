@@ -0,0 +1,130 @@
+#
+# Cutflows and N-1 yields for the regions in superplotter.region
+#
+# Each region is split into its atomic cuts (in the order they are
+# written in the region string). For every region the sequential
+# cutflow (yield after each cut) and the N-1 yield of each cut (yield
+# with all of the other cuts applied) are accumulated together, for
+# all regions at once, in a single pass over the tree. The atomic
+# cuts are shared between regions and evaluated once per event.
+#
+
+import numpy as np
+
+from superplotter.region import regions
+from superplotter.selection import SelectionProgram, split_conjunction, as_mask, as_weight
+from superplotter.columns import iter_chunks, DEFAULT_CHUNK_SIZE
+
+class Cutflow :
+    '''
+    The cutflow and N-1 yields of a single region.
+
+    Step 0 of the cutflow is the yield before any cut, step i
+    (i>=1) is the yield after the first i cuts. n_minus_one[i] is
+    the yield with all cuts but cuts[i] applied.
+    Each is held as sum of weights, sumw2 and raw event counts.
+    '''
+    def __init__(self, region, cuts) :
+        self.region = region
+        self.cuts = cuts
+        ncuts = len(cuts)
+        self.sumw  = np.zeros(ncuts+1)
+        self.sumw2 = np.zeros(ncuts+1)
+        self.raw   = np.zeros(ncuts+1, dtype=np.int64)
+        self.n_minus_one_sumw  = np.zeros(ncuts)
+        self.n_minus_one_sumw2 = np.zeros(ncuts)
+        self.n_minus_one_raw   = np.zeros(ncuts, dtype=np.int64)
+
+    def fill(self, cut_masks, w) :
+        '''
+        Add the events of a chunk given the mask of each of
+        this region's cuts { cut : mask } and the event weights
+        '''
+        n = len(w)
+        # passing[i] <==> passes the first i cuts
+        passing = [np.ones(n, dtype=np.bool_)]
+        for cut in self.cuts :
+            passing.append(passing[-1] & cut_masks[cut])
+        # after[i] <==> passes cuts i, i+1, ... (after[ncuts] is all true)
+        after = [np.ones(n, dtype=np.bool_)]
+        for cut in reversed(self.cuts) :
+            after.insert(0, after[0] & cut_masks[cut])
+        for step, mask in enumerate(passing) :
+            self._add(self.sumw, self.sumw2, self.raw, step, mask, w)
+        for i in xrange(len(self.cuts)) :
+            self._add(self.n_minus_one_sumw, self.n_minus_one_sumw2, self.n_minus_one_raw,
+                      i, passing[i] & after[i+1], w)
+
+    def _add(self, sumw, sumw2, raw, i, mask, w) :
+        w_pass = w[mask]
+        sumw[i] += w_pass.sum()
+        sumw2[i] += (w_pass * w_pass).sum()
+        raw[i] += len(w_pass)
+
+    def table(self, title="") :
+        '''
+        The cutflow and N-1 yields formatted as a text table
+        '''
+        cut_width = max([len(c) for c in self.cuts] + [len("no selection"), len("cut")]) + 2
+        col_width = 14
+        header_template = ('{:<%d}'%cut_width) + ('{:>%d}'%col_width) * 5
+        line_template = ('{:<%d}'%cut_width) + ('{:>%d.3f}'%col_width) * 2 + ('{:>%d}'%col_width) + \
+                        ('{:>%d}'%col_width) * 2
+        fields = ['cut', 'sumw', '+/-', 'raw', 'N-1 sumw', 'N-1 raw']
+        line_break = '-' * (cut_width + 5*col_width)
+        lines = []
+        lines.append(line_break)
+        lines.append(title if title else self.region)
+        lines.append(line_break)
+        lines.append(header_template.format(*fields))
+        lines.append(line_break)
+        lines.append(line_template.format("no selection", self.sumw[0], np.sqrt(self.sumw2[0]), self.raw[0], "", ""))
+        for i, cut in enumerate(self.cuts) :
+            lines.append(line_template.format(cut, self.sumw[i+1], np.sqrt(self.sumw2[i+1]), self.raw[i+1],
+                                              "%.3f"%self.n_minus_one_sumw[i], self.n_minus_one_raw[i]))
+        lines.append(line_break)
+        return '\n'.join(lines)
+
+def region_cuts(region_names, region_dict=regions) :
+    ''' { region : [ atomic cuts, in cutflow order ] } '''
+    return dict((reg, split_conjunction(region_dict[reg])) for reg in region_names)
+
+def get_cutflows(tree, weight, region_names=None, region_dict=regions, chunk_size=DEFAULT_CHUNK_SIZE) :
+    '''
+    Compute the cutflow and N-1 yields for each of the requested
+    regions (default: all of them) in a single pass over the tree.
+
+    Returns { region : Cutflow }
+    '''
+    if region_names is None : region_names = sorted(region_dict.keys())
+    cuts = region_cuts(region_names, region_dict)
+    cutflows = dict((reg, Cutflow(reg, cuts[reg])) for reg in region_names)
+    program = SelectionProgram()
+    for cut in set(c for reg in region_names for c in cuts[reg]) :
+        program.add(cut, cut)
+    weight_key = ('weight',) # cannot clash with a cut
+    program.add(weight_key, weight)
+    for n, columns in iter_chunks(tree, program.variables(), chunk_size) :
+        values = program.evaluate(columns)
+        w = as_weight(values[weight_key], n)
+        cut_masks = dict((name, as_mask(v, n)) for name, v in values.items() if name != weight_key)
+        for reg in region_names :
+            cutflows[reg].fill(cut_masks, w)
+    return cutflows
+
+def get_cutflows_from_cutmask(cutmask, weight, region_names=None, region_dict=regions) :
+    '''
+    As get_cutflows, but derived from an atomic-cut bitmask
+    sidecar (superplotter.cutmask.CutMask) instead of the tree
+    '''
+    if region_names is None : region_names = sorted(region_dict.keys())
+    cuts = region_cuts(region_names, region_dict)
+    w = cutmask.weight(weight)
+    cut_masks = {}
+    for reg in region_names :
+        for cut in cuts[reg] :
+            if cut not in cut_masks : cut_masks[cut] = cutmask.region_mask(cut)
+    cutflows = dict((reg, Cutflow(reg, cuts[reg])) for reg in region_names)
+    for reg in region_names :
+        cutflows[reg].fill(cut_masks, w)
+    return cutflows
@@ -0,0 +1,161 @@
+#
+# Per-event atomic-cut bitmask "sidecar" files
+#
+# Each region in superplotter.region is a conjunction of atomic
+# cuts (isOS, nForwardJets==0, the Z-veto, R2>0.5, ...) and most of
+# them are shared between regions. Evaluate every distinct atomic
+# cut once per event and store the results, packed as uint32 bit
+# words, together with the event weight leaves next to the ntuple:
+#
+#     CENTRAL_177501.root  -->  CENTRAL_177501.cutmask.npz
+#
+# Any region built from those cuts (including ones defined later)
+# is then a bitwise AND plus a weighted sum over the sidecar, with
+# no need to read the ntuple again.
+#
+
+import numpy as np
+
+from superplotter.selection import SelectionProgram, parse_selection, format_node, \
+                                   evaluate_node, node_variables, as_mask
+from superplotter.columns import iter_chunks, DEFAULT_CHUNK_SIZE
+from superplotter.utils import file_stamp, atomic_write
+
+# weight leaves stored in the sidecar (if present in the tree)
+WEIGHT_LEAVES = [ 'eventweight', 'isr_weight_nom', 'syst_ISRUP', 'syst_ISRDOWN' ]
+
+BITS_PER_WORD = 32
+
+def atomic_cuts(expression) :
+    '''
+    Split a TCut string into its top-level '&&' terms,
+    each given in the canonical form of superplotter.selection
+    '''
+    node = parse_selection(expression)
+    if node[0] == 'and' : return [format_node(c) for c in node[1]]
+    return [format_node(node)]
+
+def collect_atomic_cuts(region_dict, region_names=None) :
+    '''
+    The sorted list of distinct atomic cuts making up the
+    requested regions (default: all of them)
+    '''
+    if region_names is None : region_names = region_dict.keys()
+    cuts = set()
+    for reg in region_names :
+        cuts.update(atomic_cuts(region_dict[reg]))
+    return sorted(cuts)
+
+def sidecar_path(root_file) :
+    ''' Location of the bitmask sidecar for an input ntuple '''
+    base = root_file[:-len('.root')] if root_file.endswith('.root') else root_file
+    return base + '.cutmask.npz'
+
+def has_leaf(tree, name) :
+    return bool(tree.GetListOfBranches().FindObject(name))
+
+def build_cutmask(tree, cuts, weight_leaves=WEIGHT_LEAVES, chunk_size=DEFAULT_CHUNK_SIZE) :
+    '''
+    Evaluate each atomic cut for every entry of the tree in one pass.
+    Returns (mask, weights) with mask a uint32 array of shape
+    (n_entries, n_words), bit (i % 32) of word (i / 32) being set
+    when the event passes cuts[i], and weights a dict
+    { leaf name : array } of the weight leaves found in the tree.
+    '''
+    n_words = max(1, (len(cuts) + BITS_PER_WORD - 1) // BITS_PER_WORD)
+    weight_leaves = [w for w in weight_leaves if has_leaf(tree, w)]
+    program = SelectionProgram()
+    for i, cut in enumerate(cuts) :
+        program.add(i, cut)
+
+    masks, weights = [], dict((w, []) for w in weight_leaves)
+    branches = program.variables() | set(weight_leaves)
+    for n, columns in iter_chunks(tree, branches, chunk_size) :
+        values = program.evaluate(columns)
+        chunk_mask = np.zeros((n, n_words), dtype=np.uint32)
+        for i in xrange(len(cuts)) :
+            passed = as_mask(values[i], n).astype(np.uint32)
+            chunk_mask[:, i // BITS_PER_WORD] |= passed << np.uint32(i % BITS_PER_WORD)
+        masks.append(chunk_mask)
+        for w in weight_leaves :
+            weights[w].append(np.asarray(columns[w]))
+    if masks : mask = np.concatenate(masks)
+    else : mask = np.zeros((0, n_words), dtype=np.uint32)
+    for w in weight_leaves :
+        weights[w] = np.concatenate(weights[w]) if weights[w] else np.zeros(0)
+    return mask, weights
+
+def write_cutmask(root_file, tree, cuts, weight_leaves=WEIGHT_LEAVES, outfile=None) :
+    '''
+    Build the bitmask for the tree of "root_file" and store
+    it in its sidecar file. Returns the sidecar path.
+    '''
+    if outfile is None : outfile = sidecar_path(root_file)
+    mask, weights = build_cutmask(tree, cuts, weight_leaves)
+    size, mtime = file_stamp(root_file)
+    arrays = { 'cuts' : np.array(cuts), 'mask' : mask,
+               'source_size' : np.array(size), 'source_mtime' : np.array(mtime),
+               'weight_leaves' : np.array(sorted(weights.keys())) }
+    for w in weights :
+        arrays['weight_' + w] = weights[w]
+    with atomic_write(outfile) as f :
+        np.savez_compressed(f, **arrays)
+    return outfile
+
+class CutMask :
+    '''
+    A loaded bitmask sidecar from which region selections
+    and yields are derived
+    '''
+    def __init__(self, path) :
+        self.path = path
+        data = np.load(path)
+        self.cuts = [str(c) for c in data['cuts']]
+        self.cut_index = dict((c, i) for i, c in enumerate(self.cuts))
+        self.mask = data['mask']
+        self.source_stamp = (int(data['source_size']), float(data['source_mtime']))
+        self.weights = dict((str(w), data['weight_' + str(w)]) for w in data['weight_leaves'])
+        data.close()
+
+    def n_entries(self) :
+        return self.mask.shape[0]
+
+    def is_current(self, root_file) :
+        ''' True if the ntuple has not changed since the sidecar was made '''
+        return file_stamp(root_file) == self.source_stamp
+
+    def has_cuts(self, expression) :
+        return all(c in self.cut_index for c in atomic_cuts(expression))
+
+    def region_mask(self, expression) :
+        '''
+        Boolean mask of the events passing the selection "expression",
+        all of whose atomic cuts must be in the sidecar
+        '''
+        required = np.zeros(self.mask.shape[1], dtype=np.uint32)
+        for cut in atomic_cuts(expression) :
+            if cut not in self.cut_index :
+                raise KeyError("CutMask error: cut '%s' is not in %s, re-make the sidecar"%(cut, self.path))
+            i = self.cut_index[cut]
+            required[i // BITS_PER_WORD] |= np.uint32(1 << (i % BITS_PER_WORD))
+        return np.all((self.mask & required) == required, axis=1)
+
+    def weight(self, expression) :
+        ''' Evaluate a weight expression over the stored weight leaves '''
+        node = parse_selection(expression)
+        missing = node_variables(node) - set(self.weights.keys())
+        if missing :
+            raise KeyError("CutMask error: weight leaves %s are not in %s"%(sorted(missing), self.path))
+        return np.ones(self.n_entries()) * evaluate_node(node, self.weights)
+
+    def region_yields(self, weight, region_names, region_dict) :
+        '''
+        Yield (sum of weights) and sumw2 for each requested region
+        Returns { region : (sumw, sumw2) }
+        '''
+        w = self.weight(weight)
+        yields = {}
+        for reg in region_names :
+            w_pass = w[self.region_mask(region_dict[reg])]
+            yields[reg] = (float(w_pass.sum()), float((w_pass * w_pass).sum()))
+        return yields
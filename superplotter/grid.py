@@ -0,0 +1,178 @@
+#
+# Columnar container for a grid of signal points
+#
+# The numbers describing the points of a grid (masses, cross-sections,
+# numbers of generated and selected events, ...) are held as typed
+# NumPy arrays, one entry per point, with hash indices on the dsid
+# and on the (mX, mY) mass pair. The acceptance and efficiency of all
+# points, in all regions, are then computed with array operations and
+# truth and reco grids are joined on the mass pair in a single pass.
+#
+# The per-region numbers are 2D arrays of shape (n points, n regions),
+# the columns being in the order of SignalGrid.regions.
+#
+
+import numpy as np
+
+class SignalGrid(object) :
+    '''
+    The points of a signal grid, stored as columns
+    '''
+    # per-point columns and their types
+    columns = [ ('mX', np.float64), ('mY', np.float64), ('xsec', np.float64),
+                ('branching_ratio', np.float64), ('filter_efficiency', np.float64),
+                ('n_generated', np.float64) ]
+    # per-point, per-region columns (filled from the "<name>_by_region"
+    # dictionaries of the Signals)
+    region_columns = [ 'n_fiducial', 'n_fiducial_reco' ]
+
+    def __init__(self, dsids, regions) :
+        self.dsid = np.array([str(d) for d in dsids], dtype=np.str_)
+        self.regions = list(regions)
+        self.region_index = dict((reg, i) for i, reg in enumerate(self.regions))
+        n, nreg = len(self.dsid), len(self.regions)
+        for name, dtype in self.columns :
+            setattr(self, name, np.zeros(n, dtype=dtype))
+        for name in self.region_columns :
+            setattr(self, name, np.zeros((n, nreg), dtype=np.float64))
+        self.acceptance = np.zeros((n, nreg), dtype=np.float64)
+        self.efficiency = np.zeros((n, nreg), dtype=np.float64)
+        self._dsid_index = None
+        self._mass_index = None
+
+    def __len__(self) :
+        return len(self.dsid)
+
+    @classmethod
+    def from_signals(cls, signals, regions) :
+        '''
+        Build the grid from a list of Signals (in the same order)
+        '''
+        grid = cls([s.dsid for s in signals], regions)
+        for name, dtype in cls.columns :
+            getattr(grid, name)[:] = [float(getattr(s, name, 0.0)) for s in signals]
+        for name in cls.region_columns :
+            values = getattr(grid, name)
+            for i, s in enumerate(signals) :
+                by_region = getattr(s, name + '_by_region', {})
+                for j, reg in enumerate(grid.regions) :
+                    values[i, j] = float(by_region.get(reg, 0.0))
+        return grid
+
+    def to_arrays(self) :
+        '''
+        The columns of the grid as { name : array }
+        (the 'acc_eff' product of superplotter.results)
+        '''
+        arrays = { 'dsid' : self.dsid, 'regions' : np.array(self.regions, dtype=np.str_) }
+        for name, dtype in self.columns :
+            arrays[name] = getattr(self, name)
+        for name in self.region_columns + ['acceptance', 'efficiency'] :
+            arrays[name] = getattr(self, name)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays) :
+        ''' Rebuild a grid from the output of to_arrays '''
+        grid = cls([str(d) for d in arrays['dsid']], [str(reg) for reg in arrays['regions']])
+        for name, dtype in cls.columns :
+            setattr(grid, name, np.asarray(arrays[name], dtype=dtype))
+        for name in cls.region_columns + ['acceptance', 'efficiency'] :
+            setattr(grid, name, np.asarray(arrays[name], dtype=np.float64))
+        return grid
+
+    ''' -------------------------------------------'''
+    '''  Indices                                   '''
+    ''' -------------------------------------------'''
+    def dsid_index(self) :
+        ''' { dsid : position of the point } '''
+        if self._dsid_index is None :
+            self._dsid_index = dict((d, i) for i, d in enumerate(self.dsid))
+        return self._dsid_index
+
+    def mass_index(self) :
+        '''
+        { (mX, mY) : position of the point }, the last point
+        being kept if several have the same masses
+        '''
+        if self._mass_index is None :
+            self._mass_index = dict(((x, y), i) for i, (x, y) in
+                                    enumerate(zip(self.mX.tolist(), self.mY.tolist())))
+        return self._mass_index
+
+    def find_dsid(self, dsid) :
+        ''' Position of the point with the given dsid, or -1 '''
+        return self.dsid_index().get(str(dsid), -1)
+
+    def find_masses(self, mX, mY) :
+        ''' Position of the point at (mX, mY), or -1 '''
+        return self.mass_index().get((float(mX), float(mY)), -1)
+
+    def match(self, other) :
+        '''
+        For each point of this grid, the position of the point of
+        "other" with the same masses (-1 if there is none)
+        '''
+        index = other.mass_index()
+        return np.array([index.get(key, -1) for key in zip(self.mX.tolist(), self.mY.tolist())],
+                        dtype=np.int64)
+
+    ''' -------------------------------------------'''
+    '''  Acceptance and efficiency                 '''
+    ''' -------------------------------------------'''
+    def calculate_acceptance(self) :
+        '''
+        acceptance = N_fiducial / (N_generated / (BR * filter eff)),
+        for all points and regions (0 for points without generated events)
+        '''
+        with np.errstate(divide='ignore', invalid='ignore') :
+            n_produced = self.n_generated / (self.branching_ratio * self.filter_efficiency)
+        self.acceptance = _safe_divide(self.n_fiducial, n_produced[:, np.newaxis])
+        return self.acceptance
+
+    def calculate_efficiency(self, reco) :
+        '''
+        efficiency = N_fiducial_reco / N_fiducial, N_fiducial_reco being
+        taken from the point of the "reco" grid with the same masses
+        (0 for points without a reco counterpart)
+        '''
+        matched = self.match(reco)
+        has_reco = matched >= 0
+        self.n_fiducial_reco = np.zeros_like(self.n_fiducial)
+        self.n_fiducial_reco[has_reco] = reco.n_fiducial_reco[matched[has_reco]][:, self._columns_of(reco)]
+        self.efficiency = _safe_divide(self.n_fiducial_reco, self.n_fiducial)
+        return self.efficiency
+
+    def calculate_acceptance_and_efficiency(self, reco) :
+        self.calculate_acceptance()
+        self.calculate_efficiency(reco)
+
+    def _columns_of(self, other) :
+        ''' Region columns of "other" in the order of this grid's regions '''
+        missing = [reg for reg in self.regions if reg not in other.region_index]
+        if missing :
+            raise KeyError("SignalGrid error: regions %s are missing from the other grid"%missing)
+        return [other.region_index[reg] for reg in self.regions]
+
+    ''' -------------------------------------------'''
+    '''  Back to the Signals                       '''
+    ''' -------------------------------------------'''
+    def fill_signals(self, signals, region) :
+        '''
+        Set n_fiducial, n_fiducial_reco, acceptance and efficiency of
+        the Signals (in the order of the grid) to their values in
+        the requested region
+        '''
+        j = self.region_index[region]
+        for name in self.region_columns + ['acceptance', 'efficiency'] :
+            values = getattr(self, name)[:, j].tolist()
+            for s, value in zip(signals, values) :
+                setattr(s, name, value)
+
+def _safe_divide(num, den) :
+    ''' num / den, with 0 where den is 0 '''
+    num, den = np.broadcast_arrays(np.asarray(num, dtype=np.float64), np.asarray(den, dtype=np.float64))
+    out = np.zeros(num.shape, dtype=np.float64)
+    ok = (den != 0) & np.isfinite(den)
+    np.divide(num, den, out=out, where=ok)
+    return out
@@ -0,0 +1,339 @@
+#
+# Histograms held as NumPy arrays
+#
+# A Hist1D keeps its bin edges and the sum of weights and sum of
+# squared weights of each bin (including the underflow and overflow
+# bins, at indices 0 and nbins+1 as in ROOT) as arrays, so that
+# filling, adding, dividing and folding the under/overflow are array
+# operations rather than one PyROOT call per event or per bin.
+#
+# Histograms are plain data (see to_dict/from_dict), so they can be
+# sent back from worker processes, stored and merged. They are only
+# turned into ROOT objects (to_th1f, to_tgraph_asym) when drawn.
+#
+
+import numpy as np
+from array import array
+
+from superplotter.profiling import profiled
+from superplotter.selection import SelectionProgram, as_mask, as_weight
+from superplotter.columns import have_root_numpy, iter_chunks, iter_entry_chunks, iter_draw_chunks, ENTRY_NUMBER, DEFAULT_CHUNK_SIZE
+from superplotter.cache import attach_entries
+from superplotter.lazy_root import ROOT as r
+
+class Hist1D(object) :
+    '''
+    1D histogram with arbitrary bin edges
+    '''
+    def __init__(self, edges, name="", title="", xtitle="", ytitle="") :
+        self.edges = np.asarray(edges, dtype=np.float64)
+        if self.edges.ndim != 1 or len(self.edges) < 2 or np.any(np.diff(self.edges) <= 0) :
+            raise ValueError("Hist1D error: bin edges must be increasing (got %s)"%list(edges))
+        self.name = name
+        self.title = title
+        self.xtitle = xtitle
+        self.ytitle = ytitle
+        self.sumw = np.zeros(self.nbins+2, dtype=np.float64)
+        self.sumw2 = np.zeros(self.nbins+2, dtype=np.float64)
+        self.entries = 0
+
+    @classmethod
+    def uniform(cls, nbins, xlow, xhigh, name="", title="", xtitle="", ytitle="") :
+        ''' Histogram with nbins equal bins in [xlow, xhigh) '''
+        return cls(np.linspace(xlow, xhigh, nbins+1), name, title, xtitle, ytitle)
+
+    @property
+    def nbins(self) :
+        return len(self.edges) - 1
+
+    def centers(self) :
+        return 0.5 * (self.edges[1:] + self.edges[:-1])
+
+    def widths(self) :
+        return np.diff(self.edges)
+
+    def contents(self) :
+        ''' Sum of weights of bins 1..nbins '''
+        return self.sumw[1:-1]
+
+    def errors(self) :
+        ''' Statistical uncertainty of bins 1..nbins '''
+        return np.sqrt(self.sumw2[1:-1])
+
+    def integral(self, include_flow=False) :
+        return self.sumw.sum() if include_flow else self.sumw[1:-1].sum()
+
+    def copy(self, name=None) :
+        h = Hist1D(self.edges, self.name if name is None else name, self.title, self.xtitle, self.ytitle)
+        h.sumw[:] = self.sumw
+        h.sumw2[:] = self.sumw2
+        h.entries = self.entries
+        return h
+
+    def reset(self) :
+        self.sumw[:] = 0
+        self.sumw2[:] = 0
+        self.entries = 0
+
+    ''' -------------------------------------------'''
+    '''  Filling and arithmetic                    '''
+    ''' -------------------------------------------'''
+    def find_bins(self, x) :
+        '''
+        Bin index of each value (0 for underflow, nbins+1 for
+        overflow, the upper edge belonging to the overflow as in ROOT)
+        '''
+        return np.searchsorted(self.edges, x, side='right')
+
+    def fill(self, x, w=None) :
+        '''
+        Fill the values "x" with weights "w" (default 1), NaN
+        values being skipped
+        '''
+        x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+        w = np.ones(len(x)) if w is None else np.broadcast_to(np.asarray(w, dtype=np.float64), x.shape)
+        ok = ~np.isnan(x)
+        if not ok.all() : x, w = x[ok], w[ok]
+        bins = self.find_bins(x)
+        n = self.nbins+2
+        self.sumw += np.bincount(bins, weights=w, minlength=n)
+        self.sumw2 += np.bincount(bins, weights=w*w, minlength=n)
+        self.entries += len(x)
+        return self
+
+    def _check_compatible(self, other) :
+        if self.nbins != other.nbins or not np.allclose(self.edges, other.edges) :
+            raise ValueError("Hist1D error: cannot combine '%s' and '%s', their bins differ"%(self.name, other.name))
+
+    def add(self, other, scale=1.0) :
+        ''' Add scale * other to this histogram '''
+        self._check_compatible(other)
+        self.sumw += scale * other.sumw
+        self.sumw2 += scale * scale * other.sumw2
+        self.entries += other.entries
+        return self
+
+    def __iadd__(self, other) :
+        return self.add(other)
+
+    def __add__(self, other) :
+        return self.copy().add(other)
+
+    def scale(self, factor) :
+        self.sumw *= factor
+        self.sumw2 *= factor * factor
+        return self
+
+    def divide(self, other, name=None) :
+        '''
+        New histogram holding this / other bin by bin, with the
+        uncertainties of both (uncorrelated) propagated. Bins where
+        other is empty are set to 0.
+        '''
+        self._check_compatible(other)
+        ratio = Hist1D(self.edges, self.name + "_ratio" if name is None else name,
+                       self.title, self.xtitle, self.ytitle)
+        c1, c2 = self.sumw, other.sumw
+        ok = c2 != 0
+        ratio.sumw[ok] = c1[ok] / c2[ok]
+        ratio.sumw2[ok] = (self.sumw2[ok] * c2[ok]**2 + other.sumw2[ok] * c1[ok]**2) / c2[ok]**4
+        ratio.entries = self.entries
+        return ratio
+
+    def fold_overflow(self, option="both") :
+        '''
+        Move the underflow ("under") and/or overflow ("over") into
+        the first/last bin, as plot_utils.show_under_overflow
+        '''
+        if option=="both" or option=="under" :
+            self.sumw[1] += self.sumw[0]
+            self.sumw2[1] += self.sumw2[0]
+            self.sumw[0] = self.sumw2[0] = 0
+        if option=="both" or option=="over" :
+            n = self.nbins
+            self.sumw[n] += self.sumw[n+1]
+            self.sumw2[n] += self.sumw2[n+1]
+            self.sumw[n+1] = self.sumw2[n+1] = 0
+        return self
+
+    ''' -------------------------------------------'''
+    '''  Serialization                             '''
+    ''' -------------------------------------------'''
+    def to_dict(self) :
+        ''' The histogram as a dictionary of plain values and arrays '''
+        return { 'name' : self.name, 'title' : self.title, 'xtitle' : self.xtitle, 'ytitle' : self.ytitle,
+                 'edges' : self.edges.copy(), 'sumw' : self.sumw.copy(), 'sumw2' : self.sumw2.copy(),
+                 'entries' : self.entries }
+
+    @classmethod
+    def from_dict(cls, d) :
+        h = cls(d['edges'], str(d.get('name', "")), str(d.get('title', "")),
+                str(d.get('xtitle', "")), str(d.get('ytitle', "")))
+        h.sumw[:] = d['sumw']
+        h.sumw2[:] = d['sumw2']
+        h.entries = int(d.get('entries', 0))
+        return h
+
+    @classmethod
+    def merge(cls, hists, name=None) :
+        ''' Sum of a list of compatible histograms '''
+        hists = list(hists)
+        if not hists : raise ValueError("Hist1D error: nothing to merge")
+        total = hists[0].copy(name)
+        for h in hists[1:] :
+            total.add(h)
+        return total
+
+    ''' -------------------------------------------'''
+    '''  Conversion to/from ROOT                   '''
+    ''' -------------------------------------------'''
+    @classmethod
+    def from_th1(cls, th1) :
+        '''
+        Hist1D with the bins, contents and errors of a TH1
+        '''
+        axis = th1.GetXaxis()
+        nbins = th1.GetNbinsX()
+        edges = [axis.GetBinLowEdge(i) for i in xrange(1, nbins+2)]
+        h = cls(edges, th1.GetName(), th1.GetTitle(), axis.GetTitle(), th1.GetYaxis().GetTitle())
+        h.sumw[:] = [th1.GetBinContent(i) for i in xrange(nbins+2)]
+        h.sumw2[:] = [th1.GetBinError(i)**2 for i in xrange(nbins+2)]
+        h.entries = int(th1.GetEntries())
+        return h
+
+    def to_th1f(self, name=None) :
+        '''
+        TH1F with the same bins, contents and errors
+        '''
+        h = r.TH1F(self.name if name is None else name, self.title, self.nbins, array('d', self.edges))
+        h.GetXaxis().SetTitle(self.xtitle)
+        h.GetYaxis().SetTitle(self.ytitle)
+        h.Sumw2()
+        h.SetContent(array('d', self.sumw))
+        h.SetError(array('d', np.sqrt(self.sumw2)))
+        h.SetEntries(self.entries)
+        return h
+
+    def to_tgraph_asym(self) :
+        '''
+        TGraphAsymmErrors with a point at the center of each bin,
+        styled as plot_utils.th1_to_tgraph_asym
+        '''
+        n = self.nbins
+        ex = array('d', self.widths() / 2.0)
+        ey = array('d', self.errors())
+        g = r.TGraphAsymmErrors(n, array('d', self.centers()), array('d', self.contents()), ex, ex, ey, ey)
+        g.SetMarkerSize(0)
+        g.SetFillStyle(3004)
+        g.SetFillColor(r.kBlack)
+        return g
+
+def _column_chunks(tree, selection, expressions, weights, entries, chunk_size) :
+    '''
+    Evaluate the selection, expressions and weights on the leaves of the
+    tree read with root_numpy, sharing their common terms. Yields, for
+    each chunk, (entry numbers, selection mask, { key : values }). If
+    the selected "entries" are given only those are read, the selection
+    is not evaluated and the entry numbers are None.
+    '''
+    program = SelectionProgram()
+    sel_key = ('selection',) # cannot clash with the other keys
+    if entries is None : program.add(sel_key, selection)
+    keys = []
+    for ekey, (expression, template) in expressions.items() :
+        program.add(('expression', ekey), expression)
+        keys.append(('expression', ekey))
+    for wkey, weight in weights.items() :
+        program.add(('weight', wkey), weight)
+        keys.append(('weight', wkey))
+    if entries is None :
+        chunks = iter_chunks(tree, program.variables(), chunk_size)
+    else :
+        chunks = iter_entry_chunks(tree, program.variables(), entries, chunk_size)
+    start = 0
+    for n, columns in chunks :
+        values = program.evaluate(columns)
+        if entries is None :
+            rows, mask = np.arange(start, start+n), as_mask(values[sel_key], n)
+            start += n
+        else :
+            rows, mask = None, np.ones(n, dtype=bool)
+        yield rows, mask, dict((key, as_weight(values[key], n)) for key in keys)
+
+def _draw_chunks(tree, selection, expressions, weights, entries, chunk_size, source) :
+    '''
+    As _column_chunks, without root_numpy: the selection, expressions
+    and weights are drawn together with one TTree::Draw per chunk of
+    entries (columns.iter_draw_chunks). If the selected "entries" are
+    given the tree is restricted to them while it is read.
+    '''
+    keys = [('expression', ekey) for ekey in expressions] + [('weight', wkey) for wkey in weights]
+    draw = [expressions[ekey][0] for ekey in expressions] + [weights[wkey] for wkey in weights]
+    if entries is None : draw += [selection, ENTRY_NUMBER]
+    else : attach_entries(tree, source, entries)
+    try :
+        for values in iter_draw_chunks(tree, draw, chunk_size) :
+            if entries is None :
+                rows, mask = values[-1].astype(np.int64), values[-2] != 0
+            else :
+                rows, mask = None, np.ones(len(values[0]), dtype=bool)
+            yield rows, mask, dict(zip(keys, values))
+    finally :
+        if entries is not None : tree.SetEntryList(0)
+
+@profiled("fill histograms")
+def fill_histogram_set_from_tree(tree, selection, expressions, weights, chunk_size=DEFAULT_CHUNK_SIZE,
+                                 cache=None, source=None) :
+    '''
+    Fill, in a single pass over the tree, one histogram per pair of
+    expression and weight for the events passing "selection".
+    "expressions" is { key : (expression, template Hist1D) }, the
+    template giving the binning and titles, and "weights" is
+    { key : weight expression }. The selection, expressions and
+    weights are read together: as arrays of leaves with root_numpy,
+    otherwise with one TTree::Draw per chunk of entries.
+
+    If an EntryListCache (superplotter.cache) is given, along with the
+    file the tree is read from, the entries passing "selection" are
+    taken from it: the selection is then skipped and only those entries
+    are read. Otherwise they are stored after the pass.
+
+    Returns { (expression key, weight key) : Hist1D }
+    '''
+    use_cache = cache is not None and source is not None
+    cut = selection if str(selection).strip() else "1"
+    entries = cache.get(source, tree.GetName(), cut) if use_cache else None
+    hists = {}
+    for ekey, (expression, template) in expressions.items() :
+        for wkey in weights :
+            hists[(ekey, wkey)] = template.copy(str(wkey))
+    if have_root_numpy() :
+        chunks = _column_chunks(tree, cut, expressions, weights, entries, chunk_size)
+    else :
+        chunks = _draw_chunks(tree, cut, expressions, weights, entries, chunk_size, source)
+    selected = []
+    for rows, mask, values in chunks :
+        if use_cache and entries is None : selected.append(rows[mask])
+        w = {}
+        for wkey in weights :
+            w_pass = values[('weight', wkey)][mask]
+            w[wkey] = (w_pass != 0, w_pass) # as TTree::Draw, which skips entries of zero weight
+        for ekey in expressions :
+            x = values[('expression', ekey)][mask]
+            for wkey, (filled, w_pass) in w.items() :
+                hists[(ekey, wkey)].fill(x[filled], w_pass[filled])
+    if use_cache and entries is None :
+        cache.put(source, tree.GetName(), cut, np.concatenate(selected) if selected else np.zeros(0, dtype=np.int64))
+    return hists
+
+def fill_histograms_from_tree(tree, expression, selection, weights, template, chunk_size=DEFAULT_CHUNK_SIZE) :
+    '''
+    Fill, in a single pass over the tree, one histogram of the
+    expression "expression" per weight in { key : weight expression },
+    for the events passing "selection". "template" is an (empty)
+    Hist1D giving the binning and titles.
+
+    Returns { key : Hist1D }
+    '''
+    hists = fill_histogram_set_from_tree(tree, selection, { 'x' : (expression, template) }, weights, chunk_size)
+    return dict((wkey, h) for (ekey, wkey), h in hists.items())
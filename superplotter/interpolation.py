@@ -0,0 +1,317 @@
+#
+# Interpolation of the (mX, mY) mass plane
+#
+# Drawing a TGraph2D makes ROOT compute the Delaunay triangulation of
+# its points, and the maps of a grid (acceptance, efficiency, number
+# of generated events, cross-section, systematics, ... of each region)
+# all share the same points. Here the points of a grid are triangulated
+# once (Bowyer-Watson) and, for a given TH2 binning, the triangle and
+# barycentric weights of each bin centre are computed once as well.
+# Interpolating any z values of the points is then a weighted sum,
+# giving the bin contents of the TH2 as an array directly.
+#
+# The triangulation and the weights of each grid and binning are kept
+# in memory and on disk, in $SUPERPLOTTER_CACHE_DIR/interpolation
+# (~/.superplotter_cache/interpolation), keyed by the point coordinates
+# and the binning, so that the next runs do not triangulate either.
+#
+# As in ROOT (TGraphDelaunay), the coordinates are scaled to the unit
+# square before the triangulation, and the bins outside of the convex
+# hull of the points are left empty.
+#
+
+import os
+import hashlib
+import numpy as np
+
+from superplotter.lazy_root import ROOT as r
+from superplotter.utils import cache_base_dir, atomic_write
+from superplotter.profiling import stage
+
+# tolerance on the barycentric coordinates of the bin centres, so that
+# the centres lying on an edge of the hull are still interpolated
+_EDGE_TOLERANCE = 1e-10
+# size of the super-triangle enclosing the (unit square) points
+_SUPER_SIZE = 1e3
+
+''' -------------------------------------------'''
+'''  Triangulation                             '''
+''' -------------------------------------------'''
+def unique_points(x, y) :
+    '''
+    Positions of the distinct (x, y) points, the first
+    of several points at the same place being kept
+    '''
+    seen = {}
+    for i, xy in enumerate(zip(np.asarray(x).tolist(), np.asarray(y).tolist())) :
+        if xy not in seen : seen[xy] = i
+    return np.array(sorted(seen.values()), dtype=np.int64)
+
+def _normalize(x, y, x_ref, y_ref) :
+    ''' x and y scaled such that the reference points span the unit square '''
+    x_ref, y_ref = np.asarray(x_ref, dtype=np.float64), np.asarray(y_ref, dtype=np.float64)
+    x_range = (x_ref.max() - x_ref.min()) or 1.0
+    y_range = (y_ref.max() - y_ref.min()) or 1.0
+    return ((np.asarray(x, dtype=np.float64) - x_ref.min()) / x_range,
+            (np.asarray(y, dtype=np.float64) - y_ref.min()) / y_range)
+
+def _circumcircle(px, py, a, b, c) :
+    ''' (centre x, centre y, squared radius) of the triangle a, b, c '''
+    ax, ay, bx, by, cx, cy = px[a], py[a], px[b], py[b], px[c], py[c]
+    d = 2.0 * (ax * (by - cy) + bx * (cy - ay) + cx * (ay - by))
+    if d == 0.0 : return (0.0, 0.0, np.inf)
+    a2, b2, c2 = ax * ax + ay * ay, bx * bx + by * by, cx * cx + cy * cy
+    ux = (a2 * (by - cy) + b2 * (cy - ay) + c2 * (ay - by)) / d
+    uy = (a2 * (cx - bx) + b2 * (ax - cx) + c2 * (bx - ax)) / d
+    return (ux, uy, (ax - ux) ** 2 + (ay - uy) ** 2)
+
+class _Triangles(object) :
+    '''
+    The triangles of a triangulation being built and their circumcircles,
+    as arrays (the removed triangles are only marked dead, and dropped
+    once they are the majority)
+    '''
+    def __init__(self, px, py, capacity) :
+        self.px, self.py = px, py
+        self.vertices = np.zeros((capacity, 3), dtype=np.int64)
+        self.circles = np.zeros((capacity, 3), dtype=np.float64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.n = 0
+
+    def add(self, a, b, c) :
+        if self.n == len(self.alive) : self._compact(grow=True)
+        self.vertices[self.n] = (a, b, c)
+        self.circles[self.n] = _circumcircle(self.px, self.py, a, b, c)
+        self.alive[self.n] = True
+        self.n += 1
+
+    def holding(self, x, y) :
+        ''' The triangles whose circumcircle holds (x, y) '''
+        circles = self.circles[:self.n]
+        d2 = (circles[:, 0] - x) ** 2 + (circles[:, 1] - y) ** 2
+        return np.flatnonzero(self.alive[:self.n] & (d2 < circles[:, 2] * (1.0 - 1e-12)))
+
+    def remove(self, triangles) :
+        self.alive[triangles] = False
+        if 2 * np.count_nonzero(self.alive[:self.n]) < self.n : self._compact()
+
+    def _compact(self, grow=False) :
+        keep = np.flatnonzero(self.alive[:self.n])
+        capacity = 2 * len(self.alive) if grow else len(self.alive)
+        vertices, circles = self.vertices[keep], self.circles[keep]
+        self.vertices = np.zeros((capacity, 3), dtype=np.int64)
+        self.circles = np.zeros((capacity, 3), dtype=np.float64)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.n = len(keep)
+        self.vertices[:self.n], self.circles[:self.n], self.alive[:self.n] = vertices, circles, True
+
+    def live(self) :
+        return self.vertices[:self.n][self.alive[:self.n]]
+
+def delaunay(x, y) :
+    '''
+    Delaunay triangulation of the points (Bowyer-Watson), as an
+    (n triangles, 3) array of point positions, counter-clockwise.
+    Points at the same place as an earlier one are not used.
+    '''
+    keep = unique_points(x, y)
+    if len(keep) < 3 : return np.zeros((0, 3), dtype=np.int64)
+    nx, ny = _normalize(np.asarray(x)[keep], np.asarray(y)[keep], np.asarray(x)[keep], np.asarray(y)[keep])
+    n = len(keep)
+    # the points followed by the vertices of a triangle enclosing all of them
+    px = np.concatenate([nx, [-_SUPER_SIZE, _SUPER_SIZE, 0.5]])
+    py = np.concatenate([ny, [-_SUPER_SIZE, -_SUPER_SIZE, _SUPER_SIZE]])
+    triangles = _Triangles(px, py, 4 * n + 16)
+    triangles.add(n, n + 1, n + 2)
+    for i in xrange(n) :
+        bad = triangles.holding(px[i], py[i])
+        # the boundary of the cavity: the edges of a single bad triangle
+        edges = {}
+        for a, b, c in triangles.vertices[bad].tolist() :
+            for edge in [ (a, b), (b, c), (c, a) ] :
+                key = (min(edge), max(edge))
+                if key in edges : edges[key] = None
+                else : edges[key] = edge
+        triangles.remove(bad)
+        for edge in edges.values() :
+            if edge is not None : triangles.add(edge[0], edge[1], i)
+    triangles = triangles.live()
+    triangles = triangles[triangles.max(axis=1) < n]
+    # counter-clockwise orientation
+    a, b, c = triangles[:, 0], triangles[:, 1], triangles[:, 2]
+    cross = (px[b] - px[a]) * (py[c] - py[a]) - (py[b] - py[a]) * (px[c] - px[a])
+    triangles[cross < 0] = triangles[cross < 0][:, [0, 2, 1]]
+    return keep[triangles]
+
+''' -------------------------------------------'''
+'''  Bin weights                               '''
+''' -------------------------------------------'''
+def bin_centres(binning) :
+    '''
+    The centres (x, y) of the bins of a TH2 binning
+    (nx, xlow, xhigh, ny, ylow, yhigh)
+    '''
+    nx, xlow, xhigh, ny, ylow, yhigh = binning
+    x_edges = np.linspace(xlow, xhigh, int(nx) + 1)
+    y_edges = np.linspace(ylow, yhigh, int(ny) + 1)
+    return 0.5 * (x_edges[:-1] + x_edges[1:]), 0.5 * (y_edges[:-1] + y_edges[1:])
+
+def bin_weights(x, y, triangles, binning) :
+    '''
+    For each bin (ny, nx) of the binning, the points of the triangle
+    holding its centre and their barycentric weights, as arrays
+    (ny, nx, 3), and whether the centre is in a triangle at all (ny, nx).
+    Only the bins in the bounding box of each triangle are looked at.
+    '''
+    xc, yc = bin_centres(binning)
+    nx, ny = len(xc), len(yc)
+    # compute in the coordinates of the triangulation
+    xs, ys = _normalize(x, y, x, y)
+    xc_n, yc_n = _normalize(xc, yc, x, y)
+    vertices = np.zeros((ny, nx, 3), dtype=np.int64)
+    weights = np.zeros((ny, nx, 3), dtype=np.float64)
+    inside = np.zeros((ny, nx), dtype=bool)
+    for a, b, c in triangles.tolist() :
+        xa, ya, xb, yb, x_c, y_c = xs[a], ys[a], xs[b], ys[b], xs[c], ys[c]
+        ix0, ix1 = np.searchsorted(xc_n, min(xa, xb, x_c) - _EDGE_TOLERANCE), np.searchsorted(xc_n, max(xa, xb, x_c) + _EDGE_TOLERANCE)
+        iy0, iy1 = np.searchsorted(yc_n, min(ya, yb, y_c) - _EDGE_TOLERANCE), np.searchsorted(yc_n, max(ya, yb, y_c) + _EDGE_TOLERANCE)
+        if ix0 >= ix1 or iy0 >= iy1 : continue
+        det = (yb - y_c) * (xa - x_c) + (x_c - xb) * (ya - y_c)
+        if det == 0.0 : continue
+        px, py = np.meshgrid(xc_n[ix0:ix1], yc_n[iy0:iy1])
+        l1 = ((yb - y_c) * (px - x_c) + (x_c - xb) * (py - y_c)) / det
+        l2 = ((y_c - ya) * (px - x_c) + (xa - x_c) * (py - y_c)) / det
+        l3 = 1.0 - l1 - l2
+        hit = (l1 >= -_EDGE_TOLERANCE) & (l2 >= -_EDGE_TOLERANCE) & (l3 >= -_EDGE_TOLERANCE)
+        # the bins on a shared edge keep their first triangle
+        hit &= ~inside[iy0:iy1, ix0:ix1]
+        if not hit.any() : continue
+        iy, ix = np.nonzero(hit)
+        iy, ix = iy + iy0, ix + ix0
+        vertices[iy, ix] = (a, b, c)
+        weights[iy, ix, 0] = l1[hit]
+        weights[iy, ix, 1] = l2[hit]
+        weights[iy, ix, 2] = l3[hit]
+        inside[iy, ix] = True
+    return vertices, weights, inside
+
+''' -------------------------------------------'''
+'''  Interpolator                              '''
+''' -------------------------------------------'''
+class MassPlaneInterpolator(object) :
+    '''
+    The triangulation of the points (x, y) of a grid and the weights
+    of the bins of a TH2 binning (nx, xlow, xhigh, ny, ylow, yhigh),
+    interpolating any z values given at the points
+    '''
+    def __init__(self, x, y, binning, triangles, vertices, weights, inside) :
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.binning = tuple(binning)
+        self.triangles = triangles
+        self.vertices = vertices
+        self.weights = weights
+        self.inside = inside
+
+    @classmethod
+    def build(cls, x, y, binning) :
+        ''' Triangulate the points and compute the weights of the bins '''
+        with stage("triangulation") :
+            triangles = delaunay(x, y)
+            vertices, weights, inside = bin_weights(x, y, triangles, binning)
+        return cls(x, y, binning, triangles, vertices, weights, inside)
+
+    def to_arrays(self) :
+        return { 'x' : self.x, 'y' : self.y, 'binning' : np.array(self.binning, dtype=np.float64),
+                 'triangles' : self.triangles, 'vertices' : self.vertices, 'weights' : self.weights,
+                 'inside' : self.inside }
+
+    @classmethod
+    def from_arrays(cls, arrays) :
+        nx, xlow, xhigh, ny, ylow, yhigh = arrays['binning'].tolist()
+        return cls(arrays['x'], arrays['y'], (int(nx), xlow, xhigh, int(ny), ylow, yhigh), arrays['triangles'],
+                   arrays['vertices'], arrays['weights'], arrays['inside'])
+
+    def interpolate(self, z) :
+        '''
+        The bin contents (ny, nx) interpolated from the values z of the
+        points, NaN outside of the hull of the points. Several sets of
+        values can be given at once, as z (points, n): (n, ny, nx).
+        '''
+        z = np.asarray(z, dtype=np.float64)
+        if len(z) != len(self.x) :
+            raise ValueError("MassPlaneInterpolator error: %d values for %d points"%(len(z), len(self.x)))
+        with stage("interpolation") :
+            if z.ndim == 1 :
+                values = (z[self.vertices] * self.weights).sum(axis=-1)
+                values[~self.inside] = np.nan
+                return values
+            values = (z[self.vertices] * self.weights[..., np.newaxis]).sum(axis=-2)
+            values[~self.inside] = np.nan
+            return np.rollaxis(values, -1)
+
+    def th2(self, name, title, z) :
+        '''
+        A TH2F with the binning, filled with the values interpolated
+        from z (the bins outside of the hull are left empty)
+        '''
+        nx, xlow, xhigh, ny, ylow, yhigh = self.binning
+        h = r.TH2F(name, title, int(nx), xlow, xhigh, int(ny), ylow, yhigh)
+        values = self.interpolate(z)
+        for iy, ix in zip(*np.nonzero(self.inside)) :
+            h.SetBinContent(int(ix) + 1, int(iy) + 1, float(values[iy, ix]))
+        return h
+
+''' -------------------------------------------'''
+'''  Cache                                     '''
+''' -------------------------------------------'''
+def default_cache_dir() :
+    return os.path.join(cache_base_dir(), 'interpolation')
+
+def interpolation_key(x, y, binning) :
+    ''' Hash of the point coordinates and of the binning '''
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(x, dtype=np.float64).tostring())
+    h.update(np.ascontiguousarray(y, dtype=np.float64).tostring())
+    h.update(repr(tuple(float(v) for v in binning)))
+    return h.hexdigest()
+
+class InterpolationCache :
+    '''
+    Store of the MassPlaneInterpolators of the grids, in memory
+    and (unless persistent is False) on disk
+    '''
+    def __init__(self, cache_dir=None, persistent=True, dbg=False) :
+        self.cache_dir = cache_dir if cache_dir else default_cache_dir()
+        self.persistent = persistent
+        self.dbg = dbg
+        self._interpolators = {}
+        if self.persistent and not os.path.isdir(self.cache_dir) : os.makedirs(self.cache_dir)
+
+    def path(self, grid, key) :
+        return os.path.join(self.cache_dir, "%s_%s.npz"%(grid, key))
+
+    def get(self, grid, x, y, binning) :
+        '''
+        The MassPlaneInterpolator of the points (x, y) of "grid"
+        for the binning, only triangulating them if they are not
+        in the cache yet
+        '''
+        key = interpolation_key(x, y, binning)
+        if key in self._interpolators : return self._interpolators[key]
+        path = self.path(grid, key)
+        if self.persistent and os.path.isfile(path) :
+            data = np.load(path)
+            interpolator = MassPlaneInterpolator.from_arrays(dict((name, data[name]) for name in data.files))
+            data.close()
+            if self.dbg : print "InterpolationCache    hit  %s (%d triangles)"%(path, len(interpolator.triangles))
+        else :
+            interpolator = MassPlaneInterpolator.build(x, y, binning)
+            if self.persistent : self.put(path, interpolator)
+        self._interpolators[key] = interpolator
+        return interpolator
+
+    def put(self, path, interpolator) :
+        with atomic_write(path) as f :
+            np.savez_compressed(f, **interpolator.to_arrays())
+        if self.dbg : print "InterpolationCache    put  %s (%d triangles)"%(path, len(interpolator.triangles))
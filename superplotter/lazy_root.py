@@ -0,0 +1,71 @@
+#
+# Lazily imported ROOT
+#
+# Importing ROOT takes seconds, which the tools that only deal with
+# text (systabler, metadata queries, cutflows from bitmask sidecars)
+# should not pay. The superplotter modules therefore use
+#
+#     from superplotter.lazy_root import ROOT as r
+#
+# which gives a stand-in for the ROOT module: ROOT itself is only
+# imported the first time one of its attributes is used (r.TH1F,
+# r.gROOT, ...), i.e. on the first call of a ROOT-backed function.
+#
+# Set-up that used to be done when a module was imported (e.g. the
+# object ownership settings of plot_utils) is registered with
+# on_load and run once ROOT is actually imported.
+#
+
+_module = None
+_hooks = []
+# batch mode requested before ROOT was loaded (None: left as is)
+_batch = None
+
+def loaded() :
+    ''' Whether ROOT has been imported yet '''
+    return _module is not None
+
+def _load() :
+    global _module
+    if _module is None :
+        import ROOT
+        # the scripts parse their own command line
+        ROOT.PyConfig.IgnoreCommandLineOptions = True
+        _module = ROOT
+        if _batch is not None : ROOT.gROOT.SetBatch(_batch)
+        for hook in _hooks :
+            hook(ROOT)
+    return _module
+
+def on_load(hook) :
+    '''
+    Call hook(ROOT) once ROOT is imported (right away if it already is)
+    '''
+    if _module is not None :
+        hook(_module)
+    else :
+        _hooks.append(hook)
+
+def set_batch(batch=True) :
+    '''
+    Put ROOT in batch mode, when it gets loaded if it is not yet
+    '''
+    global _batch
+    _batch = batch
+    if _module is not None : _module.gROOT.SetBatch(batch)
+
+class _LazyROOT(object) :
+    '''
+    Stand-in for the ROOT module, importing it on first use
+    '''
+    def __getattr__(self, name) :
+        return getattr(_load(), name)
+
+    def __setattr__(self, name, value) :
+        setattr(_load(), name, value)
+
+    def __repr__(self) :
+        if _module is None : return "<ROOT (not loaded yet)>"
+        return repr(_module)
+
+ROOT = _LazyROOT()
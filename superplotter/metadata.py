@@ -0,0 +1,141 @@
+#
+# Index of the signal-point metadata (masses, cross-sections and
+# numbers of generated events) keyed by dsid
+#
+# Each metadata text file is parsed once into a { dsid : record }
+# dictionary, which is kept in memory for the rest of the process
+# and pickled to disk so that later runs (and worker processes) do
+# not parse it again. A pickled index is only used as long as the
+# size and mtime of its text file are unchanged. get_index checks
+# this once per process: later lookups return the index directly.
+#
+# The pickled indices are in $SUPERPLOTTER_CACHE_DIR/metadata
+# (default ~/.superplotter_cache/metadata)
+#
+
+import os
+import hashlib
+
+from superplotter.profiling import profiled
+from superplotter.utils import cache_base_dir, file_stamp, load_stamped_pickle, store_stamped_pickle
+
+# the metadata files of each grid
+metadata_files = {
+    'SMCwslep' : {
+        'mass' : '/gdata/atlas/dantrim/SusyAna/Super/SusyXSReader/data/modeC_lightslep_MC1eqMN2_DiagonalMatrix.txt',
+        'xsec' : '/gdata/atlas/dantrim/SusyAna/Super/SUSYTools/data/mc12_8TeV/Herwigpp_UEEE3_CTEQ6L1_simplifiedModel_wC.txt',
+        'ngen' : 'info/SMCwslep_modelNgen.txt',
+    },
+}
+
+''' -------------------------------------------'''
+'''  Parsers of the metadata files             '''
+''' -------------------------------------------'''
+def parse_mass_table(txtfile) :
+    '''
+    { dsid : (mX, mY) } from a SusyXSReader mass table
+    '''
+    lines = open(txtfile).readlines()
+    fields = lines[0].split()
+    dsIdx = fields.index('DS')
+    mc1Idx = fields.index('MC1,MN2[GeV]')
+    mn1Idx = fields.index('MN1[GeV]')
+    index = {}
+    for line in lines[1:] :
+        line = line.strip()
+        if not line : continue
+        fields = line.split()
+        try :
+            index[fields[dsIdx]] = (float(fields[mc1Idx]), float(fields[mn1Idx]))
+        except (IndexError, ValueError) :
+            continue
+    return index
+
+def parse_xsec_table(txtfile) :
+    '''
+    { dsid : (xsec, branching ratio, filter efficiency) } from a
+    SUSYTools cross-section file
+    '''
+    index = {}
+    for line in open(txtfile).readlines()[5:] :
+        line = line.strip()
+        if not line : continue
+        fields = line.split()
+        try :
+            index[fields[0]] = (float(fields[2]), float(fields[3]), float(fields[4]))
+        except (IndexError, ValueError) :
+            continue
+    return index
+
+def parse_ngen_table(txtfile) :
+    '''
+    { dsid : number of generated events }
+    '''
+    index = {}
+    for line in open(txtfile).readlines() :
+        line = line.strip()
+        if not line : continue
+        fields = line.split()
+        # skip the header and comment lines
+        try :
+            index[fields[0]] = float(fields[1])
+        except (IndexError, ValueError) :
+            continue
+    return index
+
+parsers = {
+    'mass' : parse_mass_table,
+    'xsec' : parse_xsec_table,
+    'ngen' : parse_ngen_table,
+}
+
+''' -------------------------------------------'''
+'''  Cached indices                            '''
+''' -------------------------------------------'''
+# in-process indices { (kind, path) : (stamp, index) }
+_indices = {}
+# indices already checked by get_index { (kind, metadata file) : index }
+_checked = {}
+
+def default_cache_dir() :
+    return os.path.join(cache_base_dir(), 'metadata')
+
+def _pickle_path(kind, path) :
+    return os.path.join(default_cache_dir(), "%s_%s.pkl"%(kind, hashlib.sha1(path).hexdigest()))
+
+@profiled("metadata")
+def load_index(kind, txtfile) :
+    '''
+    The { dsid : record } index of a metadata file of the given
+    kind ('mass', 'xsec' or 'ngen'), parsing the file only if
+    neither the in-process nor the on-disk index is current
+    '''
+    if kind not in parsers :
+        raise KeyError("load_index error: unknown metadata kind '%s'"%kind)
+    path = os.path.realpath(txtfile)
+    stamp = file_stamp(path)
+    key = (kind, path)
+    if key in _indices and _indices[key][0] == stamp :
+        return _indices[key][1]
+    pickle_path = _pickle_path(kind, path)
+    index = load_stamped_pickle(pickle_path, stamp)
+    if index is None :
+        index = parsers[kind](path)
+        store_stamped_pickle(pickle_path, stamp, index)
+    _indices[key] = (stamp, index)
+    return index
+
+def get_index(grid, kind) :
+    '''
+    The { dsid : record } index of the metadata of the given kind
+    for a grid, or None if the grid is not supported
+    '''
+    if grid not in metadata_files : return None
+    key = (kind, metadata_files[grid][kind])
+    if key not in _checked : _checked[key] = load_index(*key)
+    return _checked[key]
+
+def clear_indices() :
+    ''' Forget the in-process indices (the pickled ones are kept) '''
+    _indices.clear()
+    _checked.clear()
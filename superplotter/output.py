@@ -0,0 +1,137 @@
+#
+# Management of the output files (plots) of the scripts
+#
+# The output directories are created once, in-process, and the plots
+# are saved directly to their final path: each file is first written
+# under a temporary name next to its destination and then renamed,
+# so that a directory never holds partially written plots and no
+# shell has to be spawned to move them.
+#
+# With background=True the plots are instead written to a local
+# staging directory and handed to a writer thread that moves them
+# to their destination, so that a slow (e.g. network) output
+# directory does not hold up the drawing. Call close() (or use the
+# OutputManager in a "with" block) to wait for the pending files.
+#
+
+import os
+import shutil
+import tempfile
+import threading
+import Queue
+
+from superplotter.profiling import stage
+
+# directories known to exist, so that each is only checked once
+_made_dirs = set()
+
+def ensure_dir(outdir, dbg=False) :
+    '''
+    Create the directory "outdir" (and its parents) if needed,
+    only looking at the filesystem the first time it is asked for
+    '''
+    if not outdir or outdir in _made_dirs : return
+    if not os.path.isdir(outdir) :
+        if dbg : print "Making directory %s"%outdir
+        try :
+            os.makedirs(outdir)
+        except OSError :
+            # made in the meantime, e.g. by another worker
+            if not os.path.isdir(outdir) : raise
+    _made_dirs.add(outdir)
+
+class OutputManager(object) :
+    '''
+    Saves canvases (or any object with a SaveAs method) to "outdir"
+    '''
+    def __init__(self, outdir="", background=False, dbg=False) :
+        self.outdir = str(outdir) if outdir else ""
+        self.background = background
+        self.dbg = dbg
+        self.saved = []
+        self._queue = None
+        self._thread = None
+        self._staging = None
+        self._errors = []
+        ensure_dir(self.outdir, dbg)
+
+    def __enter__(self) :
+        return self
+
+    def __exit__(self, *exc) :
+        self.close()
+        return False
+
+    def path(self, name) :
+        '''
+        The final path of the output file "name" (which may
+        contain sub-directories of outdir, made if needed)
+        '''
+        path = os.path.join(self.outdir, name) if self.outdir else name
+        ensure_dir(os.path.dirname(path), self.dbg)
+        return path
+
+    def save(self, canvas, outname, formats=None) :
+        '''
+        Save the canvas as "outname.<format>" for each of the formats
+        ("outname" as is if formats is None). Returns the final paths.
+        '''
+        names = [outname] if formats is None else ["%s.%s"%(outname, fmt) for fmt in formats]
+        paths = []
+        for name in names :
+            final = self.path(name)
+            with stage("save") :
+                if self.background :
+                    staged = self._stage(name)
+                    canvas.SaveAs(staged)
+                    self._queue.put((staged, final))
+                else :
+                    # keep the extension: SaveAs picks the format from it
+                    head, tail = os.path.split(final)
+                    tmp = os.path.join(head, ".%d.tmp.%s"%(os.getpid(), tail))
+                    canvas.SaveAs(tmp)
+                    os.rename(tmp, final)
+            if self.dbg : print "OutputManager    %s"%final
+            paths.append(final)
+        self.saved.extend(paths)
+        return paths
+
+    def close(self) :
+        '''
+        Wait for the background writer to move all pending files
+        '''
+        if self._thread is None : return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        shutil.rmtree(self._staging, ignore_errors=True)
+        self._staging = None
+        if self._errors :
+            errors, self._errors = self._errors, []
+            raise IOError("OutputManager error: could not write %s"%", ".join(errors))
+
+    ''' -------------------------------------------'''
+    '''  Background writer                         '''
+    ''' -------------------------------------------'''
+    def _stage(self, name) :
+        if self._thread is None :
+            self._staging = tempfile.mkdtemp(prefix="superplotter_out_")
+            self._queue = Queue.Queue()
+            self._thread = threading.Thread(target=self._write_files)
+            self._thread.daemon = True
+            self._thread.start()
+        # staged names must be unique, name may hold sub-directories
+        return os.path.join(self._staging, "%d_%s"%(len(self.saved), name.replace(os.sep, "_")))
+
+    def _write_files(self) :
+        while True :
+            item = self._queue.get()
+            if item is None : return
+            staged, final = item
+            try :
+                head, tail = os.path.split(final)
+                tmp = os.path.join(head, ".%d.tmp.%s"%(os.getpid(), tail))
+                shutil.move(staged, tmp)
+                os.rename(tmp, final)
+            except (IOError, OSError) :
+                self._errors.append(final)
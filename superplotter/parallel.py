@@ -0,0 +1,54 @@
+#
+# Run independent jobs (e.g. one per signal point) in a pool
+# of worker processes
+#
+
+import multiprocessing
+
+from superplotter import profiling
+
+# effectively no timeout, but waiting with one keeps the parent
+# responsive to Ctrl-C (a plain Pool.map is not, in python 2)
+_WAIT_TIMEOUT = 60*60*24*7
+
+def _profiled_job(task) :
+    '''
+    Run one job in a worker and send its timing records back with the
+    result (the worker starts from a copy of the parent's records)
+    '''
+    func, job = task
+    profiling.reset()
+    result = func(job)
+    return result, profiling.take_records()
+
+def run_jobs(func, jobs, n_jobs=1) :
+    '''
+    Apply "func" to each of the "jobs" using n_jobs worker
+    processes (in this process if n_jobs <= 1) and return the
+    results in the same order as "jobs". If profiling is enabled
+    (superplotter.profiling) the timings of the workers are merged
+    into those of this process.
+
+    "func" must be a module-level function and the jobs and their
+    results must be picklable (plain numbers, strings, lists, dicts...).
+    '''
+    jobs = list(jobs)
+    if n_jobs <= 1 or len(jobs) <= 1 :
+        return [func(job) for job in jobs]
+    profile = profiling.enabled()
+    if profile :
+        func, jobs = _profiled_job, [(func, job) for job in jobs]
+    pool = multiprocessing.Pool(processes=min(n_jobs, len(jobs)))
+    try :
+        results = pool.map_async(func, jobs, chunksize=1).get(_WAIT_TIMEOUT)
+        pool.close()
+    except :
+        pool.terminate()
+        raise
+    finally :
+        pool.join()
+    if profile :
+        for result, timings in results :
+            profiling.merge(timings)
+        results = [result for result, timings in results]
+    return results
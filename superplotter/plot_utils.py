@@ -1,12 +1,16 @@
-import ROOT as r
 import math
 from array import array
 
-r.TH1F.__init__._creates = False
-r.TH2F.__init__._creates = False
-r.TCanvas.__init__._creates = False
-r.TPad.__init__._creates = False
-r.TLine.__init__._creates = False
+from superplotter.lazy_root import ROOT as r, on_load
+
+def _disown_new_objects(root) :
+    ''' python does not take ownership of the objects these make (set when ROOT is loaded) '''
+    root.TH1F.__init__._creates = False
+    root.TH2F.__init__._creates = False
+    root.TCanvas.__init__._creates = False
+    root.TPad.__init__._creates = False
+    root.TLine.__init__._creates = False
+on_load(_disown_new_objects)
 
 
 
@@ -145,15 +149,11 @@ def th1_to_tgraph_asym(hist) :
     g.SetFillColor(r.kBlack)
     return g
 
-def divide_histograms(h1, h2, xtitle, ytitle) :
+def style_ratio_histogram(h3, xtitle, ytitle) :
     '''
-    Provide two histograms and divide h1/h2.
-    Converts final result into tgraph.
+    Set the axis titles and sizes of a histogram drawn
+    in the lower pad of a RatioCanvas
     '''
-    nbins = h1.GetNbinsX()
-    xlow = h1.GetBinCenter(1)
-    xhigh = h1.GetBinCenter(nbins+1)
-    h3 = h1.Clone("ratio")
     h3.GetYaxis().SetTitle(ytitle)
     h3.GetXaxis().SetTitle(xtitle)
 
@@ -166,6 +166,18 @@ def divide_histograms(h1, h2, xtitle, ytitle) :
     h3.GetXaxis().SetLabelSize(3*h3.GetXaxis().GetLabelSize())
     h3.GetXaxis().SetTitleSize(0.15)
     h3.GetXaxis().SetTitleFont(42)
+    return h3
+
+def divide_histograms(h1, h2, xtitle, ytitle) :
+    '''
+    Provide two histograms and divide h1/h2.
+    Converts final result into tgraph.
+    '''
+    nbins = h1.GetNbinsX()
+    xlow = h1.GetBinCenter(1)
+    xhigh = h1.GetBinCenter(nbins+1)
+    h3 = h1.Clone("ratio")
+    style_ratio_histogram(h3, xtitle, ytitle)
     #h3 = myTH1F("ratio", "ratio", nbins, xlow, xhigh, xtitle, ytitle)
     
     for i in range(1, nbins+1) :
@@ -243,7 +255,8 @@ def drawAtlasLabel(pad, descriptor, xpos=None, ypos=None) :
 ''' -----------------------------------------------------'''
 '''   TLine Methods                                      '''
 ''' -----------------------------------------------------'''
-def draw_line(xl, yl, xh, yh, color=r.kBlack) :
+def draw_line(xl, yl, xh, yh, color=None) :
+    if color is None : color = r.kBlack
     l = r.TLine(xl, yl, xh, yh)
     l.SetLineColor(color)
     l.Draw('same')
@@ -0,0 +1,195 @@
+#
+# Stage-level timing of the superplotter scripts
+#
+# Code is split into named "stages" (opening files, parsing metadata,
+# the TTree::Draw selections, the TGraph2D interpolation, SaveAs, ...)
+# whose wall-clock and CPU times are recorded per signal point:
+#
+#     with stage("selection") :
+#         ...
+#
+#     @profiled("metadata")
+#     def load_index(...) :
+#         ...
+#
+#     with point(dsid) :       # stages inside are attributed to dsid
+#         ...
+#
+# Nothing is recorded unless profiling is enabled (enable(), e.g. with
+# the --profile option of the scripts), in which case the scripts end
+# by writing a report (write_report) and printing a summary of the
+# stages sorted by their total time. Stages may be nested, the time of
+# an outer stage then includes that of the stages inside it.
+#
+# Records made in worker processes are sent back and merged by
+# superplotter.parallel.run_jobs.
+#
+
+import os
+import csv
+import json
+import time
+import functools
+from collections import OrderedDict
+
+_enabled = False
+# { (stage, point) : [calls, wall, cpu] }
+_records = OrderedDict()
+# the signal points being processed, innermost last
+_points = []
+
+def enable(on=True) :
+    global _enabled
+    _enabled = on
+
+def enabled() :
+    return _enabled
+
+def reset() :
+    _records.clear()
+
+def cpu_time() :
+    ''' User + system CPU time of this process, in seconds '''
+    t = os.times()
+    return t[0] + t[1]
+
+def current_point() :
+    return _points[-1] if _points else ""
+
+def record(name, wall, cpu, point=None, calls=1) :
+    ''' Add a measurement to the stage "name" (of the current point by default) '''
+    if point is None : point = current_point()
+    key = (name, str(point))
+    entry = _records.get(key)
+    if entry is None :
+        _records[key] = [calls, wall, cpu]
+    else :
+        entry[0] += calls
+        entry[1] += wall
+        entry[2] += cpu
+
+class stage(object) :
+    '''
+    Context manager timing the code inside it as the stage "name",
+    of the signal "point" (the current point if not given)
+    '''
+    __slots__ = ('name', 'point', '_wall', '_cpu')
+    def __init__(self, name, point=None) :
+        self.name = name
+        self.point = point
+
+    def __enter__(self) :
+        if _enabled :
+            self._wall = time.time()
+            self._cpu = cpu_time()
+        return self
+
+    def __exit__(self, *exc) :
+        if _enabled :
+            record(self.name, time.time() - self._wall, cpu_time() - self._cpu, self.point)
+        return False
+
+class point(object) :
+    '''
+    Context manager attributing the stages inside it to the signal point "name"
+    '''
+    __slots__ = ('name',)
+    def __init__(self, name) :
+        self.name = str(name)
+
+    def __enter__(self) :
+        _points.append(self.name)
+        return self
+
+    def __exit__(self, *exc) :
+        _points.pop()
+        return False
+
+def profiled(name=None) :
+    '''
+    Decorator timing each call of the function as the stage
+    "name" (by default the name of the function)
+    '''
+    def decorate(func) :
+        stage_name = name or func.__name__
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs) :
+            if not _enabled : return func(*args, **kwargs)
+            with stage(stage_name) :
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+''' -------------------------------------------'''
+'''  Records                                   '''
+''' -------------------------------------------'''
+def records() :
+    ''' The records as a list of (stage, point, calls, wall, cpu) '''
+    return [(name, pt, calls, wall, cpu) for (name, pt), (calls, wall, cpu) in _records.items()]
+
+def take_records() :
+    ''' The records, clearing them (e.g. to send them from a worker) '''
+    taken = records()
+    reset()
+    return taken
+
+def merge(other) :
+    ''' Add records (as returned by records()) e.g. from a worker process '''
+    for name, pt, calls, wall, cpu in other :
+        record(name, wall, cpu, pt, calls)
+
+def summary() :
+    '''
+    Per-stage totals over all points, as a list of
+    (stage, calls, number of points, wall, cpu) sorted by wall time
+    '''
+    totals = OrderedDict()
+    for name, pt, calls, wall, cpu in records() :
+        total = totals.setdefault(name, [0, set(), 0.0, 0.0])
+        total[0] += calls
+        if pt : total[1].add(pt)
+        total[2] += wall
+        total[3] += cpu
+    rows = [(name, t[0], len(t[1]), t[2], t[3]) for name, t in totals.items()]
+    return sorted(rows, key=lambda row : row[3], reverse=True)
+
+def print_summary() :
+    rows = summary()
+    print "----------------------------------------------------------------------------"
+    print " %-30s %8s %8s %12s %12s"%("stage", "calls", "points", "wall [s]", "cpu [s]")
+    print "----------------------------------------------------------------------------"
+    for name, calls, npoints, wall, cpu in rows :
+        print " %-30s %8d %8d %12.3f %12.3f"%(name, calls, npoints, wall, cpu)
+    print "----------------------------------------------------------------------------"
+
+def write_report(prefix) :
+    '''
+    Write the records to <prefix>.json (per-stage summary and
+    per-point records) and <prefix>.csv (per-point records)
+    Returns the files written.
+    '''
+    outdir = os.path.dirname(prefix)
+    if outdir and not os.path.isdir(outdir) : os.makedirs(outdir)
+    fields = ['stage', 'point', 'calls', 'wall', 'cpu']
+    report = {
+        'summary' : [dict(zip(['stage', 'calls', 'points', 'wall', 'cpu'], row)) for row in summary()],
+        'records' : [dict(zip(fields, row)) for row in records()],
+    }
+    with open(prefix + ".json", "w") as f :
+        json.dump(report, f, indent=2, sort_keys=True)
+    with open(prefix + ".csv", "wb") as f :
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        for row in records() :
+            writer.writerow(row)
+    return [prefix + ".json", prefix + ".csv"]
+
+def finish(prefix) :
+    '''
+    End of a profiled script: write the report and print the summary
+    (nothing is done if profiling is not enabled)
+    '''
+    if not _enabled : return
+    print_summary()
+    for f in write_report(prefix) :
+        print "Wrote the timing report %s"%f
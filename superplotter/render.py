@@ -0,0 +1,67 @@
+#
+# Render a list of plots in a pool of worker processes
+#
+# Each plot is described by a "job": plain (picklable) data, e.g. the
+# Hist1D dictionaries to draw and the labels. A draw function turns
+# one job into a canvas, which is drawn once and saved in each of the
+# requested formats. The jobs are shared out between worker processes
+# (superplotter.parallel.run_jobs), each with its own ROOT session in
+# batch mode, so rendering many plots scales with the number of cores.
+#
+
+from superplotter.parallel import run_jobs
+from superplotter.output import OutputManager
+from superplotter.profiling import stage
+from superplotter.lazy_root import set_batch
+
+DEFAULT_FORMATS = [ 'eps', 'pdf', 'png' ]
+
+# the style set up by the calling script, applied once in each worker
+_style = None
+_initialized = False
+
+def _setup_root() :
+    '''
+    Put the ROOT session of this process in batch mode and set
+    the plotting style, once per process
+    '''
+    global _initialized
+    if _initialized : return
+    set_batch(True)
+    if _style is not None : _style()
+    _initialized = True
+
+def save_canvas(canvas, outname, formats=DEFAULT_FORMATS, outdir="") :
+    '''
+    Save the canvas as "outdir/outname.<format>" for each of the
+    formats. Returns the saved files.
+    '''
+    return OutputManager(outdir).save(canvas, outname, formats)
+
+def _render_job(task) :
+    draw, job, formats, outdir = task
+    _setup_root()
+    with stage("draw") :
+        canvas, outname = draw(job)
+    saved = save_canvas(canvas, outname, formats, outdir)
+    # free the canvas (and whatever the draw function attached to it)
+    # before the next job of this worker
+    canvas.Close()
+    return saved
+
+def render_jobs(draw, jobs, outdir="", formats=DEFAULT_FORMATS, n_jobs=1, style=None) :
+    '''
+    Draw each of the jobs with "draw" and save the plots in each of
+    the formats, using n_jobs worker processes.
+
+    "draw" must be a module-level function taking one job and returning
+    (canvas, output name without extension); it must keep the objects
+    drawn on the canvas alive (e.g. by attaching them to the canvas).
+    "style" is a function setting the ROOT style, called once per worker.
+
+    Returns the list of files saved for each job.
+    '''
+    global _style, _initialized
+    _style = style
+    _initialized = False
+    return run_jobs(_render_job, [(draw, job, list(formats), outdir) for job in jobs], n_jobs)
@@ -0,0 +1,145 @@
+#
+# Store of computed results
+#
+# The numbers that the plotting scripts compute from the ntuples
+# (per-point yields, acceptances, efficiencies, ISR variations,
+# histograms, ...) are saved to .npz files so that the plots can be
+# re-drawn (e.g. with the --from-cache option of the scripts) without
+# reading the ntuples again.
+#
+# Each file holds one "product", whose arrays must follow the schema
+# of that product (see schemas below), and optionally any number of
+# superplotter.histogram.Hist1D histograms.
+#
+# The files are in $SUPERPLOTTER_RESULTS_DIR if set, otherwise
+# in ./results
+#
+
+import os
+import numpy as np
+
+from superplotter.histogram import Hist1D
+from superplotter.utils import atomic_write
+
+SCHEMA_VERSION = 1
+
+# { product : { array : (kind, number of dimensions) } }
+# kind is 'S' for strings and 'f' for numbers; 2D arrays are
+# (points, regions) with the regions listed in the 'regions' array
+_point_columns = { 'dsid' : ('S', 1), 'mX' : ('f', 1), 'mY' : ('f', 1) }
+schemas = {
+    'acc_eff' : dict(_point_columns, **{
+        'xsec'              : ('f', 1),
+        'branching_ratio'   : ('f', 1),
+        'filter_efficiency' : ('f', 1),
+        'n_generated'       : ('f', 1),
+        'regions'           : ('S', 1),
+        'n_fiducial'        : ('f', 2),
+        'n_fiducial_reco'   : ('f', 2),
+        'acceptance'        : ('f', 2),
+        'efficiency'        : ('f', 2),
+    }),
+    'isr_yields' : dict(_point_columns, **{
+        'regions'      : ('S', 1),
+        'unw_yield'    : ('f', 2),
+        'unw_stat_err' : ('f', 2),
+        'nom_yield'    : ('f', 2),
+        'stat_err'     : ('f', 2),
+        'sys_err_up'   : ('f', 2),
+        'sys_err_dn'   : ('f', 2),
+    }),
+    'isr_hists' : dict(_point_columns, **{
+        'vars' : ('S', 1),
+    }),
+    # regions are the systabler sub-regions (see superplotter.significance)
+    'significance' : dict(_point_columns, **{
+        'regions'           : ('S', 1),
+        'signal'            : ('f', 2),
+        'background'        : ('f', 1),
+        'background_err'    : ('f', 1),
+        'significance'      : ('f', 2),
+        'best_region'       : ('f', 1),
+        'best_significance' : ('f', 1),
+    }),
+}
+
+_HIST_PREFIX = 'hist:'
+_HIST_FIELDS = [ 'edges', 'sumw', 'sumw2', 'entries', 'title', 'xtitle', 'ytitle' ]
+
+def default_results_dir() :
+    return os.environ.get('SUPERPLOTTER_RESULTS_DIR', 'results')
+
+def results_path(product, tag, results_dir=None) :
+    '''
+    The file holding the results "product" for "tag"
+    (e.g. the name of the grid)
+    '''
+    if not results_dir : results_dir = default_results_dir()
+    return os.path.join(results_dir, "%s_%s.npz"%(product, tag))
+
+def _check_schema(product, arrays, caller) :
+    if product not in schemas :
+        raise KeyError("%s error: unknown product '%s' (known: %s)"%(caller, product, sorted(schemas.keys())))
+    for name, (kind, ndim) in sorted(schemas[product].items()) :
+        if name not in arrays :
+            raise ValueError("%s error: product '%s' is missing the array '%s'"%(caller, product, name))
+        a = np.asarray(arrays[name])
+        is_string = a.dtype.kind in 'SU'
+        if a.ndim != ndim or (kind=='S') != is_string :
+            raise ValueError("%s error: array '%s' of product '%s' should be %dD %s"%(
+                caller, name, product, ndim, 'strings' if kind=='S' else 'numbers'))
+
+def save_results(path, product, arrays, hists=None) :
+    '''
+    Save the arrays { name : array } of "product" and the
+    histograms { name : Hist1D } to "path"
+    '''
+    _check_schema(product, arrays, "save_results")
+    contents = {}
+    for name, a in arrays.items() :
+        a = np.asarray(a)
+        if a.dtype.kind == 'U' : a = a.astype(np.str_)
+        contents[name] = a
+    for name, h in (hists or {}).items() :
+        d = h.to_dict()
+        for field in _HIST_FIELDS :
+            contents["%s%s:%s"%(_HIST_PREFIX, name, field)] = np.asarray(d[field])
+    contents['__product__'] = np.array(product)
+    contents['__schema_version__'] = np.array(SCHEMA_VERSION)
+    outdir = os.path.dirname(path)
+    if outdir and not os.path.isdir(outdir) : os.makedirs(outdir)
+    with atomic_write(path) as f :
+        np.savez_compressed(f, **contents)
+
+def load_results(path, product) :
+    '''
+    Load the results of "product" saved with save_results.
+    Returns ({ name : array }, { name : Hist1D })
+    '''
+    if not os.path.isfile(path) :
+        raise IOError("load_results error: no results file %s (run without --from-cache first)"%path)
+    data = np.load(path)
+    try :
+        stored = str(data['__product__']) if '__product__' in data.files else ''
+        version = int(data['__schema_version__']) if '__schema_version__' in data.files else -1
+        if stored != product :
+            raise ValueError("load_results error: %s holds '%s' rather than '%s'"%(path, stored, product))
+        if version != SCHEMA_VERSION :
+            raise ValueError("load_results error: %s has schema version %d (expected %d), re-make it"%(
+                path, version, SCHEMA_VERSION))
+        arrays, hist_fields = {}, {}
+        for key in data.files :
+            if key.startswith('__') : continue
+            if key.startswith(_HIST_PREFIX) :
+                name, field = key[len(_HIST_PREFIX):].rsplit(':', 1)
+                hist_fields.setdefault(name, {})[field] = data[key]
+            else :
+                arrays[key] = data[key]
+    finally :
+        data.close()
+    _check_schema(product, arrays, "load_results")
+    hists = {}
+    for name, d in hist_fields.items() :
+        d['name'] = name
+        hists[name] = Hist1D.from_dict(d)
+    return arrays, hists
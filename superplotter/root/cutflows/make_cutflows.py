@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#
+# Print the cutflow and N-1 yields of the requested regions for
+# every signal point in the input directory. Each ntuple is read
+# once for all regions (or not at all, if an up-to-date atomic-cut
+# bitmask sidecar from make_cutmasks.py is found next to it).
+#
+
+# superplotter
+from superplotter.region import *
+from superplotter.signal import *
+
+# standard
+import argparse
+import glob
+import os
+import sys
+
+# ROOT (only imported once a tree is read)
+from superplotter.lazy_root import ROOT as r, set_batch
+set_batch(True)
+
+def load_cutflows(file, grid, weight, region_names, dbg) :
+    '''
+    Get the cutflows for the signal point in "file", from its
+    bitmask sidecar when possible
+    '''
+    # numpy-backed: only imported once there is something to read
+    from superplotter.cutflow import get_cutflows, get_cutflows_from_cutmask
+    from superplotter.cutmask import CutMask, sidecar_path
+    s = Signal(file, grid, dbg)
+    s.fill_mass_info()
+    sidecar = sidecar_path(file)
+    if os.path.isfile(sidecar) :
+        mask = CutMask(sidecar)
+        if mask.is_current(file) and all(mask.has_cuts(regions[reg]) for reg in region_names) :
+            if dbg : print "Using bitmask sidecar %s"%sidecar
+            return s, get_cutflows_from_cutmask(mask, weight, region_names)
+    s.get_tree()
+    return s, get_cutflows(s.tree, weight, region_names)
+
+if __name__=="__main__" :
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", help="Directory containing the signal ntuples")
+    parser.add_argument("-g", "--grid", default="SMCwslep", help="Provide the signal grid (default: 'SMCwslep')")
+    parser.add_argument("-r", "--regions", nargs="+", default=[], help="Provide the regions (default: all)")
+    parser.add_argument("-t", "--truth", action="store_true", default=False, help="Use the truthRazor_* ntuples (default: CENTRAL_*)")
+    parser.add_argument("-w", "--weight", default="", help="Event weight (default: 'eventweight', 'isr_weight_nom' for truth)")
+    parser.add_argument("-o", "--output", default="", help="Also write the tables to this text file")
+    parser.add_argument("-n", "--npz", default="", help="Also store the cutflow arrays in this .npz file")
+    parser.add_argument("-d", "--dbg", action="store_true", default=False)
+    args = parser.parse_args()
+    # imported after parsing the arguments: numpy alone takes most of
+    # the start-up budget of the script
+    import numpy
+    indir = args.input
+    grid = args.grid
+    region_names = args.regions if args.regions else sorted(regions.keys())
+    dbg = args.dbg
+    weight = args.weight
+    if not weight : weight = "isr_weight_nom" if args.truth else "eventweight"
+
+    for region in region_names :
+        if not is_valid_region(region) :
+            print "Region '%s' not supported! Available regions are:"%region
+            print_available_regions()
+            print "Exitting"
+            sys.exit()
+
+    files = glob.glob(indir + ("truthRazor_*.root" if args.truth else "CENTRAL_*.root"))
+    print "--------------------------------------"
+    print " Cutflows and N-1 yields              "
+    print "- - - - - - - - - - - - - - - - - - - "
+    print "  input :    %s                       "%(indir)
+    print "  files :    %s                       "%(len(files))
+    print "  weight:    %s                       "%(weight)
+    print "--------------------------------------\n"
+
+    tables = []
+    arrays = {}
+    for file in sorted(files) :
+        s, cutflows = load_cutflows(file, grid, weight, region_names, dbg)
+        for reg in region_names :
+            cf = cutflows[reg]
+            table = cf.table("%s  (%s,%s)  dsid %s"%(reg, s.mX, s.mY, s.dsid))
+            print table
+            tables.append(table)
+            key = "%s_%s"%(s.dsid, reg)
+            arrays[key + "_sumw"] = cf.sumw
+            arrays[key + "_sumw2"] = cf.sumw2
+            arrays[key + "_raw"] = cf.raw
+            arrays[key + "_nm1_sumw"] = cf.n_minus_one_sumw
+            arrays[key + "_nm1_sumw2"] = cf.n_minus_one_sumw2
+            arrays[key + "_nm1_raw"] = cf.n_minus_one_raw
+            arrays[reg + "_cuts"] = numpy.array(cf.cuts)
+
+    if args.output :
+        out = open(args.output, "w")
+        out.write("\n".join(tables) + "\n")
+        out.close()
+        print "Tables written to %s"%args.output
+    if args.npz :
+        numpy.savez_compressed(args.npz, **arrays)
+        print "Arrays written to %s"%args.npz
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+#
+# Write the atomic-cut bitmask sidecar (see superplotter.cutmask)
+# next to each signal ntuple in the input directory, so that the
+# yields of any region can later be derived without re-reading
+# the ntuples.
+#
+
+# superplotter
+from superplotter.region import *
+from superplotter.signal import *
+
+# standard
+import argparse
+import os
+import glob
+import sys
+
+# ROOT (only imported once a tree is read)
+from superplotter.lazy_root import ROOT as r, set_batch
+set_batch(True)
+
+if __name__=="__main__" :
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", help="Directory containing the CENTRAL_*.root and/or truthRazor_*.root ntuples")
+    parser.add_argument("-g", "--grid", default="SMCwslep", help="Provide the signal grid (default: 'SMCwslep')")
+    parser.add_argument("-f", "--force", action="store_true", default=False, help="Re-make sidecars that are already up to date")
+    parser.add_argument("-d", "--dbg", action="store_true", default=False)
+    args = parser.parse_args()
+    # imported after parsing the arguments: superplotter.cutmask needs
+    # numpy, which alone takes most of the start-up budget of the script
+    from superplotter.cutmask import collect_atomic_cuts, sidecar_path, write_cutmask, CutMask
+    indir = args.input
+    grid = args.grid
+    force = args.force
+    dbg = args.dbg
+
+    files = glob.glob(indir + "CENTRAL_*.root") + glob.glob(indir + "truthRazor_*.root")
+    if not files :
+        print "No CENTRAL_*.root or truthRazor_*.root files found in %s. Exitting."%indir
+        sys.exit()
+
+    cuts = collect_atomic_cuts(regions)
+    print "--------------------------------------"
+    print " Making atomic-cut bitmask sidecars   "
+    print "- - - - - - - - - - - - - - - - - - - "
+    print "  input :    %s                       "%(indir)
+    print "  files :    %s                       "%(len(files))
+    print "  cuts  :    %s                       "%(len(cuts))
+    print "--------------------------------------\n"
+    if dbg :
+        for i, cut in enumerate(cuts) :
+            print "  bit %2d : %s"%(i, cut)
+
+    for file in sorted(files) :
+        outfile = sidecar_path(file)
+        if not force and os.path.isfile(outfile) :
+            mask = CutMask(outfile)
+            if mask.is_current(file) and mask.cuts == cuts :
+                if dbg : print "Sidecar %s is up to date"%outfile
+                continue
+        s = Signal(file, grid, dbg)
+        s.get_tree()
+        write_cutmask(file, s.tree, cuts)
+        print "Wrote %s"%outfile
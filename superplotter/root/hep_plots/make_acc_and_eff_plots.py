@@ -19,6 +19,14 @@ from superplotter.region import *
 from superplotter.signal import *
 from superplotter.utils import *
 from superplotter.plot_utils import *
+from superplotter.yields import get_region_yields
+from superplotter.cache import EntryListCache
+from superplotter.parallel import run_jobs
+from superplotter.grid import SignalGrid
+from superplotter.results import results_path, save_results, load_results
+from superplotter.output import OutputManager
+from superplotter.interpolation import InterpolationCache
+from superplotter import profiling
 
 # standard
 import argparse
@@ -30,58 +38,122 @@ import ROOT as r
 r.gROOT.SetBatch(True)
 r.PyConfig.IgnoreCommandLineOptions = True
 
-def get_n_passing_selection(signals, region, is_truth) :
+def get_n_passing_selection(signals, region_names, is_truth, cache=None) :
+    '''
+    Count the (weighted) events passing each of the requested regions,
+    all of them in a single pass over each signal's tree. The counts are
+    stored in n_fiducial_by_region (truth) or n_fiducial_reco_by_region
+    (reco), see superplotter.grid.
+    '''
+    weight = ""
+    if is_truth :
+        weight = "isr_weight_nom" # apply c1c1 re-weighting to truth
+    else :
+        weight = "eventweight" # reco samples' "eventweight" contains isr re-weighting
     for sig in signals :
-        hist = myTH1F("hist","hist", 2, 0, 2,"","")
-        hist.Reset("ICE")
-        cmd = "isOS>>hist" # TODO: find out why "isMC" won't work, "isOS" is unsafe
-        cut = ""
-        if is_truth :
-            cut = "(%s) * isr_weight_nom"%(get_region_tcut(region)) # apply c1c1 re-weighting to truth
-        else :
-            cut = "(%s) * eventweight"%(get_region_tcut(region)) # reco samples' "eventweight" contains isr re-weighting
-        sig.tree.Draw(cmd, cut)
-        n_passing = hist.Integral(0,-1)
+        yields = get_region_yields(sig.tree, weight, region_names, cache=cache, source=sig.file)
+        for region in region_names :
+            n_passing = yields[region][0]
+            if is_truth :
+                sig.n_fiducial_by_region[region] = n_passing
+                print "N_fiducial(%s,%s) %s: %s"%(sig.mX, sig.mY, region, str(n_passing))
+            else :
+                sig.n_fiducial_reco_by_region[region] = n_passing
+                print "N_fiducial_reco(%s,%s) %s: %s"%(sig.mX, sig.mY, region, str(n_passing))
+
+# the numbers describing a signal point that are sent back from
+# the worker processes (see load_signal_point)
+point_attributes = [ 'mX', 'mY', 'xsec', 'branching_ratio', 'filter_efficiency',
+                     'n_generated', 'n_fiducial_by_region', 'n_fiducial_reco_by_region' ]
+
+def load_signal_point(job) :
+    '''
+    Load a single signal point and count its events passing each of
+    the region selections. Run for each point, possibly in a worker
+    process, so only plain numbers are returned: { attribute : value }
+    '''
+    file, grid, region_names, is_truth, dbg, cache_dir = job
+    s = Signal(file, grid, dbg)
+    s.n_fiducial_by_region = {}
+    s.n_fiducial_reco_by_region = {}
+    with profiling.point(s.dsid) :
+        s.get_tree()
+        s.fill_mass_info()
         if is_truth :
-            sig.n_fiducial = n_passing
-            print "N_fiducial(%s,%s): %s"%(sig.mX, sig.mY, str(n_passing))
-        else :
-            sig.n_fiducial_reco = n_passing
-            print "N_fiducial_reco(%s,%s): %s"%(sig.mX, sig.mY, str(n_passing))
-        hist.Delete()
+            s.fill_xsec_br_eff()
+            s.get_n_generated()
+        cache = None
+        if cache_dir is not None : cache = EntryListCache(cache_dir, dbg)
+        get_n_passing_selection([s], region_names, is_truth, cache)
+    return dict((a, getattr(s, a)) for a in point_attributes if hasattr(s, a))
 
-def calculate_acceptance(signals) :
+def load_signal_points(files, grid, region_names, is_truth, dbg, cache_dir, n_jobs=1) :
     '''
-    We stored the N_generated in the truth_signals in the beginning
-    so we use the truth signals in this function
+    Load the signal points of the given files, n_jobs at a time,
+    and return them as Signals (without their trees)
     '''
-    for sig in signals :
-        n_fiducial = float(sig.n_fiducial)
-        n_events_generated = float(sig.n_generated)
-        branching_ratio = float(sig.branching_ratio)
-        filter_eff = float(sig.filter_efficiency)
-        acceptance = n_fiducial /( (n_events_generated)/(branching_ratio * filter_eff) )
-        sig.acceptance = acceptance
+    jobs = [(file, grid, region_names, is_truth, dbg, cache_dir) for file in files]
+    signals = []
+    for file, info in zip(files, run_jobs(load_signal_point, jobs, n_jobs)) :
+        s = Signal(file, grid, dbg)
+        for a, value in info.items() :
+            setattr(s, a, value)
+        signals.append(s)
+    return signals
 
-def calculate_efficiency(truth, reco) :
+def calculate_acceptance_and_efficiency(truth_signals, reco_signals, region_names) :
     '''
-    Store the final efficiencies in the truth Signals for consistency and 
-    to avoid having to pass both truth and reco collections around
+    Compute the acceptance and efficiency of all of the truth points
+    in all of the regions at once (see superplotter.grid.SignalGrid),
+    the truth points being matched to the reco points by their masses.
+    Returns the truth SignalGrid, use its fill_signals method to store
+    the values of a given region in the truth Signals.
     '''
-    for ts in truth :
-        for rs in reco :
-            if rs==ts : ts.efficiency = float(rs.n_fiducial_reco / ts.n_fiducial)
-    
-    
-def calculate_acceptance_and_efficiency(truth_signals, reco_signals) :
-    calculate_acceptance(truth_signals)
-    calculate_efficiency(truth_signals, reco_signals)
+    truth = SignalGrid.from_signals(truth_signals, region_names)
+    reco = SignalGrid.from_signals(reco_signals, region_names)
+    truth.calculate_acceptance_and_efficiency(reco)
+    return truth
+
+
+def signals_from_grid(signal_grid, grid, dbg=False) :
+    '''
+    Signals (without trees) holding the numbers stored in a SignalGrid,
+    e.g. one read back from the results store
+    '''
+    signals = []
+    for i in xrange(len(signal_grid)) :
+        s = Signal("", grid, dbg)
+        s.dsid = str(signal_grid.dsid[i])
+        for name, dtype in SignalGrid.columns :
+            setattr(s, name, float(getattr(signal_grid, name)[i]))
+        signals.append(s)
+    return signals
 
 
 # ------------------------------------------ #
 #  Begin plotting
 # ------------------------------------------ #
-def make_acceptance_and_efficiency_graphs(signals, region, grid, outdir) :
+# binning of the maps in the (mX, mY) plane: at least the range
+# (xlow, xhigh, ylow, yhigh) of the original SMCwslep plots, extended
+# to all of the drawn points
+default_map_range = (90., 250., 0., 250.)
+map_nbins = 50
+
+def map_binning(xs, ys) :
+    '''
+    (nx, xlow, xhigh, ny, ylow, yhigh) of the maps of the points (xs, ys)
+    '''
+    xlow, xhigh, ylow, yhigh = default_map_range
+    if xs : xlow, xhigh = min([xlow] + xs), max([xhigh] + xs)
+    if ys : ylow, yhigh = min([ylow] + ys), max([yhigh] + ys)
+    return (map_nbins, xlow, xhigh, map_nbins, ylow, yhigh)
+
+def make_acceptance_and_efficiency_graphs(signals, region, grid, output, interpolators) :
+    '''
+    The maps of the region, interpolated with the triangulation of the
+    points shared by all of the regions and quantities (see
+    superplotter.interpolation)
+    '''
     title = ''
     if grid=="SMCwslep" :
         title += '; m_{#tilde{#chi}_{1}^{#pm}} [GeV]'
@@ -90,9 +162,6 @@ def make_acceptance_and_efficiency_graphs(signals, region, grid, outdir) :
     m_xrange = {'min': min([float(sig.mX) for sig in signals]), 'max': max([float(sig.mX) for sig in signals])}
     m_yrange = {'min': min([float(sig.mY) for sig in signals]), 'max': max([float(sig.mY) for sig in signals])}
 
-    histo_master = r.TH2F('h_acceptance_'+region, title,
-                    50, 90, 250,
-                    50, 0.0, 250)
  #   percent = 100.
  #   acceptance_scale_factor = 1.0e4
  #   acceptance_scale_label = '10^{4}'
@@ -101,11 +170,8 @@ def make_acceptance_and_efficiency_graphs(signals, region, grid, outdir) :
     r.gStyle.SetPaintTextFormat('.3f')
     #for s in ['acceptance', 'efficiency', 'ngen', 'xsec'] :
     for s in ['xsec'] :
-        histo_master = r.TH2F('h_'+s+"_"+region, title, 50, 90, 250, 50, 0, 250)
-        g = r.TGraph2D(1)
-        g.SetName('g_'+s)
-        g.SetMarkerStyle(r.kFullSquare)
-        g.SetMarkerSize(2.0*g.GetMarkerSize())
+        name = 'g_'+s
+        xs, ys, zs = [], [], []
         for sig in signals :
             x, y, z= sig.mX, sig.mY, 0.0
             if s=='acceptance' :
@@ -119,27 +185,36 @@ def make_acceptance_and_efficiency_graphs(signals, region, grid, outdir) :
             if float(x) > 400 : continue
             if float(y) > 400 : continue
             if s=='acceptance' or s=='efficiency' :
-                g.SetPoint(g.GetN(), float(x), float(y), float(z)*100) # storing as percentage!!
+                z = float(z)*100 # storing as percentage!!
             elif s=='ngen' :
-                g.SetPoint(g.GetN(), float(x), float(y), float(z) / 1000)
-            elif s=='xsec' :
-                g.SetPoint(g.GetN(), float(x), float(y), float(z))
-        c = r.TCanvas('c_'+g.GetName(),'',800,600)
+                z = float(z) / 1000
+            xs.append(float(x))
+            ys.append(float(y))
+            zs.append(float(z))
+        binning = map_binning(xs, ys)
+        histo_master = r.TH2F('h_'+s+"_"+region, title, *binning)
+        c = r.TCanvas('c_'+name,'',800,600)
         c.cd()
         c.SetRightMargin(2.5*c.GetRightMargin())
         histo_master.Draw('axis')
-        g.Draw('colz same')
+        # the points are the same for all of the regions and quantities,
+        # they are only triangulated once
+        interpolator = interpolators.get(grid, xs, ys, binning)
+        h_map = interpolator.th2('h_map_'+s+"_"+region, title, zs)
+        h_map.Draw('colz same')
         c.Update()
 
         z_title = ''
-        if 'accept' in g.GetName() : z_title = 'Acceptance [%]'
-        elif 'eff' in g.GetName()  : z_title = 'Efficiency [%]'
-        elif 'ngen' in g.GetName() : z_title = 'Events generated [k]'
-        elif 'xsec' in g.GetName() : z_title = 'Production Cross-Section [pb]'
-        z_title_x = 282
-        z_title_y = 150
-        if s=='ngen' : z_title_y = 110
-        elif s=='xsec' : z_title_y = 60
+        if 'accept' in name : z_title = 'Acceptance [%]'
+        elif 'eff' in name  : z_title = 'Efficiency [%]'
+        elif 'ngen' in name : z_title = 'Events generated [k]'
+        elif 'xsec' in name : z_title = 'Production Cross-Section [pb]'
+        # in the right margin, placed relative to the range of the map
+        xlow, xhigh, ylow, yhigh = binning[1], binning[2], binning[4], binning[5]
+        z_title_x = xhigh + 0.2*(xhigh - xlow)
+        z_title_y = ylow + 0.6*(yhigh - ylow)
+        if s=='ngen' : z_title_y = ylow + 0.44*(yhigh - ylow)
+        elif s=='xsec' : z_title_y = ylow + 0.24*(yhigh - ylow)
         z_tex = r.TLatex(z_title_x, z_title_y, z_title)
         z_tex.SetTextAngle(90)
         z_tex.Draw('same')
@@ -149,20 +224,20 @@ def make_acceptance_and_efficiency_graphs(signals, region, grid, outdir) :
             tex.SetTextFont(42)
             tex.SetTextSize(0.6*tex.GetTextSize())
             x, y, z = sig.mX, sig.mY, 0.0
-            if 'accept' in g.GetName() :
+            if 'accept' in name :
                 z = sig.acceptance
-            elif 'effic' in g.GetName() :
+            elif 'effic' in name :
                 z = sig.efficiency
-            elif 'ngen' in g.GetName() :
+            elif 'ngen' in name :
                 z = float(sig.n_generated) / 1000.
-            elif 'xsec' in g.GetName() :
+            elif 'xsec' in name :
                 z = float(sig.xsec)
             if float(x) >= 225 : continue
             if float(y) >= 225 : continue
-            if 'accept' in g.GetName() or 'effic' in g.GetName() :
+            if 'accept' in name or 'effic' in name :
                 tex.DrawLatex(float(x), float(y), "%.2f"%(100*float(z)))
-            elif 'ngen' in g.GetName() : tex.DrawLatex(float(x), float(y), "%.0f"%(float(z)))
-            elif 'xsec' in g.GetName() : tex.DrawLatex(float(x), float(y), "%.2f"%(float(z)))
+            elif 'ngen' in name : tex.DrawLatex(float(x), float(y), "%.0f"%(float(z)))
+            elif 'xsec' in name : tex.DrawLatex(float(x), float(y), "%.2f"%(float(z)))
         c.Update()
         xax = histo_master.GetXaxis()
         yax = histo_master.GetYaxis()
@@ -188,77 +263,97 @@ def make_acceptance_and_efficiency_graphs(signals, region, grid, outdir) :
         c.Update()
 
         outname = region
-        if 'accep' in g.GetName() : outname += '_acc'
-        elif 'eff' in g.GetName() : outname += '_eff'
-        elif 'ngen' in g.GetName() : outname += '_ngen'
-        elif 'xsex' in g.GetName() : outname += '_xsec'
+        if 'accep' in name : outname += '_acc'
+        elif 'eff' in name : outname += '_eff'
+        elif 'ngen' in name : outname += '_ngen'
+        elif 'xsex' in name : outname += '_xsec'
         outname += '.eps'
-        c.SaveAs(outname)
-        
-        # move the file to the destination directory
-        mv_file_to_dir(outname, str(outdir), True)
+        output.save(c, outname)
 
 
 if __name__=="__main__" :
     parser = argparse.ArgumentParser()
-    parser.add_argument("-g", "--grid", help="Provide the signal grid (default: 'SMCwslep')")
-    parser.add_argument("-r", "--region",help="Provide the region (default: 'eeSuper1a')")
-    parser.add_argument("-o", "--outdir", help="Store the plots in this directory (default: plots/")
+    parser.add_argument("-g", "--grid", nargs="+", default=["SMCwslep"], help="Provide the signal grid(s) (default: 'SMCwslep')")
+    parser.add_argument("-r", "--region", nargs="+", default=[], help="Provide the region(s) (default: all regions)")
+    parser.add_argument("-o", "--outdir", default="plots/exA_plots_{grid}", help="Store the plots in this directory, '{grid}' is replaced by the grid name (default: plots/exA_plots_{grid})")
     parser.add_argument("-d", "--dbg",action="store_true")
+    parser.add_argument("--no-cache", action="store_true", default=False, help="Do not use the cache of selected entries")
+    parser.add_argument("--cache-dir", default="", help="Directory of the cache of selected entries (default: $SUPERPLOTTER_CACHE_DIR/entrylists, ~/.superplotter_cache/entrylists if it is not set)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of worker processes loading the signal points (default: 1)")
+    parser.add_argument("--from-cache", action="store_true", default=False, help="Only re-draw the plots from the stored results of a previous run (no ntuples are read)")
+    parser.add_argument("--results-dir", default="", help="Directory of the stored results (default: $SUPERPLOTTER_RESULTS_DIR or ./results)")
+    parser.add_argument("--profile", default="", help="Time the stages of the run and write the report to <profile>.json and <profile>.csv")
+    parser.add_argument("--background-output", action="store_true", default=False, help="Move the saved plots to the output directory in a background thread")
     args = parser.parse_args()
-    grid = args.grid
-    region = args.region
-    outdir = args.outdir
+    grids = args.grid
+    region_names = args.region if args.region else sorted(regions.keys())
     dbg = args.dbg
-    # check whether requested region is available
-    if not is_valid_region(region) :
-        print "Region '%s' not supported! Available regions are:"%region
-        print_available_regions()
-        print "Exitting"
-        sys.exit()
+    if args.profile : profiling.enable()
+    # check whether requested regions are available
+    for region in region_names :
+        if not is_valid_region(region) :
+            print "Region '%s' not supported! Available regions are:"%region
+            print_available_regions()
+            print "Exitting"
+            sys.exit()
     print "--------------------------------------"
     print " Plotting signal acceptance and eff   "
     print "- - - - - - - - - - - - - - - - - - - "
-    print "  grid:      %s                       "%(grid)
-    print "  region:    %s                       "%(region)
-    print "  outdir:    %s                       "%(outdir)
+    print "  grids:     %s                       "%(" ".join(grids))
+    print "  regions:   %s                       "%(" ".join(region_names))
+    print "  outdir:    %s                       "%(args.outdir)
     print "--------------------------------------\n"
 
-    # Fill the truth signal points
-    truth_signals = []
-    truth_files = glob.glob(get_signal_file_directory(grid,True) + 'truthRazor_*.root')
-    for file in truth_files :
-        s = Signal(file, grid, dbg)
-        s.get_tree()
-        s.fill_mass_info()
-        s.fill_xsec_br_eff()
-        s.get_n_generated()
-        truth_signals.append(s)
-    # Fill the reconststructed signal points
-    reco_signals = []
-    reco_files = glob.glob(get_signal_file_directory(grid,False) + 'CENTRAL_*.root')
-    for file in reco_files :
-        s = Signal(file, grid, dbg)
-        s.get_tree()
-        s.fill_mass_info()
-        reco_signals.append(s)
-    # Summary of points
-    print "--------------------------------------"
-    print "  Signal points for grid %s"%grid
-    print "\t%s truth points, %s reco points"%(str(len(truth_signals)), str(len(reco_signals)))
-    print "--------------------------------------"
-
-    # give c1c1 weight to truth samples
-    # get N_{fiducial} <==> N events in SR with selection applied on truth objects
-    get_n_passing_selection(truth_signals, region, True) 
-    # get N_{fiducial_reco} <==> N events in SR with selection applied on reconstructed objects
-    get_n_passing_selection(reco_signals, region, False)
-    # calculate acceptance and efficiency
-    calculate_acceptance_and_efficiency(truth_signals, reco_signals)
+    # selected entries are re-used between runs unless the ntuples change
+    cache_dir = None
+    if not args.no_cache : cache_dir = args.cache_dir
 
     # test TGuiTutils Style
     #setAtlasStyle_TGui()
     setAtlasStyle()
 
-    
-    make_acceptance_and_efficiency_graphs(truth_signals, region, grid, outdir) 
+    # the triangulation of each grid is shared by all of its maps, and
+    # kept on disk for the next runs unless --no-cache is given
+    interpolators = InterpolationCache(persistent=not args.no_cache, dbg=dbg)
+
+    for grid in grids :
+        outdir = args.outdir.format(grid=grid)
+        output = OutputManager(outdir, background=args.background_output, dbg=dbg)
+
+        results = results_path('acc_eff', grid, args.results_dir)
+        if args.from_cache :
+            truth_grid = SignalGrid.from_arrays(load_results(results, 'acc_eff')[0])
+            missing = [reg for reg in region_names if reg not in truth_grid.region_index]
+            if missing :
+                print "Regions %s are not in the stored results %s, re-run without --from-cache"%(missing, results)
+                sys.exit()
+            truth_signals = signals_from_grid(truth_grid, grid, dbg)
+            print "Read %d signal points for grid %s from %s"%(len(truth_signals), grid, results)
+        else :
+            # Fill the truth signal points, with the yields of all regions at once
+            # give c1c1 weight to truth samples
+            # get N_{fiducial} <==> N events in SR with selection applied on truth objects
+            truth_files = glob.glob(get_signal_file_directory(grid,True) + 'truthRazor_*.root')
+            truth_signals = load_signal_points(truth_files, grid, region_names, True, dbg, cache_dir, args.jobs)
+            # Fill the reconststructed signal points
+            # get N_{fiducial_reco} <==> N events in SR with selection applied on reconstructed objects
+            reco_files = glob.glob(get_signal_file_directory(grid,False) + 'CENTRAL_*.root')
+            reco_signals = load_signal_points(reco_files, grid, region_names, False, dbg, cache_dir, args.jobs)
+            # Summary of points
+            print "--------------------------------------"
+            print "  Signal points for grid %s"%grid
+            print "\t%s truth points, %s reco points"%(str(len(truth_signals)), str(len(reco_signals)))
+            print "--------------------------------------"
+
+            # calculate acceptance and efficiency, for all regions at once
+            truth_grid = calculate_acceptance_and_efficiency(truth_signals, reco_signals, region_names)
+            save_results(results, 'acc_eff', truth_grid.to_arrays())
+            print "Stored the results in %s"%results
+
+        for region in region_names :
+            truth_grid.fill_signals(truth_signals, region)
+            make_acceptance_and_efficiency_graphs(truth_signals, region, grid, output, interpolators)
+        output.close()
+        print "Saved %d plots in %s"%(len(output.saved), outdir)
+
+    profiling.finish(args.profile)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+#--------------------------------------------------------------------------#
+# plot, in the (mc1,mn1) plane the expected significance of the signal
+# regions, and the best signal region of each point
+#
+# signal     = N_{fiducial-reco} of each region, from the stored results
+#              of make_acc_and_eff_plots.py
+# background = total expected background and uncertainty of each region,
+#              from the summary (<output>.json) written by systabler.py
+#
+# All of the points and regions are evaluated at once, see
+# superplotter.significance
+#--------------------------------------------------------------------------#
+
+# superplotter
+from superplotter.signal import get_prod_label
+from superplotter.plot_utils import *
+from superplotter.render import render_jobs, DEFAULT_FORMATS
+from superplotter.lazy_root import ROOT as r, set_batch
+from superplotter import profiling
+
+# standard
+import argparse
+import sys
+
+set_batch(True)
+
+# the triangulations of the grids, shared by the maps drawn in each process
+_interpolators = None
+
+def map_job(name, grid, z_title, points, labels) :
+    '''
+    The (picklable) description of one map: the (mX, mY, z) points
+    to interpolate and the (mX, mY, text) labels drawn on top
+    '''
+    return { 'name' : name, 'grid' : grid, 'z_title' : z_title, 'points' : points, 'labels' : labels }
+
+def significance_map_jobs(arrays, grid, method, per_region=True) :
+    '''
+    The map of the best significance of each point (labelled with
+    the best region), and optionally the map of each region
+    '''
+    regions = [str(reg) for reg in arrays['regions']]
+    mX, mY = arrays['mX'].tolist(), arrays['mY'].tolist()
+    best, best_z = arrays['best_region'].astype(int).tolist(), arrays['best_significance'].tolist()
+    z_title = "Expected significance (%s)"%("Z_{Asimov}" if method=='asimov' else "Z_{n}")
+    points, labels = [], []
+    for x, y, i, z in zip(mX, mY, best, best_z) :
+        if i < 0 : continue
+        points.append((x, y, z))
+        labels.append((x, y, "#splitline{%.1f}{%s}"%(z, regions[i])))
+    jobs = [ map_job("%s_best_%s"%(grid, method), grid, z_title, points, labels) ]
+    if per_region :
+        z = arrays['significance']
+        for j, reg in enumerate(regions) :
+            points = [(x, y, float(z[k, j])) for k, (x, y) in enumerate(zip(mX, mY)) if z[k, j]==z[k, j]]
+            labels = [(x, y, "%.2f"%zz) for x, y, zz in points]
+            jobs.append(map_job("%s_%s_%s"%(grid, reg, method), grid, z_title, points, labels))
+    return jobs
+
+def draw_significance_map(job) :
+    '''
+    Draw the map described by "job" (see map_job), a render_jobs draw function.
+    Returns the canvas and the name of the output file (without extension)
+    '''
+    global _interpolators
+    name, points = job['name'], job['points']
+    c = r.TCanvas('c_' + name, '', 800, 600)
+    c.cd()
+    c.SetRightMargin(2.5*c.GetRightMargin())
+    xs = [p[0] for p in points] or [0.0]
+    ys = [p[1] for p in points] or [0.0]
+    xlow, xhigh = min(xs), max(xs)
+    ylow, yhigh = min(ys), max(ys)
+    dx, dy = 0.1*(xhigh - xlow) or 10.0, 0.1*(yhigh - ylow) or 10.0
+    binning = (50, xlow - dx, xhigh + dx, 50, max(0.0, ylow - dy), yhigh + dy)
+    frame = r.TH2F('h_' + name, '', *binning)
+    frame.GetXaxis().SetTitle("m_{#tilde{#chi}_{1}^{#pm}} [GeV]")
+    frame.GetYaxis().SetTitle("m_{#tilde{#chi}_{1}^{0}} [GeV]")
+    frame.GetZaxis().SetTitle(job['z_title'])
+    frame.Draw('axis')
+    keep = [frame]
+    # at least 3 points are needed to be interpolated
+    if len(points) >= 3 :
+        if _interpolators is None :
+            from superplotter.interpolation import InterpolationCache
+            _interpolators = InterpolationCache()
+        interpolator = _interpolators.get(job['grid'], [p[0] for p in points], [p[1] for p in points], binning)
+        h_map = interpolator.th2('h_map_' + name, '', [p[2] for p in points])
+        h_map.GetZaxis().SetTitle(job['z_title'])
+        h_map.Draw('colz same')
+        keep.append(h_map)
+    for x, y, text in job['labels'] :
+        tex = r.TLatex(0.0, 0.0, '')
+        tex.SetTextFont(42)
+        tex.SetTextSize(0.5*tex.GetTextSize())
+        tex.SetTextAlign(22)
+        keep.append(tex.DrawLatex(x, y, text))
+        keep.append(tex)
+    r.gPad.RedrawAxis()
+    drawAtlasLabel(c, "Internal", ypos=0.92)
+    if job['grid']=="SMCwslep" : topLeftLabel(c, get_prod_label(job['grid']), ypos=0.84)
+    c.Update()
+    # keep the drawn objects alive until the canvas is saved
+    c._keep = keep
+    return c, name
+
+def print_significance_table(arrays) :
+    regions = [str(reg) for reg in arrays['regions']]
+    print "--------------------------------------"
+    print "  background:"
+    for reg, b, err in zip(regions, arrays['background'], arrays['background_err']) :
+        print "  %-14s %.2f +/- %.2f"%(reg, b, err)
+    print "- - - - - - - - - - - - - - - - - - - "
+    print "  %-10s %8s %8s  %-14s %s"%("dsid", "mX", "mY", "best region", "Z")
+    for dsid, x, y, i, z in zip(arrays['dsid'], arrays['mX'], arrays['mY'], arrays['best_region'], arrays['best_significance']) :
+        best = regions[int(i)] if i >= 0 else "-"
+        print "  %-10s %8.1f %8.1f  %-14s %.3f"%(dsid, x, y, best, z)
+    print "--------------------------------------"
+
+if __name__=="__main__" :
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-g", "--grid", nargs="+", default=["SMCwslep"], help="Provide the signal grid(s) (default: 'SMCwslep')")
+    parser.add_argument("-b", "--background", required=True, help="Summary of the background tables written by systabler.py (<output>.json)")
+    parser.add_argument("--texdir", default=None, help="Only use the tables of this directory of the summary")
+    parser.add_argument("--add-stat", action="store_true", default=False, help="Add the MC statistical uncertainty of the background in quadrature")
+    parser.add_argument("-r", "--region", nargs="+", default=[], help="Provide the (systabler) region(s) (default: all regions of the summary)")
+    parser.add_argument("-m", "--method", default="asimov", help="Significance: 'asimov' (Z_Asimov) or 'binomial' (Z_n) (default: asimov)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Scale the signal yields, e.g. to another luminosity (default: 1)")
+    parser.add_argument("--results-dir", default="", help="Directory of the stored results (default: $SUPERPLOTTER_RESULTS_DIR or ./results)")
+    parser.add_argument("-o", "--outdir", default="plots/significance_{grid}", help="Store the plots in this directory, '{grid}' is replaced by the grid name (default: plots/significance_{grid})")
+    parser.add_argument("-f", "--formats", nargs="+", default=DEFAULT_FORMATS, help="Formats of the plots (default: %s)"%" ".join(DEFAULT_FORMATS))
+    parser.add_argument("--best-only", action="store_true", default=False, help="Only draw the map of the best region")
+    parser.add_argument("--no-plots", action="store_true", default=False, help="Only compute and store the significances")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of worker processes drawing the maps (default: 1)")
+    parser.add_argument("--profile", default="", help="Time the stages of the run and write the report to <profile>.json and <profile>.csv")
+    args = parser.parse_args()
+    # the numpy-backed modules are imported after parsing the arguments:
+    # numpy alone takes most of the start-up budget of the script
+    from superplotter.grid import SignalGrid
+    from superplotter.results import results_path, save_results, load_results
+    from superplotter.significance import load_background, grid_significance, methods
+    if args.method not in methods :
+        print "Method '%s' not supported! Available methods are: %s"%(args.method, " ".join(methods))
+        sys.exit()
+    if args.profile : profiling.enable()
+
+    print "--------------------------------------"
+    print " Plotting expected significance       "
+    print "- - - - - - - - - - - - - - - - - - - "
+    print "  grids:      %s                      "%(" ".join(args.grid))
+    print "  background: %s                      "%(args.background)
+    print "  method:     %s                      "%(args.method)
+    print "  outdir:     %s                      "%(args.outdir)
+    print "--------------------------------------\n"
+
+    try :
+        background = load_background(args.background, args.texdir, args.add_stat)
+    except ValueError, e :
+        print e.args[0]
+        sys.exit()
+    region_names = args.region if args.region else None
+    if region_names :
+        missing = [reg for reg in region_names if reg not in background]
+        if missing :
+            print "Regions %s are not in %s! Available regions are: %s"%(missing, args.background, " ".join(sorted(background)))
+            sys.exit()
+
+    for grid in args.grid :
+        acc_eff = results_path('acc_eff', grid, args.results_dir)
+        signal_grid = SignalGrid.from_arrays(load_results(acc_eff, 'acc_eff')[0])
+        print "Read %d signal points for grid %s from %s"%(len(signal_grid), grid, acc_eff)
+        with profiling.stage("significance") :
+            try :
+                arrays = grid_significance(signal_grid, background, region_names, args.method, args.scale)
+            except KeyError, e :
+                print "%s, re-run make_acc_and_eff_plots.py with the missing regions"%e.args[0]
+                sys.exit()
+        if not len(arrays['regions']) :
+            print "None of the regions of %s are in %s"%(args.background, acc_eff)
+            sys.exit()
+        results = results_path('significance', "%s_%s"%(grid, args.method), args.results_dir)
+        save_results(results, 'significance', arrays)
+        print_significance_table(arrays)
+        print "Stored the results in %s"%results
+
+        if args.no_plots : continue
+        jobs = significance_map_jobs(arrays, grid, args.method, not args.best_only)
+        outdir = args.outdir.format(grid=grid)
+        saved = render_jobs(draw_significance_map, jobs, outdir, args.formats, args.jobs, style=setAtlasStyle)
+        print "Saved %d plots in %s"%(sum(len(files) for files in saved), outdir)
+
+    profiling.finish(args.profile)
@@ -14,6 +14,8 @@ from superplotter.region import *
 from superplotter.signal import *
 from superplotter.utils import *
 from superplotter.plot_utils import *
+from superplotter.output import OutputManager
+from superplotter.interpolation import InterpolationCache
 
 # standard
 import argparse
@@ -73,27 +75,27 @@ def get_region_name(region) :
     return outname
     
 
-def make_sig_sys_plots(points) :
-    histo_master = r.TH2F("h_sigsys_"+region, "; m_{#tilde{#chi}_{1}^{#pm}} [GeV]; m_{#tilde{#chi}_{1}^{0}} [GeV]",
-                            50, 90, 250,
-                            50, 0,  250)
+# binning of the maps in the (mX, mY) plane
+map_binning = (50, 90, 250, 50, 0, 250)
+
+def make_sig_sys_plots(points, region, interpolators) :
+    '''
+    The map of the systematic uncertainty of the region, interpolated
+    with the triangulation of the points (shared by all of the regions
+    of the grid, see superplotter.interpolation)
+    '''
+    title = "; m_{#tilde{#chi}_{1}^{#pm}} [GeV]; m_{#tilde{#chi}_{1}^{0}} [GeV]"
+    histo_master = r.TH2F("h_sigsys_"+region, title, *map_binning)
     r.gStyle.SetPaintTextFormat('.3f')
-    g = r.TGraph2D(1)
-    g.SetName('g_'+region)
-    g.SetMarkerStyle(r.kFullSquare)
-    g.SetMarkerSize(2.0 * g.GetMarkerSize())
-    #g.SetMaximum(100)
-    for p in points :
-        x, y, z = p.mX, p.mY, p.sys
-        g.SetPoint(g.GetN(), x, y, z * 100.) # plot percent uncertainty
-        
-    c = r.TCanvas('c_'+g.GetName(), '', 800, 600)
+    interpolator = interpolators.get("SMCwslep", [p.mX for p in points], [p.mY for p in points], map_binning)
+    h_map = interpolator.th2("h_map_"+region, title, [p.sys * 100. for p in points]) # plot percent uncertainty
+
+    c = r.TCanvas('c_g_'+region, '', 800, 600)
     c.cd()
     c.SetRightMargin(2.5 * c.GetRightMargin())
     histo_master.Draw("axis")
-    g.Draw("colz same")
-    g.SetMaximum(100)
-    g.Draw("colz same")
+    h_map.SetMaximum(100)
+    h_map.Draw("colz same")
     c.Update()
 
     z_title = "Systematic Uncertainty [%]"
@@ -131,43 +133,47 @@ def make_sig_sys_plots(points) :
     outname = region
     outname += "_sigUncert"
     outname += ".eps"
-    c.SaveAs(outname)
-
-    # move the file to the destination directory
-    mv_file_to_dir(outname, outDir, True)
+    OutputManager(outDir, dbg=dbg).save(c, outname)
 
 if __name__=="__main__" :
     parser = argparse.ArgumentParser()
-    parser.add_argument("-r", "--region", help="Provide the region (default: 'Super1a_EE')", default="Super1a_EE")
+    parser.add_argument("-r", "--region", nargs="+", help="Provide the region(s) (default: 'Super1a_EE')", default=["Super1a_EE"])
     parser.add_argument("-o", "--outDir", help="Provide the output directory to dump the plots (default: 'sigsys_plots')", default="sigsys_plots")
     parser.add_argument("-d", "--dbg", help="Set debug level true", action="store_true")
+    parser.add_argument("--no-cache", action="store_true", default=False, help="Do not keep the triangulation of the signal points on disk")
     args = parser.parse_args()
-    global region, outDir, dbg
-    region = args.region
+    global outDir, dbg
     outDir = args.outDir
     dbg = args.dbg
 
     # directory where files holding sys uncertainties are
     sysDir = "./info/sig_sys_uncertainty/"
-    file = sysDir + "sys_uncert_" + region + ".txt"
-    if not os.path.isfile(file) :
-        print "ERROR: File (%s) for the systematic uncertainty for the requested region does not exist! Exitting."%(file)
-        sys.exit()
+    files = {}
+    for region in args.region :
+        files[region] = sysDir + "sys_uncert_" + region + ".txt"
+        if not os.path.isfile(files[region]) :
+            print "ERROR: File (%s) for the systematic uncertainty for the requested region does not exist! Exitting."%(files[region])
+            sys.exit()
 
     print "-----------------------------------"
     print " Plotting systematic uncertainty   "
     print " for region                        "
-    print "         > %s                      "%region
+    for region in args.region :
+        print "         > %s                      "%region
     print "-----------------------------------"
 
-    # load the file and the signal points along with it
-    sigpoints = fill_signal_points(file)
-
     # style it up boy-eee
     setAtlasStyle()
 
-    # now draw the plot
-    make_sig_sys_plots(sigpoints)
+    # the signal points are triangulated once for all of the regions
+    interpolators = InterpolationCache(persistent=not args.no_cache, dbg=dbg)
+
+    for region in args.region :
+        # load the file and the signal points along with it
+        sigpoints = fill_signal_points(files[region])
+
+        # now draw the plot
+        make_sig_sys_plots(sigpoints, region, interpolators)
    
 
 
@@ -2,10 +2,7 @@
 regions=(eeSuper1a eeSuper1b eeSuper1c mmSuper1a mmSuper1b mmSuper1c emSuper1a emSuper1b emSuper1c)
 grids=(SMCwslep)
 
-for g in ${grids[@]}
-do
-    for region in ${regions[@]}
-    do
-        ./make_acc_and_eff_plots.py -r ${region} -g ${g} -o "plots/exA_plots_${g}" 
-    done
-done
+# all regions and grids are done in one go: each signal point
+# is loaded once and the yields of every region are computed
+# in a single pass over its ntuple
+./make_acc_and_eff_plots.py -r ${regions[@]} -g ${grids[@]} -o "plots/exA_plots_{grid}" "$@"
@@ -10,6 +10,10 @@
 # superplotter
 from superplotter.signal import *
 from superplotter.region import *
+from superplotter.yields import get_multi_weight_yields
+from superplotter.cache import EntryListCache
+from superplotter.results import results_path, save_results, load_results
+from superplotter import profiling
 
 # ROOT
 import ROOT
@@ -37,6 +41,11 @@ class Point(Signal) :
         self.nom_yield = {}
         # statistical error indexed by region
         self.stat_err = {}
+        # yield without the c1c1 (isr) re-weighting indexed by region
+        self.unw_yield = {}
+        # statistical error on the yield without the c1c1
+        # re-weighting indexed by region
+        self.unw_stat_err = {}
         # ISR uncertainty +1 sigma indexed by region
         # store the up variation as var - nominal
         self.sys_err_up = {}
@@ -142,80 +151,89 @@ def myBook2d(name, nxbin, xlow, xhigh, nybin, ylow, yhigh) :
     h = ROOT.TH2F(name, name, nxbin, xlow, xhigh, nybin, ylow, yhigh)
     return h
 
-def get_nom_yields(signals, srs, c1c1=False) :
+def get_sub_regions(srs) :
+    '''
+    All of the sub-regions (e.g. eeSuper1a, mmSuper1a, emSuper1a)
+    that make up the requested base regions (e.g. Super1a)
+    '''
+    return [reg for reg in sorted(regions.keys()) if any(sr in reg for sr in srs)]
+
+# the event weights accumulated for each point, all in one pass of its tree
+isr_weights = {}
+isr_weights['unweighted'] = "eventweight / isr_weight_nom"
+isr_weights['nominal']    = "eventweight" # isr combined eventweight
+isr_weights['up']         = "eventweight * syst_ISRUP"
+isr_weights['down']       = "eventweight * syst_ISRDOWN"
+
+def get_yields(signals, srs, cache=None) :
     '''
     Get the signal region yields for each point in "signals"
-    
-    If c1c1=True, uses the eventweight that contains the 
-    isr reweight.
+    without and with the c1c1 (isr) re-weighting, along with
+    the variations w.r.t. to nominal for the ISR systematic.
+    All of the weights and sub-regions are filled in a single
+    pass over each point's tree.
     '''
+    sub_regions = get_sub_regions(srs)
+    yields = []
+    for s in signals :
+        with profiling.point(s.dsid) :
+            yields.append(get_multi_weight_yields(s.tree, isr_weights, sub_regions, cache=cache, source=s.file))
     for sr in srs :
         if(dbg) : print "\n" # because i said so
-        for s in signals :
-            tot_integral = 0.0
-            tot_stat = 0.0
-            for reg in regions.keys() :
+        for i, s in enumerate(signals) :
+            tot = dict((key, 0.0) for key in isr_weights)
+            tot_stat = dict((key, 0.0) for key in isr_weights)
+            for reg in sub_regions :
                 if sr in reg :
-                    selection = regions[reg]
-                    weight = ""
-                    if c1c1 : weight = "eventweight"
-                    elif not c1c1 : weight = "eventweight / isr_weight_nom"
-                    h = myBook("hist", 4, -1, 3, "isMC", "entries")
-                    h.Reset("ICE")
-                    cmd = "isMC>>"+str(h.GetName())
-                    cut = "(%s) * %s"%(selection, weight)
-                    s.tree.Draw(cmd, cut)
-                    
-                    integral = 0.0
-                    error = ROOT.Double(0.0)
-                    integral = h.IntegralAndError(0,-1,error)
-                    tot_integral += integral
-                    tot_stat += error * error
-                    h.Delete()
-            tot_stat = math.sqrt(tot_stat)
-            s.nom_yield[sr] = tot_integral
-            s.stat_err[sr] = tot_stat
-            if(dbg and c1c1) : print "%s    (%s,%s) (weighted) %.2f +/- %.2f"%(sr, s.mX, s.mY, s.nom_yield[sr], s.stat_err[sr])
-            if(dbg and not c1c1) : print "%s    (%s,%s) (unweighted) %.2f +/- %.2f"%(sr, s.mX, s.mY, s.nom_yield[sr], s.stat_err[sr])
-            
-                    
-def get_isr_error(signals, srs, up_or_down="") :
+                    for key in isr_weights :
+                        integral, sumw2 = yields[i][key][reg]
+                        tot[key] += integral
+                        tot_stat[key] += sumw2
+            s.unw_yield[sr] = tot['unweighted']
+            s.unw_stat_err[sr] = math.sqrt(tot_stat['unweighted'])
+            s.nom_yield[sr] = tot['nominal']
+            s.stat_err[sr] = math.sqrt(tot_stat['nominal'])
+            s.sys_err_up[sr] = float(tot['up']) - float(s.nom_yield[sr])
+            # store the values as positive-valued
+            # remember this for later!
+            s.sys_err_dn[sr] = float(s.nom_yield[sr]) - float(tot['down'])
+            if(dbg) : print "%s    (%s,%s) (unweighted) %.2f +/- %.2f"%(sr, s.mX, s.mY, s.unw_yield[sr], s.unw_stat_err[sr])
+            if(dbg) : print "%s    (%s,%s) (weighted) %.2f +/- %.2f"%(sr, s.mX, s.mY, s.nom_yield[sr], s.stat_err[sr])
+
+# the per-region numbers of a Point kept in the results store
+point_yields = [ 'unw_yield', 'unw_stat_err', 'nom_yield', 'stat_err', 'sys_err_up', 'sys_err_dn' ]
+
+def points_to_arrays(points, srs) :
     '''
-    Get the variation w.r.t. to nominal for the ISR
-    systematic
+    The yields of the points as the 'isr_yields' product
+    of superplotter.results
     '''
-    for sr in srs :
-        if(dbg) : print "\n" # because i said so
-        for s in signals :
-            tot_integral = 0.0
-            tot_sys = 0.0
-            for reg in regions.keys() :
-                if sr in reg :
-                    selection = regions[reg]
-                    weight = "eventweight" # isr combined eventweight 
-                    if up_or_down == "up" : weight += " * syst_ISRUP"
-                    elif up_or_down == "down" : weight += " * syst_ISRDOWN"
-                    h = myBook("hist", 4, -1, 3, "isMC", "entries")
-                    h.Reset("ICE")
-                    cmd = "isMC>>"+str(h.GetName())
-                    cut = "(%s) * %s"%(selection, weight)
-                    s.tree.Draw(cmd, cut)
-                    
-                    integral = 0.0
-                    error = ROOT.Double(0.0)
-                    integral = h.IntegralAndError(0,-1,error)
-                    
-                    tot_integral += integral
-                    
-                    h.Delete()
-            if up_or_down == "up" :
-                s.sys_err_up[sr] = float(tot_integral) - float(s.nom_yield[sr])
-            elif up_or_down == "down" :
-                # store the values as positive-valued
-                # remember this for later!
-                s.sys_err_dn[sr] = float(s.nom_yield[sr]) - float(tot_integral)
-
-def make_isr_pullplots(unw, isr, srs) :
+    arrays = {}
+    arrays['dsid'] = numpy.array([s.dsid for s in points], dtype=numpy.str_)
+    arrays['mX'] = numpy.array([s.mX for s in points], dtype=numpy.float64)
+    arrays['mY'] = numpy.array([s.mY for s in points], dtype=numpy.float64)
+    arrays['regions'] = numpy.array(srs, dtype=numpy.str_)
+    for name in point_yields :
+        arrays[name] = numpy.array([[getattr(s, name)[sr] for sr in srs] for s in points], dtype=numpy.float64)
+    return arrays
+
+def points_from_arrays(arrays, grid, dbg=False) :
+    '''
+    Points (without trees) holding the yields stored by points_to_arrays
+    '''
+    srs = [str(sr) for sr in arrays['regions']]
+    points = []
+    for i in xrange(len(arrays['dsid'])) :
+        s = Point("", grid, dbg)
+        s.dsid = str(arrays['dsid'][i])
+        s.mX = float(arrays['mX'][i])
+        s.mY = float(arrays['mY'][i])
+        for name in point_yields :
+            setattr(s, name, dict((sr, float(arrays[name][i][j])) for j, sr in enumerate(srs)))
+        points.append(s)
+    return points
+
+def make_isr_pullplots(points, srs) :
     thisr="Super1c"
 
     isrcan = ISRCanvas("isrcan")
@@ -225,8 +243,8 @@ def make_isr_pullplots(unw, isr, srs) :
     isrcan.lower_pad.cd()
     isrcan.lower_pad.SetGrid(1,0)
 
-    h_yld = ROOT.TH2F("h_yld", "", len(unw), 0, len(unw), len(srs)+1, 0, len(srs)+1)
-    for i, s in enumerate(unw) :
+    h_yld = ROOT.TH2F("h_yld", "", len(points), 0, len(points), len(srs)+1, 0, len(srs)+1)
+    for i, s in enumerate(points) :
         h_yld.GetXaxis().SetBinLabel(i+1, "(%.1f, %.1f)"%(s.mX,s.mY))
     h_yld.GetYaxis().SetBinLabel(1, "")
     h_yld.GetYaxis().SetBinLabel(2, "")
@@ -238,22 +256,22 @@ def make_isr_pullplots(unw, isr, srs) :
     
     width = h_yld.GetXaxis().GetBinWidth(1)
     h_yld.Draw()
-    draw_line(0.0, 1.0, len(unw), 1.0, color=ROOT.kBlack)
+    draw_line(0.0, 1.0, len(points), 1.0, color=ROOT.kBlack)
     isrcan.canvas.Update() 
       
     draw_text(0.015,0.22,ROOT.kBlack,"unweighted",angle=75,size=0.08)
     draw_text(0.015,0.49,ROOT.kBlack,"re-weighted",angle=75,size=0.08)
     isrcan.canvas.Update()
 
-    for i, s in enumerate(unw) :
-        t_u = " %.1f"%s.nom_yield[thisr]
-        t_l = "#pm%.1f"%s.stat_err[thisr]
+    for i, s in enumerate(points) :
+        t_u = " %.1f"%s.unw_yield[thisr]
+        t_l = "#pm%.1f"%s.unw_stat_err[thisr]
         print float(i+0.02)/20.0
         draw_text(i+0.1,0.54,text=t_u, color=ROOT.kBlack,ndc=False,size=0.07, font=42)
         draw_text(i+0.1,0.05,text=t_l, color=ROOT.kBlack,ndc=False,size=0.07, font=42)
         isrcan.canvas.Update()
         
-    for i, s in enumerate(isr) :
+    for i, s in enumerate(points) :
         t_u = "%.1f"%s.nom_yield[thisr]
         t_s = "#pm%.1f"%s.stat_err[thisr]
         t_sys = "#pm%.1f"%s.sym_err(thisr)
@@ -274,14 +292,14 @@ def make_isr_pullplots(unw, isr, srs) :
     ROOT.gStyle.SetHatchesLineWidth(1)
 
     ratios = []
-    for i, s in enumerate(unw) :
-        unw_yld = unw[i].nom_yield[thisr]
-        isr_yld = isr[i].nom_yield[thisr]
+    for i, s in enumerate(points) :
+        unw_yld = s.unw_yield[thisr]
+        isr_yld = s.nom_yield[thisr]
         ratio = isr_yld / unw_yld
         ratios.append(ratio)
 
-        er_unw = unw[i].stat_err[thisr]
-        er_isr = isr[i].total_error(thisr)
+        er_unw = s.unw_stat_err[thisr]
+        er_isr = s.total_error(thisr)
         ratio_err = ( er_unw / unw_yld ) ** 2 + ( er_isr / isr_yld ) ** 2
         ratio_err = math.sqrt(ratio_err)
         ratio_err *= ratio
@@ -310,8 +328,8 @@ def make_isr_pullplots(unw, isr, srs) :
     draw_line(0.89, 0.77, 0.93, 0.77, ROOT.kRed, ndc=True)
     isrcan.canvas.Update()
     average_ratio = numpy.mean(ratios)
-    draw_line(0.0, average_ratio, len(unw), average_ratio, color=ROOT.kRed)
-    draw_line(0.0, 1.0, len(unw), 1.0, color=ROOT.kBlue)
+    draw_line(0.0, average_ratio, len(points), average_ratio, color=ROOT.kRed)
+    draw_line(0.0, 1.0, len(points), 1.0, color=ROOT.kBlue)
     print average_ratio
 
 
@@ -325,61 +343,62 @@ if __name__=="__main__" :
     parser = argparse.ArgumentParser()
     parser.add_argument("-p", "--printout", action="store_true", default=False, help="Set whether to just print out the table (and not save it to file)")
     parser.add_argument("-d", "--dbg", action="store_true", default=False, help="Set the verbose level true")
+    parser.add_argument("--no-cache", action="store_true", default=False, help="Do not use the cache of selected entries")
+    parser.add_argument("--cache-dir", default="", help="Directory of the cache of selected entries (default: $SUPERPLOTTER_CACHE_DIR/entrylists, ~/.superplotter_cache/entrylists if it is not set)")
+    parser.add_argument("--from-cache", action="store_true", default=False, help="Only re-draw the plots from the stored results of a previous run (no ntuples are read)")
+    parser.add_argument("--profile", default="", help="Time the stages of the run and write the report to <profile>.json and <profile>.csv")
+    parser.add_argument("--results-dir", default="", help="Directory of the stored results (default: $SUPERPLOTTER_RESULTS_DIR or ./results)")
     args = parser.parse_args()
     global dbg
     printout = args.printout
     dbg = args.dbg
-
-    # grab the files
-    indir = '/gdata/atlas/dantrim/SusyAna/histoAna/TAnaOutput/SMCwslep/S0_May13/Raw/'
-    files = glob.glob(indir + "CENTRAL*root")
-    
-    # container for signal points without isr reweighting
-    unw_signals = []
-    # container for signal points with isr reweighting
-    isr_signals = []
-    for file in files :
-        s = Point(file, "SMCwslep", dbg)
-        s.get_tree()
-        s.fill_mass_info()
-        if s.mX > 200 : continue  # compare points in low mass region only
-        unw_signals.append(s)
-        
-        r = Point(file, "SMCwslep", dbg)
-        r.get_tree()
-        r.fill_mass_info()
-        if r.mX > 200 : continue  # compare points in low mass region only
-        isr_signals.append(r)
-    
-    if len(unw_signals) != len(isr_signals) :
-        print "WARNING    Unequal number of 'unweighted' signals and c1c1 re-weighted signals! Exitting."
-        sys.exit()
-    print " >>> %s unweighted signal points and %s c1c1 weighted signal points loaded"%(len(unw_signals), len(isr_signals))
-       
-
-    # sort the signal points by mC1
-    sort_by_mc1(unw_signals)
-    sort_by_mc1(isr_signals)
+    if args.profile : profiling.enable()
 
     # regions 
     srs = [ 'Super1a', 'Super1c' ] 
 
-    # get nominal yields and stat errors
-    get_nom_yields(unw_signals, srs, c1c1=False)
-    get_nom_yields(isr_signals, srs, c1c1=True)
+    results = results_path('isr_yields', "SMCwslep", args.results_dir)
+    if args.from_cache :
+        points = points_from_arrays(load_results(results, 'isr_yields')[0], "SMCwslep", dbg)
+        print " >>> %s signal points read from %s"%(len(points), results)
+    else :
+        # grab the files
+        indir = '/gdata/atlas/dantrim/SusyAna/histoAna/TAnaOutput/SMCwslep/S0_May13/Raw/'
+        files = glob.glob(indir + "CENTRAL*root")
+        
+        # container for signal points, each holding the yields both 
+        # with and without isr reweighting
+        points = []
+        for file in files :
+            s = Point(file, "SMCwslep", dbg)
+            s.get_tree()
+            s.fill_mass_info()
+            if s.mX > 200 : continue  # compare points in low mass region only
+            points.append(s)
+        print " >>> %s signal points loaded"%(len(points))
+
+        # get yields and stat errors with and without the isr reweighting
+        # and the up/down variations w.r.t. to the ISR uncertainty
+        # (applied only to the isr weighted yields!)
+        cache = None
+        if not args.no_cache : cache = EntryListCache(args.cache_dir, dbg)
+        get_yields(points, srs, cache)
+        save_results(results, 'isr_yields', points_to_arrays(points, srs))
+        print " >>> yields stored in %s"%results
 
-    # get the up/down variations w.r.t. to the ISR uncertainty
-    # apply only to the isr weighted signals!
-    get_isr_error(isr_signals, srs, "up")
-    get_isr_error(isr_signals, srs, "down")
+    # sort the signal points by mC1
+    sort_by_mc1(points)
 
     if(dbg) :
         for reg in srs :
             print "\n"
-            for s in isr_signals :
+            for s in points :
                 sym_sys = 0.5*(abs(s.sys_err_up[reg])+abs(s.sys_err_dn[reg]))
                 per_sys = 100. * sym_sys / s.nom_yield[reg]
                 print "%s   (%s,%s): %.2f +/- %.2f +/- %.2f (+%.2f, -%.2f) (sys: %.2f percent)"%(reg, s.mX, s.mY, s.nom_yield[reg], s.stat_err[reg], sym_sys,s.sys_err_up[reg], s.sys_err_dn[reg], per_sys)
 
     # now we have all of the information to make the plots
-    make_isr_pullplots(unw_signals, isr_signals, srs)
+    with profiling.stage("draw") :
+        make_isr_pullplots(points, srs)
+
+    profiling.finish(args.profile)
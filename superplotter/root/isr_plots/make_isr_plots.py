@@ -4,6 +4,13 @@ from superplotter.region import *
 from superplotter.signal import *
 from superplotter.utils import *
 from superplotter.plot_utils import *
+from superplotter.cache import EntryListCache
+from superplotter.histogram import Hist1D, fill_histogram_set_from_tree
+from superplotter.variables import isr_variables
+from superplotter.parallel import run_jobs
+from superplotter.results import results_path, save_results, load_results, default_results_dir
+from superplotter.render import render_jobs, DEFAULT_FORMATS
+from superplotter import profiling
 
 import array 
 
@@ -17,71 +24,74 @@ import ROOT as r
 r.gROOT.SetBatch(True)
 r.PyConfig.IgnoreCommandLineOptions = True
 
-def make_isr_plots(signals, v, outdir) :
-    ytitle = "entries"
-    xtite = ""
-    var = ""
-    bins = []
-    nb = 0
-    nb = xlow = xhigh = 0
-    if v=="lept1Pt" :
-        xtitle = "p_{T}^{lead lep} [GeV]"
-        var = "lept1Pt"
-        nb, xlow, xhigh = 15, 10, 100
-    elif v=="lept2Pt" :
-        xtitle = "p_{T}^{sub-lead lep} [GeV]"
-        var = "lept2Pt"
-        nb, xlow, xhigh = 8, 10, 90
-    elif v=="mDeltaR" :
-        xtitle = "M_{#Delta}^{R} [GeV]"
-        var = "mDeltaR"
-        nb, xlow, xhigh = 8, 0, 80
-    elif v=="jet1Pt" :
-        xtitle = "p_{T}^{lead jet} [GeV]"
-        var = "jet1Pt"
-        nb, xlow, xhigh = 10, 20, 200
-    elif v=="mll" :
-        xtitle = "m_{ll} [GeV]"
-        var = "mll"
-        nb, xlow, xhigh = 11, 20, 240
-    elif v=="dpb" :
-        var='dphi_ll_vBetaT'
-        xtitle = "#Delta#phi_{#beta}^{R}"
-        nb, xlow, xhigh = 10, 0, 3.0
-    elif v=="R2" :
-        var = 'R2'
-        xtitle = "R_{2}"
-        nb, xlow, xhigh = 10, 0, 1.0
-    elif v=="met" :
-        var = 'met' 
-        xtitle = "E_{T}^{miss} [GeV]"
-        nb, xlow, xhigh = 15, 0, 175
-    elif v=="njets" :
-        var = 'nCentralLightJets'
-        xtitle = "N_{jets}^{CL20}"
-        nb, xlow, xhigh = 5, 0, 5
-    elif v=="pTll" :
-        var = "pTll"
-        xtitle = "p_{T}^{ll} [GeV]"
-        nb, xlow, xhigh = 12, 10, 80
-       
-    h_nom       = myTH1F("herwig",          "herwig",               nb, xlow, xhigh, xtitle, ytitle)
-    h_isr_nom   = myTH1F("herwig+isr",      "+ isr reweight",       nb, xlow, xhigh, xtitle, ytitle)
-    h_up        = myTH1F("herwig+isrUP",    "+ isr reweight +1#sigma",      nb, xlow, xhigh, xtitle, ytitle)
-    h_down      = myTH1F("herwig+isrDOWN",  "+ isr reweight -1#sigma",    nb, xlow, xhigh, xtitle, ytitle)
-    
-    colors = {}
-    colors["herwig"] = r.kBlack
-    colors["herwig+isr"] = r.kGreen
-    colors["herwig+isrUP"] = r.kBlue
-    colors["herwig+isrDOWN"] = r.kRed
-    h_nom.SetLineColor(r.kBlack)
-    h_isr_nom.SetLineColor(r.kGreen)
-    h_up.SetLineColor(r.kBlue)
-    h_down.SetLineColor(r.kRed)
-    
-    canvas = r.TCanvas("can","can",768,768)
-    canvas.SetLogy(True)
+# the weightings compared in the plots
+isr_weights = { "herwig"         : "eventweight/isr_weight_nom",
+                "herwig+isr"     : "eventweight",
+                "herwig+isrUP"   : "eventweight*syst_ISRUP",
+                "herwig+isrDOWN" : "eventweight*syst_ISRDOWN" }
+isr_titles  = { "herwig"         : "herwig",
+                "herwig+isr"     : "+ isr reweight",
+                "herwig+isrUP"   : "+ isr reweight +1#sigma",
+                "herwig+isrDOWN" : "+ isr reweight -1#sigma" }
+isr_colors  = { "herwig"         : r.kBlack,
+                "herwig+isr"     : r.kGreen,
+                "herwig+isrUP"   : r.kBlue,
+                "herwig+isrDOWN" : r.kRed }
+
+# the selection of the events in the plots
+isr_selection = "(isOS==1 && lept1Pt>10000. && lept2Pt>10000. && lept1Eta<2.5 && lept2Eta<2.5)"
+
+def fill_isr_histograms(signal, vars, cache=None) :
+    '''
+    Fill the histograms of each of the variables "vars" (names in
+    superplotter.variables.isr_variables) of the signal point with
+    each of the isr_weights, all of them in one pass over the tree
+    (with root_numpy or with TTree::Draw).
+    Returns { variable : { name : Hist1D } }
+    '''
+    hists = dict((v, {}) for v in vars)
+    expressions = dict((v, (isr_variables[v].expression(), isr_variables[v].book())) for v in vars)
+    filled = fill_histogram_set_from_tree(signal.tree, isr_selection, expressions, isr_weights,
+                                          cache=cache, source=signal.file)
+    for (v, name), h in filled.items() :
+        hists[v][name] = h
+    return hists
+
+def fill_point(job) :
+    '''
+    Fill the histograms of a single signal point (possibly in a worker
+    process). Returns the point's dsid and masses and its histograms
+    as { "variable/name" : Hist1D dictionary }
+    '''
+    file, vars, cache_dir = job
+    s = Signal(file, "SMCwslep", False)
+    s.fill_mass_info()
+    cache = None
+    if cache_dir is not None : cache = EntryListCache(cache_dir)
+    with profiling.point(s.dsid) :
+        hists = fill_isr_histograms(s, vars, cache)
+    s.release_tree()
+    return { 'dsid' : s.dsid, 'mX' : s.mX, 'mY' : s.mY,
+             'hists' : dict(("%s/%s"%(v, name), h.to_dict()) for v in vars for name, h in hists[v].items()) }
+
+def isr_plot_job(point, v) :
+    '''
+    The (picklable) description of the plot of variable "v" of
+    a signal point (as returned by fill_point), see draw_isr_plot
+    '''
+    return { 'v' : v, 'var' : isr_variables[v].branch, 'mX' : point['mX'], 'mY' : point['mY'],
+             'hists' : dict((name, point['hists']["%s/%s"%(v, name)]) for name in isr_weights) }
+
+def draw_isr_plot(job) :
+    '''
+    Draw the ISR comparison plot described by "job" (see isr_plot_job).
+    Returns the canvas and the name of the output file (without extension)
+    '''
+    v, var, mX, mY = job['v'], job['var'], job['mX'], job['mY']
+    hists = dict((name, Hist1D.from_dict(d)) for name, d in job['hists'].items())
+    xtitle = hists["herwig"].xtitle
+    tag = "%s_%s_%s"%(var, mX, mY)
+
     if v=="dpb" :
         leg = r.TLegend(0.2, 0.69, 0.53, 0.93)
     else :
@@ -91,34 +101,22 @@ def make_isr_plots(signals, v, outdir) :
     leg.SetLineWidth(0)
     leg.SetTextFont(42)
     leg.SetFillStyle(0)
-    leg_name = "(%s,%s)"%(signals[0].mX,signals[0].mY)
+    leg_name = "(%s,%s)"%(mX,mY)
     leg.SetHeader(leg_name)
-    
-    for h in [h_nom, h_isr_nom, h_up, h_down] :
+
+    h_nom       = hists["herwig"].to_th1f("herwig_"+tag)
+    h_isr_nom   = hists["herwig+isr"].to_th1f("herwig+isr_"+tag)
+    h_up        = hists["herwig+isrUP"].to_th1f("herwig+isrUP_"+tag)
+    h_down      = hists["herwig+isrDOWN"].to_th1f("herwig+isrDOWN_"+tag)
+    for name, h in zip(["herwig", "herwig+isr", "herwig+isrUP", "herwig+isrDOWN"], [h_nom, h_isr_nom, h_up, h_down]) :
+        h.SetTitle(isr_titles[name])
+        h.SetLineColor(isr_colors[name])
         h.SetLineWidth(2)
         h.GetYaxis().SetTitleOffset(1.1*h.GetYaxis().GetTitleOffset())
-        sel = r.TCut("(isOS==1 && lept1Pt>10000. && lept2Pt>10000. && lept1Eta<2.5 && lept2Eta<2.5)")
-        weight = ""
-        if h.GetName()=="herwig" :
-            weight = r.TCut("eventweight/isr_weight_nom")
-        elif h.GetName()=="herwig+isr" :
-            weight = r.TCut("eventweight")
-        elif h.GetName()=="herwig+isrUP" :
-            weight = r.TCut("eventweight*syst_ISRUP")
-        elif h.GetName()=="herwig+isrDOWN" :
-            weight = r.TCut("eventweight*syst_ISRDOWN")
-        
-        cmd = ''
-        if v=='dpb' or v=='R2' or v=='njets':
-            cmd = var+">>"+h.GetName()
-        else :
-            cmd = var+"/1000>>"+h.GetName() 
-        signals[0].tree.Draw(cmd, sel*weight) 
         leg.AddEntry(h,h.GetTitle(),"l")
     
     # ratio
-    ratio = RatioCanvas("rcan")
-    print ratio
+    ratio = RatioCanvas("rcan_"+tag)
     ratio.canvas.cd()
     ratio.upper_pad.cd()
     h_nom.Draw("hist e")
@@ -128,9 +126,9 @@ def make_isr_plots(signals, v, outdir) :
     if v=="dpb" or v=="lept2Pt" or v=="lept1Pt" or v=="mDeltaR" or v=="mll" or v=="pTll" :
         h_nom.GetYaxis().SetRangeUser(0, 1.3*h_nom.GetMaximum())
     
-    h_ratio_nom_up = divide_histograms (h_up,       h_nom,  xtitle, "#frac{weighted}{un-weighted}")
-    h_ratio_nom_dn = divide_histograms (h_down,     h_nom,  "", "")
-    h_ratio_nom_isr = divide_histograms(h_isr_nom,  h_nom,  "", "")
+    h_ratio_nom_up = style_ratio_histogram(hists["herwig+isrUP"].divide(hists["herwig"]).to_th1f("ratio_up_"+tag), xtitle, "#frac{weighted}{un-weighted}")
+    h_ratio_nom_dn = style_ratio_histogram(hists["herwig+isrDOWN"].divide(hists["herwig"]).to_th1f("ratio_dn_"+tag), "", "")
+    h_ratio_nom_isr = style_ratio_histogram(hists["herwig+isr"].divide(hists["herwig"]).to_th1f("ratio_isr_"+tag), "", "")
     h_nom.GetXaxis().SetLabelOffset(999)
     h_nom.GetXaxis().SetTitleOffset(999)
     h_nom.GetYaxis().SetTitleOffset(0.9*h_nom.GetYaxis().GetTitleOffset())
@@ -144,7 +142,7 @@ def make_isr_plots(signals, v, outdir) :
         yl, yh = 0.7, 2.4
     elif v=="R2" :
         yl, yh = 0.7, 2.4
-    elif v=="pTll" and signals[0].mY==80 :
+    elif v=="pTll" and mY==80 :
         yl, yh = 0.7, 2.4
     h_ratio_nom_up.GetYaxis().SetRangeUser(yl,yh)
     h_ratio_nom_up.SetLineColor(r.kBlue)
@@ -163,9 +161,11 @@ def make_isr_plots(signals, v, outdir) :
 
     ratio.upper_pad.cd()
     leg.Draw('same')
-    outname = var+"_sr_"+str(signals[0].mX)+"_"+str(signals[0].mY)+".eps"
-    ratio.canvas.SaveAs(outname)
-    mv_file_to_dir(outname, str(outdir), True)
+    # keep the drawn objects alive until the canvas is saved
+    ratio.canvas._drawn = [ratio, leg, h_nom, h_isr_nom, h_up, h_down,
+                           h_ratio_nom_up, h_ratio_nom_dn, h_ratio_nom_isr]
+    outname = var+"_sr_"+str(mX)+"_"+str(mY)
+    return ratio.canvas, outname
     
 #################################        
 if __name__=="__main__" :
@@ -173,34 +173,65 @@ if __name__=="__main__" :
     parser.add_argument("-i", "--input", help="Input dataset")
     parser.add_argument("-o", "--outdir", help="Store the plots in this directory (default: plots/")
     parser.add_argument("-v", "--var", help="Choose the var to print",default="")
+    parser.add_argument("--no-cache", action="store_true", default=False, help="Do not use the cache of selected entries")
+    parser.add_argument("--cache-dir", default="", help="Directory of the cache of selected entries (default: $SUPERPLOTTER_CACHE_DIR/entrylists, ~/.superplotter_cache/entrylists if it is not set)")
+    parser.add_argument("--from-cache", action="store_true", default=False, help="Only re-draw the plots from the stored results of a previous run (no ntuples are read)")
+    parser.add_argument("--results-dir", default="", help="Directory of the stored results (default: $SUPERPLOTTER_RESULTS_DIR or ./results)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of worker processes filling and drawing the plots (default: 1)")
+    parser.add_argument("--profile", default="", help="Time the stages of the run and write the report to <profile>.json and <profile>.csv")
+    parser.add_argument("-f", "--formats", nargs="+", default=DEFAULT_FORMATS, help="Formats the plots are saved in (default: %s)"%" ".join(DEFAULT_FORMATS))
     args = parser.parse_args()
     input = args.input
     outdir = args.outdir
     var = args.var
+    if args.profile : profiling.enable()
     # check whether requested region is available
     print "--------------------------------------"
     print " Plotting ISR                         "
     print "- - - - - - - - - - - - - - - - - - - "
     print "  input :    %s                       "%(input)
     print "  outdir:    %s                       "%(outdir)
+    print "  formats:   %s                       "%(" ".join(args.formats))
     print "--------------------------------------\n"
 
 
-    files = glob.glob(input + "CENTRAL*root")
-    print files
-    signals = []
-    for file in files :
-        s = Signal(file, "SMCwslep", False)
-        s.get_tree()
-        s.fill_mass_info()
-        signals.append(s)
-
-    setAtlasStyle()
-    vars = [ 'lept1Pt', 'lept2Pt', 'mDeltaR', 'jet1Pt',
-             'mll', 'dpb', 'R2', 'met', 'njets', 'pTll' ]
+    vars = isr_variables.keys()
     if var != "" :
-        make_isr_plots(signals, str(var), outdir)
+        if var not in isr_variables :
+            print "Variable '%s' not supported! Available variables are: %s"%(var, " ".join(isr_variables.keys()))
+            sys.exit()
+        vars = [ str(var) ]
+
+    files = sorted(glob.glob(input + "CENTRAL*root"))
+    print " >>> %d signal points"%len(files)
+
+    # fill the histograms of all of the points (one pass over each tree),
+    # or read them back from the stored results
+    cache_dir = None
+    if not args.no_cache : cache_dir = args.cache_dir
+    points = []
+    if args.from_cache :
+        for file in files :
+            s = Signal(file, "SMCwslep", False)
+            arrays, stored = load_results(results_path('isr_hists', s.dsid, args.results_dir), 'isr_hists')
+            missing = [v for v in vars if not all("%s/%s"%(v, name) in stored for name in isr_weights)]
+            if missing :
+                print "Variables %s of point %s are not in the stored results, re-run without --from-cache"%(missing, s.dsid)
+                sys.exit()
+            points.append({ 'dsid' : s.dsid, 'mX' : float(arrays['mX'][0]), 'mY' : float(arrays['mY'][0]),
+                            'hists' : dict((key, h.to_dict()) for key, h in stored.items()) })
     else :
-        for v in vars :
-            make_isr_plots(signals, str(v), outdir)
-    
+        points = run_jobs(fill_point, [(file, vars, cache_dir) for file in files], args.jobs)
+        for point in points :
+            hists = dict((key, Hist1D.from_dict(d)) for key, d in point['hists'].items())
+            arrays = { 'dsid' : [point['dsid']], 'mX' : [point['mX']], 'mY' : [point['mY']], 'vars' : vars }
+            save_results(results_path('isr_hists', point['dsid'], args.results_dir), 'isr_hists', arrays, hists)
+        print " >>> histograms stored in %s"%(args.results_dir if args.results_dir else default_results_dir())
+
+    jobs = [isr_plot_job(point, v) for point in points for v in vars]
+
+    # draw each plot once, saving it in all of the formats
+    saved = render_jobs(draw_isr_plot, jobs, outdir, args.formats, args.jobs, style=setAtlasStyle)
+    print "Saved %d plots"%sum(len(files) for files in saved)
+
+    profiling.finish(args.profile)
@@ -17,6 +17,16 @@ import sys
 import glob
 import argparse
 import math
+import json
+import csv
+
+from superplotter.systable import load_systable
+from superplotter.parallel import run_jobs
+from superplotter import profiling
+
+# verbosity, and whether parsed tables are cached (set from the command line)
+dbg = False
+use_cache = True
 
 ############################################
 # These are the systematic groupings
@@ -47,16 +57,22 @@ systematics_by_group['Non-prompt leptons'] = [ 'Fake\_RelUnc' ]
 systematics_by_group['Luminosity'] = [ 'Lumi' ]
 ############################################
 
+# the base regions and the sub-regions they are made of
+base_regions = [ "Super1a", "Super1b", "Super1c" ]
+# flavour prefixes of the sub-regions: same-flavour and different-flavour
+# tables by default, or one table per flavour
+default_flavours = [ "sf", "em" ]
+per_flavour_flavours = [ "ee", "mm", "em" ]
+
 class Region :
     '''
     Keep track of which regions to gather
     '''
-    def __init__(self, region) :
+    def __init__(self, region, flavours=default_flavours) :
+        self.name = region
         self.regions = []
-        if region=="Super1a" :
-            self.regions = [ "sfSuper1a", "emSuper1a" ]
-        elif region=="Super1c" :
-            self.regions = [ "sfSuper1c", "emSuper1c" ]
+        if region in base_regions :
+            self.regions = [ flavour + region for flavour in flavours ]
         else :
             print "Region initialization error: requested region not supported. Exitting."
             sys.exit()
@@ -81,7 +97,11 @@ class Region :
         for sr in self.regions :
             self.table_files += glob.glob(texdir + "*%s*.tex"%sr)
         for table in self.table_files :
-            print "collect_systables     table at %s"%table
+            if dbg : print "collect_systables     table at %s"%table
+
+    def missing_tables(self) :
+        ''' The sub-regions for which no table was found '''
+        return [reg for reg in self.regions if get_table(reg, self) is None]
         
             
 
@@ -130,24 +150,6 @@ def get_table(reg, region_) :
         if reg in tab :
             return tab
 
-def passline(line) :
-    passes = True
-    if "&" not in line : passes = False  # lines with sys numbers must have & since it is a latex table!
-    if line.startswith("%") : passes = False # ignore any column entries for latex-commented out lines
-    if "(MC)" in line : passes = False
-    return passes
-
-def clean_sys_entry(entry) :
-    '''
-    Grab the systematic variation (in # of events) from this line entry
-    
-    Example line:
-    Top theory/generator uncertainty         & $\pm 19.03\ [25.2\%] $          & $\pm 0.00\ [0.00\%] $          & $\pm 0.00\ [0.00\%] $       \\
-    '''
-    entry = entry[entry.find('pm')+3 : entry.find('pm')+7]
-    return entry
-
-
 def get_systematic(file, sys) :
     '''
     Given the SysTable.tex file and the specific systematic
@@ -155,20 +157,9 @@ def get_systematic(file, sys) :
     variations for each background process (i.e. treat them
     as correlated).
     '''
-    lines = open(file).readlines()
-    for line in lines :
-        if not passline(line) : continue 
-        line = line.strip()
-        fields = line.split("&")
-        if sys.sysname in fields[0] :
-            # the line we are at in the table is the line for the 
-            # systematic we are after. Now add together each 
-            # background process.
-            var = 0.0
-            for process in fields[1:] : # each bkg process is a subsequent column
-                var += float(clean_sys_entry(process))
-            if(dbg) : print "%s: %s"%(sys.sysname, var)
-            return var
+    var = load_systable(file, use_cache).systematic(sys.sysname)
+    if(dbg) : print "%s: %s"%(sys.sysname, var)
+    return var
 
 def fill_systematics(region_) :
     # collect numbers for a single region at a time
@@ -188,17 +179,7 @@ def get_total_exp_mc(file) :
     total background expectation of the signal region
     for which SysTable is made).
     '''
-    lines = open(file).readlines()
-    for line in lines :
-        if "Total background expectation" in line :
-            line = line.strip()
-            fields = line.split("&")
-            total_bkg = 0.0
-            for col in fields[1:] :
-                col = col.replace("$", "")
-                col = col.replace("\\\\","")
-                total_bkg += float(col)
-            return total_bkg
+    return load_systable(file, use_cache).total_expectation()
 
 def get_total_stat_err(file) :
     '''
@@ -210,18 +191,7 @@ def get_total_stat_err(file) :
     Add in quadrature the "mcstat" values for each background
     process.
     '''
-    lines = open(file).readlines()
-    total_stat = 0.0
-    for line in lines :
-        if not passline(line) : continue
-        if 'mcstat' not in line : continue
-        line = line.strip()
-        fields = line.split('&')
-        for entry in fields[1:] :
-            entry = clean_sys_entry(entry)
-            total_stat += float(entry) * float(entry) # each column <==> one bkg process and mcstat are split between bkg processes
-    total_stat = math.sqrt(total_stat)
-    return total_stat
+    return load_systable(file, use_cache).total_stat_err()
 
 def get_total_sys_err(file) :
     '''
@@ -231,21 +201,9 @@ def get_total_sys_err(file) :
     signal region exp. yield for which the SysTable is made).
 
     Add the Total background systematic values for each process
-    in quadature and divide by total mc exp yield.
+    in quadature.
     '''
-    lines = open(file).readlines()
-    total_sys = 0.0
-    for line in lines :
-        if "Total background systematic" in line :
-            line = line.strip()
-            fields = line.split("&")
-            for col in fields[1:] :
-                col = col.replace("$","")
-                col = col.replace("\\\\", "")
-                total_sys += float(clean_sys_entry(col)) * float(clean_sys_entry(col))
-    return math.sqrt(total_sys) 
-        
-        
+    return load_systable(file, use_cache).total_sys_err()
 
 def collect_region_totals(region_) :
     # collect numbers for a single region at a time
@@ -260,27 +218,24 @@ def combine_systematics(region_) :
         for group in region_.groups :
             g_combined = 0.0
             for sys in group.systematics :
+                 if sys.variation[reg] is None : continue # not in this table
                  g_combined += sys.variation[reg] * sys.variation[reg]
             group.combined[reg] = math.sqrt(g_combined)
         
 
 
-#################################################
-if __name__=="__main__" :
-    parser = argparse.ArgumentParser()
-    parser.add_argument("-d", "--texdir", default="", help="Provide the directory containing the .tex SysTables")
-    parser.add_argument("-v", "--verbose", action="store_true", default=False, help="Print out some more goings-on")
-    parser.add_argument("-r", "--region", default="", help="Provide the base region (e.g. Super1)")
-    args = parser.parse_args()
-    global dbg, region
-    dbg = args.verbose
-    base_region = args.region
-    texdir = args.texdir
-
-
-    region_ = Region(base_region)
-    print region_.regions
+def build_region(base_region, texdir, flavours=default_flavours) :
+    '''
+    Gather the tables of a region from "texdir" and fill its
+    systematic groups and totals. Returns the Region, or None if
+    tables of some of its sub-regions are missing.
+    '''
+    region_ = Region(base_region, flavours)
     region_.collect_systables(texdir)
+    missing = region_.missing_tables()
+    if missing :
+        print "build_region     no tables for %s in %s, skipping %s"%(" ".join(missing), texdir, base_region)
+        return None
 
     for group in systematics_by_group.keys() :
         g = Group(group)
@@ -288,7 +243,6 @@ if __name__=="__main__" :
             g.systematics.append(Systematic(sys))
         region_.groups.append(g)
 
-
     # fill the systematics within each group
     fill_systematics(region_)
     # combine the systmeatics within each group
@@ -308,50 +262,105 @@ if __name__=="__main__" :
                 for sys in g.systematics :
                     print "\t{}: {}".format(sys.sysname, sys.variation[r])
                 print "--> combined: %.2f"%g.combined[r]
+    return region_
+
+def region_summary(region_, texdir) :
+    '''
+    The numbers of the summary table of a region as plain data:
+    { 'texdir', 'region', 'sub_regions', 'rows' : [ (contribution, [ value per sub-region ]) ] }
+    '''
+    subs = region_.regions
+    rows = [ (g.groupname, [g.combined[r] for r in subs]) for g in region_.groups ]
+    rows.append(("MC statistics", [region_.total_stat_err[r] for r in subs]))
+    rows.append(("Total", [region_.total_sys_err[r] for r in subs]))
+    rows.append(("Yields (#evt)", [region_.total_bkg_exp[r] for r in subs]))
+    return { 'texdir' : texdir, 'region' : region_.name, 'sub_regions' : subs, 'rows' : rows }
+
+def summarize(job) :
+    '''
+    Summary of one region of one texdir (run in a worker process),
+    None if its tables are missing
+    '''
+    texdir, base_region, flavours = job
+    with profiling.point("%s:%s"%(texdir, base_region)), profiling.stage("build region") :
+        region_ = build_region(base_region, texdir, flavours)
+    if region_ is None : return None
+    return region_summary(region_, texdir)
 
-    ########################################
-    # make table for summary
-    ########################################
+def summary_table(summary) :
+    '''
+    The summary of a region formatted as a text table
+    '''
     col_width = 15
     lstr_col = ('{:<'+str(col_width)+'s}')
     rstr_col = ('{:>'+str(col_width)+'s}')
     num_col  = ('{:>'+str(col_width)+'.2f}')
-    sf_region, df_region = "", ""
-    for r in region_.regions :
-        if "sf" in r : sf_region = r
-        if "df" in r or "em" in r : df_region = r
-    fields = ['contribution', sf_region + " (+/- #evt)", df_region + " (+/- #evt)"]
+    fields = ['contribution'] + [r + " (+/- #evt)" for r in summary['sub_regions']]
     header_template = ' '.join([lstr_col]+[rstr_col for f in fields[1:]])
     line_template   = ' '.join([lstr_col]+[num_col for f in fields[1:]])
-    header = header_template.format(*fields)
     line_break = '-'*(col_width*len(fields)+1*(len(fields)-1))
+    rows = summary['rows']
+    lines = [line_break, header_template.format(*fields), line_break]
+    # groups and MC statistics, then the total and the yields
+    lines += [line_template.format(name, *values) for name, values in rows[:-2]]
+    lines.append(line_break)
+    lines.append(line_template.format(rows[-2][0], *rows[-2][1]))
+    lines.append(line_break)
+    lines.append(line_template.format(rows[-1][0], *rows[-1][1]))
+    lines.append(line_break)
+    return '\n'.join(lines)
+
+def write_summaries(summaries, output) :
+    '''
+    Write the combined summary of all of the regions and texdirs
+    to <output>.txt (text tables), <output>.json and <output>.csv
+    '''
+    outdir = os.path.dirname(output)
+    if outdir and not os.path.isdir(outdir) : os.makedirs(outdir)
+    with open(output + ".txt", 'w') as f :
+        for summary in summaries :
+            f.write("%s  %s\n"%(summary['region'], summary['texdir']))
+            f.write(summary_table(summary) + "\n\n")
+    with open(output + ".json", 'w') as f :
+        json.dump(summaries, f, indent=2, sort_keys=True)
+    with open(output + ".csv", 'w') as f :
+        writer = csv.writer(f)
+        writer.writerow(['texdir', 'region', 'sub_region', 'contribution', 'value'])
+        for summary in summaries :
+            for name, values in summary['rows'] :
+                for sub, value in zip(summary['sub_regions'], values) :
+                    writer.writerow([summary['texdir'], summary['region'], sub, name, "%.6g"%value])
+    print "Summary written to %s.{txt,json,csv}"%output
 
-    print (line_break)
-    print (header)
-    print (line_break)
-
-    sys_summary = [ {'contribution': g.groupname,
-                     sf_region + " (+/- #evt)" : g.combined[sf_region],
-                     df_region + " (+/- #evt)": g.combined[df_region] 
-                    }
-                    for g in region_.groups]
-    sys_stat = [ {'contribution' : "MC statistics",
-                  sf_region + " (+/- #evt)" : region_.total_stat_err[sf_region],
-                  df_region + " (+/- #evt)" : region_.total_stat_err[df_region] } ]
-    sys_summary += sys_stat
-    lines = [line_template.format(*(a[k] for k in fields)) for a in sys_summary]
-    print ('\n'.join(lines))
-    print (line_break)
-    sys_total = [ {'contribution' : "Total",
-                   sf_region + " (+/- #evt)" : region_.total_sys_err[sf_region],
-                   df_region + " (+/- #evt)" : region_.total_sys_err[df_region] } ]
-    lines = [line_template.format(*(a[k] for k in fields)) for a in sys_total]
-    print ('\n'.join(lines))
-    print (line_break)
-    yld = [ {'contribution' : "Yields (#evt)",
-             sf_region + " (+/- #evt)" : region_.total_bkg_exp[sf_region],
-             df_region + " (+/- #evt)" : region_.total_bkg_exp[df_region] }]
-    lines = [line_template.format(*(a[k] for k in fields)) for a in yld]
-    print ('\n'.join(lines))
-    print (line_break)
-    
+#################################################
+if __name__=="__main__" :
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--texdir", nargs="+", default=[""], help="Provide the directory (or directories) containing the .tex SysTables")
+    parser.add_argument("-v", "--verbose", action="store_true", default=False, help="Print out some more goings-on")
+    parser.add_argument("-r", "--region", nargs="+", default=[], help="Provide the base region(s) (e.g. Super1a, default: all of %s)"%" ".join(base_regions))
+    parser.add_argument("-f", "--per-flavour", action="store_true", default=False, help="Summarize the ee, mm and em sub-regions instead of sf and em")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Number of worker processes (default: 1)")
+    parser.add_argument("-o", "--output", default="", help="Also write the combined summary to <output>.txt, <output>.json and <output>.csv")
+    parser.add_argument("--no-cache", action="store_true", default=False, help="Re-parse all of the tables (do not use the cache of parsed tables)")
+    parser.add_argument("--profile", default="", help="Time the stages of the run and write the report to <profile>.json and <profile>.csv")
+    args = parser.parse_args()
+    dbg = args.verbose
+    use_cache = not args.no_cache
+    if args.profile : profiling.enable()
+    base_region_names = args.region if args.region else base_regions
+    flavours = per_flavour_flavours if args.per_flavour else default_flavours
+    for base_region in base_region_names :
+        if base_region not in base_regions :
+            print "Region '%s' not supported! Available regions are: %s"%(base_region, " ".join(base_regions))
+            sys.exit()
+
+    jobs = [ (texdir, base_region, flavours) for texdir in args.texdir for base_region in base_region_names ]
+    summaries = [s for s in run_jobs(summarize, jobs, args.jobs) if s is not None]
+    print "%d of %d region summaries made"%(len(summaries), len(jobs))
+
+    for summary in summaries :
+        print "%s  %s"%(summary['region'], summary['texdir'])
+        print summary_table(summary)
+    if args.output : write_summaries(summaries, args.output)
+
+    profiling.finish(args.profile)
@@ -0,0 +1,403 @@
+#
+# Compile the TCut strings used throughout superplotter (see
+# superplotter.region) into NumPy kernels that evaluate a selection
+# for a whole chunk of events at once.
+#
+# A TCut is parsed into a small expression tree made of tuples:
+#     ('num', value)            literal (constants are folded)
+#     ('var', name)             leaf of the input tree
+#     ('call', func, (args))    e.g. TMath::Abs(x)
+#     ('not', x), ('neg', x)    unary '!' and '-'
+#     (op, x, y)                binary arithmetic and comparisons
+#     ('and', (x, y, ...))      flattened, de-duplicated '&&'
+#     ('or', (x, y, ...))       flattened, de-duplicated '||'
+# Nodes are hashable so that identical sub-expressions, wherever
+# they appear, are evaluated only once by a SelectionProgram.
+#
+
+import re
+import numpy as np
+
+_TOKEN_RE = re.compile(r'''\s*(?:
+    (?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+  | (?P<name>[A-Za-z_]\w*(?:::[A-Za-z_]\w*)*)
+  | (?P<op>&&|\|\||==|!=|<=|>=|[-+*/<>!(),])
+  )''', re.VERBOSE)
+
+def _divide(x, y) :
+    ''' TTreeFormula evaluates x/0 as 0 '''
+    y = np.asarray(y, dtype=np.float64)
+    safe_y = np.where(y != 0, y, 1.0)
+    return np.where(y != 0, x / safe_y, 0.0)
+
+_ARITHMETIC = {
+    '+' : np.add,
+    '-' : np.subtract,
+    '*' : np.multiply,
+    '/' : _divide,
+    }
+
+_COMPARISON = {
+    '==' : np.equal,
+    '!=' : np.not_equal,
+    '<'  : np.less,
+    '<=' : np.less_equal,
+    '>'  : np.greater,
+    '>=' : np.greater_equal,
+    }
+
+_FUNCTIONS = {
+    'abs'          : np.abs,
+    'fabs'         : np.abs,
+    'TMath::Abs'   : np.abs,
+    'sqrt'         : np.sqrt,
+    'TMath::Sqrt'  : np.sqrt,
+    'exp'          : np.exp,
+    'TMath::Exp'   : np.exp,
+    'log'          : np.log,
+    'TMath::Log'   : np.log,
+    'cos'          : np.cos,
+    'TMath::Cos'   : np.cos,
+    'sin'          : np.sin,
+    'TMath::Sin'   : np.sin,
+    'pow'          : np.power,
+    'TMath::Power' : np.power,
+    }
+
+# binding strength of the binary operators (higher binds tighter)
+_PRECEDENCE = [ ['||'], ['&&'], ['==', '!='], ['<', '<=', '>', '>='], ['+', '-'], ['*', '/'] ]
+
+''' -----------------------------------------------------'''
+'''   Parsing                                            '''
+''' -----------------------------------------------------'''
+def tokenize(expression) :
+    '''
+    Split a TCut string into (kind, text) tokens,
+    kind being one of 'num', 'name' or 'op'
+    '''
+    tokens = []
+    pos = 0
+    expression = expression.rstrip()
+    while pos < len(expression) :
+        match = _TOKEN_RE.match(expression, pos)
+        if not match or match.end() == pos :
+            raise ValueError("tokenize error: cannot parse '%s' at position %d in '%s'"%(expression[pos:], pos, expression))
+        pos = match.end()
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+    return tokens
+
+class _Parser :
+    '''
+    Recursive-descent parser following the C operator precedence
+    '''
+    def __init__(self, expression) :
+        self.expression = expression
+        self.tokens = tokenize(expression)
+        self.pos = 0
+
+    def peek(self) :
+        if self.pos < len(self.tokens) : return self.tokens[self.pos]
+        return (None, None)
+
+    def take(self, text=None) :
+        kind, tok = self.peek()
+        if kind is None or (text is not None and tok != text) :
+            raise ValueError("parse error: expected '%s' in '%s'"%(text if text else "an operand", self.expression))
+        self.pos += 1
+        return kind, tok
+
+    def parse(self) :
+        node = self.binary(0)
+        if self.pos != len(self.tokens) :
+            raise ValueError("parse error: unexpected '%s' in '%s'"%(self.peek()[1], self.expression))
+        return node
+
+    def binary(self, level) :
+        if level == len(_PRECEDENCE) : return self.unary()
+        node = self.binary(level+1)
+        while self.peek()[0] == 'op' and self.peek()[1] in _PRECEDENCE[level] :
+            op = self.take()[1]
+            node = make_node(op, node, self.binary(level+1))
+        return node
+
+    def unary(self) :
+        kind, tok = self.peek()
+        if kind == 'op' and tok in ('!', '-', '+') :
+            self.take()
+            operand = self.unary()
+            if tok == '!' : return make_node('not', operand)
+            if tok == '-' : return make_node('neg', operand)
+            return operand
+        return self.primary()
+
+    def primary(self) :
+        kind, tok = self.take()
+        if kind == 'num' :
+            return ('num', float(tok))
+        if kind == 'name' :
+            if self.peek() != ('op', '(') : return ('var', tok)
+            if tok not in _FUNCTIONS :
+                raise ValueError("parse error: unsupported function '%s' in '%s'"%(tok, self.expression))
+            self.take('(')
+            args = [self.binary(0)]
+            while self.peek() == ('op', ',') :
+                self.take(',')
+                args.append(self.binary(0))
+            self.take(')')
+            return make_node('call', tok, tuple(args))
+        if (kind, tok) == ('op', '(') :
+            node = self.binary(0)
+            self.take(')')
+            return node
+        raise ValueError("parse error: unexpected '%s' in '%s'"%(tok, self.expression))
+
+def make_node(kind, *operands) :
+    '''
+    Build an expression node, folding constants and flattening
+    (and sorting) the operands of '&&' and '||' so that equivalent
+    selections map onto the same node
+    '''
+    if kind in ('&&', '||') :
+        kind = 'and' if kind == '&&' else 'or'
+        children = []
+        for operand in operands :
+            if operand[0] == kind : children.extend(operand[1])
+            else : children.append(operand)
+        children = sorted(set(children), key=format_node)
+        node = (kind, tuple(children))
+    elif kind == 'call' :
+        node = (kind, operands[0], operands[1])
+    else :
+        node = (kind,) + operands
+    if all(child[0] == 'num' for child in node_children(node)) :
+        return ('num', float(evaluate_node(node, {})))
+    return node
+
+def node_children(node) :
+    ''' The sub-expressions of a node '''
+    kind = node[0]
+    if kind in ('num', 'var') : return ()
+    if kind in ('and', 'or') : return node[1]
+    if kind == 'call' : return node[2]
+    return node[1:]
+
+def parse_selection(expression) :
+    ''' Parse a TCut string into an expression node '''
+    return _Parser(expression).parse()
+
+def _format_number(value) :
+    text = repr(float(value))
+    if text.endswith('.0') : text = text[:-2]
+    return text
+
+def format_node(node) :
+    '''
+    Write an expression node back out as a TCut string. Equivalent
+    selections give the same string (see make_node).
+    '''
+    kind = node[0]
+    def wrap(child) :
+        text = format_node(child)
+        if child[0] in ('num', 'var', 'call', 'not', 'neg') : return text
+        return "(%s)"%text
+    if kind == 'num' : return _format_number(node[1])
+    if kind == 'var' : return node[1]
+    if kind == 'call' : return "%s(%s)"%(node[1], ",".join(format_node(a) for a in node[2]))
+    if kind == 'not' : return "!%s"%wrap(node[1])
+    if kind == 'neg' : return "-%s"%wrap(node[1])
+    if kind == 'and' : return " && ".join(wrap(c) for c in node[1])
+    if kind == 'or' : return " || ".join(wrap(c) for c in node[1])
+    return "%s%s%s"%(wrap(node[1]), kind, wrap(node[2]))
+
+def normalize_selection(expression) :
+    ''' Canonical form of a TCut string '''
+    return format_node(parse_selection(expression))
+
+def split_conjunction(expression) :
+    '''
+    Split a TCut string into its top-level '&&' terms, keeping the
+    order in which they are written (e.g. for a cutflow). Each term is
+    given in canonical form and repeated terms are dropped.
+    '''
+    terms, current, depth = [], [], 0
+    tokens = tokenize(expression)
+    if any(tok == ('op', '||') for tok in tokens) :
+        # check that there is no '||' at the top level
+        for kind, tok in tokens :
+            if tok == '(' : depth += 1
+            elif tok == ')' : depth -= 1
+            elif tok == '||' and depth == 0 : return [normalize_selection(expression)]
+        depth = 0
+    for kind, tok in tokens + [('op', '&&')] :
+        if tok == '(' : depth += 1
+        elif tok == ')' : depth -= 1
+        if tok == '&&' and depth == 0 :
+            node = _Parser(" ".join(t for k, t in current)).parse()
+            for term in (node[1] if node[0] == 'and' else [node]) :
+                term = format_node(term)
+                if term not in terms : terms.append(term)
+            current = []
+        else :
+            current.append((kind, tok))
+    return terms
+
+def node_variables(node) :
+    ''' The set of tree leaves used by an expression node '''
+    if node[0] == 'var' : return set([node[1]])
+    names = set()
+    for child in node_children(node) :
+        names |= node_variables(child)
+    return names
+
+def selection_variables(expression) :
+    ''' The set of tree leaves used by a TCut string '''
+    return node_variables(parse_selection(expression))
+
+def draw_variables(command) :
+    '''
+    The set of tree leaves used by a TTree::Draw command,
+    e.g. "lept1Pt/1000>>h" or "mll:met>>h2"
+    '''
+    if '>>' in command : command = command[:command.find('>>')]
+    names = set()
+    for expression in re.split(r'(?<!:):(?!:)', command) :
+        if expression.strip() : names |= selection_variables(expression)
+    return names
+
+''' -----------------------------------------------------'''
+'''   Evaluation                                         '''
+''' -----------------------------------------------------'''
+def _as_number(value) :
+    value = np.asarray(value)
+    if value.dtype == np.bool_ : return value.astype(np.float64)
+    return value
+
+def _as_bool(value) :
+    value = np.asarray(value)
+    if value.dtype == np.bool_ : return value
+    return value != 0
+
+def _apply(kind, args) :
+    '''
+    Apply the operation of a node of type "kind" to its
+    already evaluated operands
+    '''
+    if kind == 'not' : return np.logical_not(_as_bool(args[0]))
+    if kind == 'neg' : return np.negative(_as_number(args[0]))
+    if kind == 'and' : return reduce(np.logical_and, [_as_bool(a) for a in args])
+    if kind == 'or' : return reduce(np.logical_or, [_as_bool(a) for a in args])
+    if kind in _COMPARISON : return _COMPARISON[kind](_as_number(args[0]), _as_number(args[1]))
+    return _ARITHMETIC[kind](_as_number(args[0]), _as_number(args[1]))
+
+def evaluate_node(node, columns) :
+    '''
+    Evaluate an expression node directly over a dict of
+    column arrays { leaf name : array }, without any sharing
+    '''
+    kind = node[0]
+    if kind == 'num' : return node[1]
+    if kind == 'var' : return np.asarray(columns[node[1]], dtype=np.float64)
+    args = [evaluate_node(child, columns) for child in node_children(node)]
+    if kind == 'call' : return _FUNCTIONS[node[1]](*[_as_number(a) for a in args])
+    return _apply(kind, args)
+
+def as_mask(value, n) :
+    ''' Boolean mask of length n from an evaluated selection '''
+    return np.logical_and(np.ones(n, dtype=np.bool_), _as_bool(value))
+
+def as_weight(value, n) :
+    ''' Float array of length n from an evaluated weight expression '''
+    return np.ones(n, dtype=np.float64) * _as_number(value)
+
+class SelectionProgram :
+    '''
+    A set of named TCut expressions (e.g. all of the regions in
+    superplotter.region, plus the event weight) compiled into one
+    list of array operations. Every distinct sub-expression is
+    evaluated once per chunk no matter how many selections use it.
+    The operands of '&&' and '||' are chained with the most commonly
+    used terms first so that partial conjunctions common to several
+    selections (e.g. the super1a cuts and the Z-veto) are shared too.
+    '''
+    def __init__(self) :
+        self.nodes = {}     # { name : expression node }
+        self.steps = None   # [ (kind, operands) ] in evaluation order
+
+    def add(self, name, expression) :
+        self.nodes[name] = parse_selection(expression)
+        self.steps = None
+
+    def variables(self) :
+        ''' The tree leaves needed to evaluate every selection '''
+        names = set()
+        for node in self.nodes.values() :
+            names |= node_variables(node)
+        return names
+
+    def compile(self) :
+        self.steps = []
+        self._slots = {}
+        self._usage = {}
+        for node in self.nodes.values() : self._count_usage(node)
+        self.outputs = dict((name, self._emit(node)) for name, node in self.nodes.items())
+
+    def _count_usage(self, node) :
+        if node[0] in ('and', 'or') :
+            for child in node[1] :
+                self._usage[child] = self._usage.get(child, 0) + 1
+        for child in node_children(node) : self._count_usage(child)
+
+    def _push(self, key, kind, operands) :
+        self.steps.append((kind, operands))
+        self._slots[key] = len(self.steps) - 1
+        return self._slots[key]
+
+    def _emit(self, node) :
+        if node in self._slots : return self._slots[node]
+        kind = node[0]
+        if kind in ('num', 'var') :
+            return self._push(node, kind, (node[1],))
+        if kind == 'call' :
+            return self._push(node, kind, (node[1],) + tuple(self._emit(a) for a in node[2]))
+        if kind in ('and', 'or') :
+            children = sorted(node[1], key=lambda c : (-self._usage.get(c, 0), format_node(c)))
+            slot = self._emit(children[0])
+            for i in xrange(1, len(children)) :
+                chain = (kind, tuple(children[:i+1]))
+                if chain in self._slots :
+                    slot = self._slots[chain]
+                    continue
+                slot = self._push(chain, kind, (slot, self._emit(children[i])))
+            self._slots[node] = slot
+            return slot
+        return self._push(node, kind, tuple(self._emit(child) for child in node_children(node)))
+
+    def evaluate(self, columns) :
+        '''
+        Evaluate all of the selections over a chunk of events.
+        "columns" is a dict { leaf name : array } holding (at least)
+        the leaves given by variables().
+        Returns { name : array (or scalar, for constant expressions) }
+        '''
+        if self.steps is None : self.compile()
+        values = []
+        for kind, operands in self.steps :
+            if kind == 'num' :
+                values.append(operands[0])
+            elif kind == 'var' :
+                values.append(np.asarray(columns[operands[0]], dtype=np.float64))
+            elif kind == 'call' :
+                values.append(_FUNCTIONS[operands[0]](*[_as_number(values[s]) for s in operands[1:]]))
+            else :
+                values.append(_apply(kind, [values[s] for s in operands]))
+        return dict((name, values[slot]) for name, slot in self.outputs.items())
+
+def compile_regions(region_names, region_dict) :
+    '''
+    Compile the requested regions of "region_dict" (e.g.
+    superplotter.region.regions) into a single SelectionProgram
+    '''
+    program = SelectionProgram()
+    for reg in region_names :
+        program.add(reg, region_dict[reg])
+    return program
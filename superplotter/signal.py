@@ -1,6 +1,8 @@
-import ROOT as r
 import glob
 
+from superplotter.metadata import get_index
+from superplotter.treepool import tree_pool
+
 
 def get_signal_file_directory(grid, truth=False) :
     if grid=='SMCwslep' :
@@ -15,13 +17,14 @@ def get_prod_label(grid) :
         return "#tilde{#chi}^{#pm}_{1}#tilde{#chi}^{#mp}_{1} #rightarrow 2 #times #tilde{l}#nu (l#tilde{#nu}) #rightarrow 2 #times #tilde{#chi}_{1}^{0}l#nu"        
     else : print "get_prod_label error: requested grid not supported"
 
-class Signal :
+class Signal(object) :
     def __init__(self, file, grid, dbg=False) :
         self.dbg = dbg
         self.file = file
         self.grid = grid
         self.dsid = str(self.dsid_from_file(file))
-        self.tree = None
+        # tree set by hand, otherwise the tree is taken from the tree pool
+        self._tree = None
         # info about masses
         self.mX = 0.0
         self.mY = 0.0
@@ -53,65 +56,56 @@ class Signal :
         elif 'CENTRAL' in file :
             dsid = file[file.find('CENTRAL_')+8 : self.file.find('.root')]
         return dsid
-    # method to get the tree from the file
-    def get_tree(self) :
+    # name of the tree in the file
+    def tree_name(self) :
         tree_name = ''
         if 'truthRazor' in self.file :
             tree_name = 'truthNt'
         elif 'CENTRAL' in self.file :
             tree_name = 'id_' + str(self.dsid)
-        infile = r.TFile.Open(self.file)
-        chain = r.TChain(tree_name)
-        chain.Add(self.file)
-        self.tree = chain
+        return tree_name
+    # the tree of this point, opened on first use and kept in the
+    # shared pool of open trees (superplotter.treepool), which
+    # closes and reopens it as needed
+    @property
+    def tree(self) :
+        if self._tree is not None : return self._tree
+        return tree_pool.get(self.file, self.tree_name())
+    @tree.setter
+    def tree(self, tree) :
+        self._tree = tree
+    # method to get the tree from the file
+    # (the file is now only opened when self.tree is first used)
+    def get_tree(self) :
+        self._tree = None
+    # close the file of this point if it is open
+    def release_tree(self) :
+        self._tree = None
+        tree_pool.release(self.file, self.tree_name())
     # based on the input grid, get the masses for the dsid
     def fill_mass_info(self) :
-        if self.grid=='SMCwslep' :
-            txtfile='/gdata/atlas/dantrim/SusyAna/Super/SusyXSReader/data/modeC_lightslep_MC1eqMN2_DiagonalMatrix.txt'
-            lines = open(txtfile).readlines()
-            fields = lines[0].split()
-            dsIdx = fields.index('DS')
-            mc1Idx = fields.index('MC1,MN2[GeV]')
-            mn1Idx = fields.index('MN1[GeV]')
-            for line in lines[1:]:
-                line = line.strip()
-                if not line : continue
-                fields = line.split()
-                if fields[0]!=self.dsid : continue
-                self.mX = float(fields[mc1Idx])
-                self.mY = float(fields[mn1Idx])
+        index = get_index(self.grid, 'mass')
+        if index is not None :
+            if self.dsid in index :
+                self.mX, self.mY = index[self.dsid]
 
                 if self.dbg : print "Signal %s found at (%s,%s)"%(self.dsid, self.mX, self.mY)
         else : print "fill_mass_info error: requested grid not supported"
     # based on the input grid, get the xsec, BR, and filter efficiency
     def fill_xsec_br_eff(self) :
-        if self.grid=='SMCwslep' :
-            txtfile='/gdata/atlas/dantrim/SusyAna/Super/SUSYTools/data/mc12_8TeV/Herwigpp_UEEE3_CTEQ6L1_simplifiedModel_wC.txt'
-            dsid = self.dsid
-            lines = open(txtfile).readlines()
-            for line in lines[5:]:
-                line = line.strip()
-                if not line : continue
-                fields = line.split()
-                if fields[0]!=self.dsid : continue
-                self.xsec = float(fields[2])
-                self.branching_ratio = float(fields[3])
-                self.filter_efficiency = float(fields[4])
+        index = get_index(self.grid, 'xsec')
+        if index is not None :
+            if self.dsid in index :
+                self.xsec, self.branching_ratio, self.filter_efficiency = index[self.dsid]
                 if self.dbg : print "   xsec: %s br: %s eff: %s"%(self.xsec, self.branching_ratio, self.filter_efficiency)
 
         else : print "fill_xsec_br_eff error: requested grid not supported"
     # get the number of events generated at truth level MC
     def get_n_generated(self) :
-        if self.grid=='SMCwslep' :
-            file='info/SMCwslep_modelNgen.txt'
-            lines=open(file).readlines()
-            fields=lines[0].split()
-            for line in lines :
-                line = line.strip()
-                if not line : continue
-                fields = line.split()
-                if fields[0]!=self.dsid : continue
-                self.n_generated = fields[1]
+        index = get_index(self.grid, 'ngen')
+        if index is not None :
+            if self.dsid in index :
+                self.n_generated = index[self.dsid]
                 
                 if self.dbg : print "   n_generated: %s"%self.n_generated
         else : print "get_n_generated error: requested grid not supported"
@@ -0,0 +1,313 @@
+#
+# Expected significance of the signal regions over a whole grid
+#
+# The signal yields of every point in every region (the n_fiducial_reco
+# columns of a superplotter.grid.SignalGrid, e.g. read back from the
+# 'acc_eff' results) are combined with the background expectation and
+# its uncertainty in each region, as summarized by systabler.py (the
+# totals of a systabler Region, or its JSON summary). The significance
+# of all points and regions is then computed at once, as arrays:
+#
+#   'asimov'    Z_Asimov, the discovery significance of the Asimov
+#               data set with an uncertain background (Cowan et al.)
+#   'binomial'  Z_n = RooStats::NumberCountingUtils::BinomialExpZ, as
+#               used by HistFitter
+#
+# and the best region of each point is the one with the largest
+# significance.
+#
+# The same-flavour ("sf") tables of systabler cover both the ee and
+# the mm regions, whose signal yields are then added up.
+#
+
+import json
+import math
+import numpy as np
+
+from superplotter.stat_tools import get_sigmas_from_pvalues
+
+''' -------------------------------------------'''
+'''  Background                                '''
+''' -------------------------------------------'''
+def background_from_totals(total_bkg_exp, total_sys_err, total_stat_err=None) :
+    '''
+    { sub-region : (expected background, absolute uncertainty) } from the
+    totals of a systabler Region (dictionaries keyed by sub-region). The
+    MC statistical uncertainty is added in quadrature if given.
+    '''
+    background = {}
+    for reg, b in total_bkg_exp.items() :
+        err2 = total_sys_err[reg] ** 2
+        if total_stat_err is not None : err2 += total_stat_err[reg] ** 2
+        background[reg] = (float(b), math.sqrt(err2))
+    return background
+
+def background_from_summaries(summaries, texdir=None, add_stat=False) :
+    '''
+    { sub-region : (expected background, absolute uncertainty) } from the
+    summaries written by systabler.py (the list in <output>.json), only
+    keeping those of "texdir" if given
+    '''
+    background = {}
+    for summary in summaries :
+        if texdir is not None and summary['texdir'] != texdir : continue
+        rows = dict((name, values) for name, values in summary['rows'])
+        totals = {}
+        for name, key in [ ("Yields (#evt)", 'b'), ("Total", 'sys'), ("MC statistics", 'stat') ] :
+            if name not in rows :
+                raise ValueError("background_from_summaries error: the summary of %s in '%s' has no '%s' row"%(
+                    summary['region'], summary['texdir'], name))
+            totals[key] = dict(zip(summary['sub_regions'], rows[name]))
+        for reg, value in background_from_totals(totals['b'], totals['sys'],
+                                                 totals['stat'] if add_stat else None).items() :
+            if reg in background :
+                raise ValueError("background_from_summaries error: several summaries for %s, choose a texdir"%reg)
+            background[reg] = value
+    return background
+
+def load_background(path, texdir=None, add_stat=False) :
+    ''' background_from_summaries of a systabler <output>.json file '''
+    with open(path) as f :
+        return background_from_summaries(json.load(f), texdir, add_stat)
+
+''' -------------------------------------------'''
+'''  Signal                                    '''
+''' -------------------------------------------'''
+def signal_regions(sub_region) :
+    '''
+    The regions of superplotter.region that make up a systabler
+    sub-region ("sfSuper1a" is eeSuper1a + mmSuper1a)
+    '''
+    if sub_region.startswith('sf') :
+        return [ 'ee' + sub_region[2:], 'mm' + sub_region[2:] ]
+    return [ sub_region ]
+
+def signal_yields(grid, sub_regions, column='n_fiducial_reco', scale=1.0) :
+    '''
+    The signal yields (n points, n sub-regions) of a SignalGrid,
+    multiplied by "scale" (e.g. to change the luminosity)
+    '''
+    yields = np.zeros((len(grid), len(sub_regions)), dtype=np.float64)
+    values = getattr(grid, column)
+    for j, sub in enumerate(sub_regions) :
+        for reg in signal_regions(sub) :
+            if reg not in grid.region_index :
+                raise KeyError("signal_yields error: the grid has no yields for %s (needed for %s)"%(reg, sub))
+            yields[:, j] += values[:, grid.region_index[reg]]
+    return scale * yields
+
+''' -------------------------------------------'''
+'''  Special functions                         '''
+''' -------------------------------------------'''
+# Lanczos approximation (g=7, n=9)
+_LANCZOS_G = 7.0
+_LANCZOS = [ 0.99999999999980993, 676.5203681218851, -1259.1392167224028, 771.32342877765313,
+             -176.61502916214059, 12.507343278686905, -0.13857109526572012, 9.9843695780195716e-6,
+             1.5056327351493116e-7 ]
+
+def lgamma(x) :
+    '''
+    log|Gamma(x)| of an array of positive numbers (Lanczos approximation)
+    '''
+    x = np.asarray(x, dtype=np.float64)
+    # reflection for x < 0.5
+    small = x < 0.5
+    z = np.where(small, 1.0 - x, x) - 1.0
+    a = np.zeros_like(z) + _LANCZOS[0]
+    for i in xrange(1, len(_LANCZOS)) :
+        a += _LANCZOS[i] / (z + i)
+    t = z + _LANCZOS_G + 0.5
+    result = 0.5 * math.log(2.0 * math.pi) + (z + 0.5) * np.log(t) - t + np.log(a)
+    if small.any() :
+        with np.errstate(divide='ignore') :
+            reflected = math.log(math.pi) - np.log(np.abs(np.sin(math.pi * x))) - result
+        result = np.where(small, reflected, result)
+    return result
+
+_BETA_EPS = 1e-15
+_BETA_TINY = 1e-300
+_BETA_MAX_ITERATIONS = 1000
+
+def _guard(v, tmp) :
+    ''' Replace the (near) zeros of v by _BETA_TINY, in place '''
+    np.abs(v, out=tmp)
+    v[tmp < _BETA_TINY] = _BETA_TINY
+
+def _lentz_step(aa, c, d, delta, tmp) :
+    '''
+    One step of the modified Lentz method with coefficient aa, in place:
+    d = 1 / (1 + aa d), c = 1 + aa / c and delta = c d
+    '''
+    d *= aa
+    d += 1.0
+    _guard(d, tmp)
+    np.reciprocal(d, out=d)
+    np.divide(aa, c, out=c)
+    c += 1.0
+    _guard(c, tmp)
+    np.multiply(d, c, out=delta)
+
+def _beta_continued_fraction(x, a, b) :
+    '''
+    Continued fraction of the incomplete beta function (modified Lentz),
+    only iterating on the elements that have not converged yet. The
+    arrays are updated in place, this is where Z_n spends its time.
+    '''
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    aa, tmp, delta = np.empty_like(x), np.empty_like(x), np.empty_like(x)
+    c = np.ones_like(x)
+    d = 1.0 - qab * x / qap
+    _guard(d, tmp)
+    np.reciprocal(d, out=d)
+    h = d.copy()
+    # positions (in h) of the elements still iterated on
+    active = None
+    for m in xrange(1, _BETA_MAX_ITERATIONS + 1) :
+        m2 = 2 * m
+        # even step: aa = m (b - m) x / ((a - 1 + 2m) (a + 2m))
+        np.subtract(b, m, out=aa)
+        aa *= x
+        aa *= m
+        aa /= np.add(qam, m2, out=tmp)
+        aa /= np.add(a, m2, out=tmp)
+        _lentz_step(aa, c, d, delta, tmp)
+        if active is None : h *= delta
+        else : h[active] *= delta
+        # odd step: aa = -(a + m) (a + b + m) x / ((a + 2m) (a + 1 + 2m))
+        np.add(a, m, out=aa)
+        aa *= np.add(qab, m, out=tmp)
+        aa *= x
+        aa /= np.add(a, m2, out=tmp)
+        aa /= np.negative(np.add(qap, m2, out=tmp), out=tmp)
+        _lentz_step(aa, c, d, delta, tmp)
+        if active is None : h *= delta
+        else : h[active] *= delta
+        delta -= 1.0
+        going = np.abs(delta, out=delta) >= _BETA_EPS
+        if not going.any() : break
+        if not going.all() :
+            active = np.flatnonzero(going) if active is None else active[going]
+            x, a, b, c, d = x[going], a[going], b[going], c[going], d[going]
+            qab, qap, qam = qab[going], qap[going], qam[going]
+            aa, tmp, delta = aa[going], tmp[going], delta[going]
+    return h
+
+def incomplete_beta(x, a, b) :
+    '''
+    Regularized incomplete beta function I_x(a, b) (TMath::BetaIncomplete)
+    of arrays, for x in [0, 1] and a, b > 0
+    '''
+    x, a, b = np.broadcast_arrays(np.asarray(x, dtype=np.float64), np.asarray(a, dtype=np.float64),
+                                  np.asarray(b, dtype=np.float64))
+    result = np.where(x <= 0.0, 0.0, 1.0)
+    inside = (x > 0.0) & (x < 1.0)
+    if not inside.any() : return result
+    x, a, b = x[inside], a[inside], b[inside]
+    front = np.exp(lgamma(a + b) - lgamma(a) - lgamma(b) + a * np.log(x) + b * np.log1p(-x))
+    # the continued fraction converges quickly for x < (a+1)/(a+b+2),
+    # otherwise use I_x(a, b) = 1 - I_{1-x}(b, a)
+    swap = x > (a + 1.0) / (a + b + 2.0)
+    xs, as_, bs = np.where(swap, 1.0 - x, x), np.where(swap, b, a), np.where(swap, a, b)
+    value = front * _beta_continued_fraction(xs, as_, bs) / as_
+    result[inside] = np.where(swap, 1.0 - value, value)
+    return result
+
+''' -------------------------------------------'''
+'''  Significances                             '''
+''' -------------------------------------------'''
+def asimov_z(s, b, sigma_b=0.0) :
+    '''
+    Median discovery significance for s signal over b +/- sigma_b
+    background events (Cowan, Cranmer, Gross, Vitells), elementwise.
+    0 where s <= 0 and NaN where b <= 0.
+    '''
+    s, b, sigma_b = np.broadcast_arrays(np.asarray(s, dtype=np.float64), np.asarray(b, dtype=np.float64),
+                                        np.asarray(sigma_b, dtype=np.float64))
+    with np.errstate(divide='ignore', invalid='ignore') :
+        n = s + b
+        s2 = sigma_b * sigma_b
+        # without uncertainty the general formula is 0/0
+        z2_exact = 2.0 * (n * np.log1p(s / b) - s)
+        z2_uncertain = 2.0 * (n * np.log(n * (b + s2) / (b * b + n * s2))
+                              - b * b / s2 * np.log1p(s2 * s / (b * (b + s2))))
+        z2 = np.where(s2 > 0, z2_uncertain, z2_exact)
+        z = np.sqrt(np.maximum(z2, 0.0))
+    z = np.where(s > 0, z, 0.0)
+    return np.where(b > 0, z, np.nan)
+
+def binomial_exp_p(s, b, rel_unc) :
+    '''
+    RooStats::NumberCountingUtils::BinomialExpP: p-value of s + b observed
+    events over b with a relative uncertainty rel_unc, elementwise
+    '''
+    s, b, rel_unc = np.broadcast_arrays(np.asarray(s, dtype=np.float64), np.asarray(b, dtype=np.float64),
+                                        np.asarray(rel_unc, dtype=np.float64))
+    p = np.full(s.shape, np.nan)
+    ok = (b > 0) & (rel_unc > 0) & (s + b > 0)
+    if ok.any() :
+        tau = 1.0 / b[ok] / (rel_unc[ok] * rel_unc[ok])
+        auxiliary = b[ok] * tau
+        p[ok] = incomplete_beta(1.0 / (1.0 + tau), s[ok] + b[ok], auxiliary + 1.0)
+    return p
+
+def binomial_exp_z(s, b, rel_unc) :
+    '''
+    RooStats::NumberCountingUtils::BinomialExpZ (Z_n), elementwise.
+    NaN where b <= 0 or rel_unc <= 0.
+    '''
+    return get_sigmas_from_pvalues(binomial_exp_p(s, b, rel_unc))
+
+methods = [ 'asimov', 'binomial' ]
+
+def significance_grid(signal, background, background_err, method='asimov') :
+    '''
+    The significances (n points, n regions) of the signal yields
+    (n points, n regions) over the background (n regions) +/-
+    background_err (n regions, absolute)
+    '''
+    signal = np.asarray(signal, dtype=np.float64)
+    b = np.asarray(background, dtype=np.float64)[np.newaxis, :]
+    err = np.asarray(background_err, dtype=np.float64)[np.newaxis, :]
+    if method == 'asimov' :
+        return asimov_z(signal, b, err)
+    if method == 'binomial' :
+        with np.errstate(divide='ignore', invalid='ignore') :
+            rel_unc = err / b
+        return binomial_exp_z(signal, b, rel_unc)
+    raise KeyError("significance_grid error: unknown method '%s' (known: %s)"%(method, methods))
+
+def best_regions(z) :
+    '''
+    For each point (row of z), the column of the largest significance
+    and its value (-1 and NaN for points without any)
+    '''
+    z = np.asarray(z, dtype=np.float64)
+    if z.shape[1] == 0 :
+        return -np.ones(len(z), dtype=int), np.full(len(z), np.nan)
+    valid = ~np.isnan(z)
+    best = np.argmax(np.where(valid, z, -np.inf), axis=1)
+    has_any = valid.any(axis=1)
+    best_z = np.where(has_any, z[np.arange(len(z)), best] if len(z) else np.zeros(0), np.nan)
+    return np.where(has_any, best, -1), best_z
+
+def grid_significance(grid, background, sub_regions=None, method='asimov', scale=1.0) :
+    '''
+    Significance of all points of a SignalGrid in the sub-regions (default:
+    all of those of "background" that the grid has yields for), as the
+    arrays of the 'significance' product of superplotter.results
+    '''
+    if sub_regions is None :
+        sub_regions = sorted(reg for reg in background
+                             if all(r in grid.region_index for r in signal_regions(reg)))
+    missing = [reg for reg in sub_regions if reg not in background]
+    if missing :
+        raise KeyError("grid_significance error: no background for %s"%missing)
+    signal = signal_yields(grid, sub_regions, scale=scale)
+    b = np.array([background[reg][0] for reg in sub_regions], dtype=np.float64)
+    err = np.array([background[reg][1] for reg in sub_regions], dtype=np.float64)
+    z = significance_grid(signal, b, err, method)
+    best, best_z = best_regions(z)
+    return { 'dsid' : grid.dsid, 'mX' : grid.mX, 'mY' : grid.mY,
+             'regions' : np.array(sub_regions, dtype=np.str_),
+             'signal' : signal, 'background' : b, 'background_err' : err,
+             'significance' : z, 'best_region' : best.astype(np.float64), 'best_significance' : best_z }
@@ -5,16 +5,19 @@
 # May 2015
 #
 
-import ROOT as r
 import math 
+import numpy as np
 from array import array
 
+from superplotter.lazy_root import ROOT as r
+
 
 def get_sigma_from_pvalue(pvalue) :
     '''
     Convert p-value in standard deviations ("nsigma")
     Taken from HistFitter/src/StatTools::GetSigma( Double_t p )
     Equivalent: S = TMath::NormQuantile(1-p)
+    (see get_sigmas_from_pvalues for arrays, without ROOT)
     '''
     if ( pvalue > (1.0-1e-16) ) : return -7.4
     if ( pvalue < (1e-16)) : return 7.4
@@ -28,3 +31,148 @@ def get_sigma_from_pvalue(pvalue) :
     else :
         nsigma = -1
     return nsigma
+
+# p-values beyond these are clamped to +/- MAX_SIGMA, as in get_sigma_from_pvalue
+PVALUE_CLAMP = 1e-16
+MAX_SIGMA = 7.4
+
+''' -----------------------------------------------------'''
+'''   Vectorized (NumPy, no ROOT) conversions              '''
+''' -----------------------------------------------------'''
+# rational approximations of erf and erfc (Cephes, W. J. Cody),
+# accurate to about 1e-16 relative
+_ERFC_P = [ 2.46196981473530512524e-10, 5.64189564831068821977e-1, 7.46321056442269912687e0,
+            4.86371970985681366614e1, 1.96520832956077098242e2, 5.26445194995477358631e2,
+            9.34528527171957607540e2, 1.02755188689515710272e3, 5.57535335369399327526e2 ]
+_ERFC_Q = [ 1.0, 1.32281951154744992508e1, 8.67072140885989742329e1, 3.54937778887819891062e2,
+            9.75708501743205489753e2, 1.82390916687909736289e3, 2.24633760818710981792e3,
+            1.65666309194161350182e3, 5.57535340817727675546e2 ]
+_ERFC_R = [ 5.64189583547755073984e-1, 1.27536670759978104416e0, 5.01905042251180477414e0,
+            6.16021097993053585195e0, 7.40974269950448939160e0, 2.97886665372100240670e0 ]
+_ERFC_S = [ 1.0, 2.26052863220117276590e0, 9.39603524938001434673e0, 1.20489539808096656605e1,
+            1.70814450747565897222e1, 9.60896809063285878198e0, 3.36907645100081516050e0 ]
+_ERF_T = [ 9.60497373987051638749e0, 9.00260197203842689217e1, 2.23200534594684319226e3,
+           7.00332514112805075473e3, 5.55923013010394962768e4 ]
+_ERF_U = [ 1.0, 3.35617141647503099647e1, 5.21357949780152679795e2, 4.59432382970980127987e3,
+           2.26290000613890934246e4, 4.92673942608635921086e4 ]
+
+# rational approximation of the normal quantile (P. J. Acklam),
+# accurate to 1.15e-9 relative before refinement
+_ACKLAM_A = [ -3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+              1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00 ]
+_ACKLAM_B = [ -5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+              6.680131188771972e+01, -1.328068155288572e+01, 1.0 ]
+_ACKLAM_C = [ -7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+              -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00 ]
+_ACKLAM_D = [ 7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+              3.754408661907416e+00, 1.0 ]
+_ACKLAM_LOW = 0.02425
+
+def _polyval(coefficients, x) :
+    ''' Horner evaluation (in place), highest power first '''
+    y = np.empty_like(x)
+    y.fill(coefficients[0])
+    for c in coefficients[1:] :
+        y *= x
+        y += c
+    return y
+
+def _as_flat(values) :
+    ''' (flat float64 copy of values, shape to give back to the result) '''
+    values = np.asarray(values, dtype=np.float64)
+    return values.ravel(), values.shape
+
+def _reshape(out, shape) :
+    ''' The result with the shape of the input (a float for a number) '''
+    if shape == () : return float(out[0])
+    return out.reshape(shape)
+
+def _erfc(x) :
+    ''' erfc of a flat array '''
+    out = np.empty_like(x)
+    ax = np.abs(x)
+    small = ax < 1.0
+    if small.any() :
+        xs = x[small]
+        z = xs * xs
+        out[small] = 1.0 - xs * _polyval(_ERF_T, z) / _polyval(_ERF_U, z)
+    large = ~small
+    if large.any() :
+        a = ax[large]
+        mid = a < 8.0
+        if mid.all() :
+            ratio = _polyval(_ERFC_P, a) / _polyval(_ERFC_Q, a)
+        else :
+            ratio = _polyval(_ERFC_R, a) / _polyval(_ERFC_S, a)
+            if mid.any() :
+                ratio[mid] = _polyval(_ERFC_P, a[mid]) / _polyval(_ERFC_Q, a[mid])
+        with np.errstate(under='ignore') :
+            y = np.exp(-a * a) * ratio
+        xl = x[large]
+        out[large] = np.where(xl < 0, 2.0 - y, y)
+    return out
+
+def erfc(x) :
+    '''
+    Complementary error function, elementwise
+    '''
+    x, shape = _as_flat(x)
+    with np.errstate(invalid='ignore') :
+        return _reshape(_erfc(x), shape)
+
+def _normal_quantile(p) :
+    ''' normal_quantile of a flat array '''
+    x = np.empty_like(p)
+    x.fill(np.nan)
+    # work on the smaller of the two tails (x <= 0), for precision
+    upper = p > 0.5
+    tail_p = np.where(upper, 1.0 - p, p)
+    valid = (tail_p > 0) & (tail_p <= 0.5)
+    low = valid & (tail_p < _ACKLAM_LOW)
+    central = valid & ~low
+    if central.any() :
+        q = tail_p[central] - 0.5
+        r2 = q * q
+        x[central] = q * _polyval(_ACKLAM_A, r2) / _polyval(_ACKLAM_B, r2)
+    if low.any() :
+        q = np.sqrt(-2.0 * np.log(tail_p[low]))
+        x[low] = _polyval(_ACKLAM_C, q) / _polyval(_ACKLAM_D, q)
+    # one Halley step
+    if valid.any() :
+        t = x[valid]
+        e = 0.5 * _erfc(t * -math.sqrt(0.5)) - tail_p[valid]
+        u = e * math.sqrt(2.0 * math.pi) * np.exp(0.5 * t * t)
+        x[valid] = t - u / (1.0 + 0.5 * t * u)
+    return np.where(upper, -x, x)
+
+def normal_quantile(p) :
+    '''
+    Quantile of the standard normal distribution (TMath::NormQuantile)
+    for probabilities in (0, 1), NaN outside: Acklam's approximation
+    refined with one Halley step
+    '''
+    p, shape = _as_flat(p)
+    with np.errstate(invalid='ignore') :
+        return _reshape(_normal_quantile(p), shape)
+
+def get_sigmas_from_pvalues(pvalues) :
+    '''
+    Array version of get_sigma_from_pvalue: nsigma = NormQuantile(1-p),
+    clamped to +/-7.4 for p-values within 1e-16 of 0 or 1
+    '''
+    p, shape = _as_flat(pvalues)
+    with np.errstate(invalid='ignore') :
+        # (+ 0.0 so that p = 0.5 gives 0 rather than -0)
+        nsigma = -_normal_quantile(p) + 0.0
+        nsigma[p > (1.0 - PVALUE_CLAMP)] = -MAX_SIGMA
+        nsigma[p < PVALUE_CLAMP] = MAX_SIGMA
+    return _reshape(nsigma, shape)
+
+def get_pvalues_from_sigmas(sigmas) :
+    '''
+    One-sided p-values of significances (the inverse of
+    get_sigmas_from_pvalues): p = 1 - Phi(nsigma) = erfc(nsigma/sqrt(2))/2
+    '''
+    z, shape = _as_flat(sigmas)
+    with np.errstate(invalid='ignore') :
+        return _reshape(0.5 * _erfc(z * math.sqrt(0.5)), shape)
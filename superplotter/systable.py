@@ -0,0 +1,188 @@
+#
+# Index of the SysTable .tex files made by HistFitter's SysTable.py
+#
+# A table is read and tokenized once: each row of the LaTeX table
+# becomes its label (first column) and the numbers of its process
+# columns, held as lists. Every systematic, group and total of the
+# table is then looked up in that index instead of re-reading the
+# file for each of them.
+#
+# Parsed tables are kept in memory and pickled to disk, so that a
+# table is only parsed again once its file changes (size or mtime).
+# The pickles are in $SUPERPLOTTER_CACHE_DIR/systables (default
+# ~/.superplotter_cache/systables)
+#
+# A cell of a systematics row looks like
+#     $\pm 19.03\ [25.2\%] $
+# i.e. the variation in number of events and in percent of the yield.
+#
+
+import os
+import re
+import math
+import hashlib
+
+from superplotter.profiling import profiled
+from superplotter.utils import cache_base_dir, file_stamp, load_stamped_pickle, store_stamped_pickle
+
+# "\pm <value>" optionally followed by "\ [<percent>\%]"
+_PM_CELL_RE = re.compile(r'\\pm\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)'
+                         r'(?:\s*\\?\s*\[\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*\\?%\s*\])?')
+
+TOTAL_EXPECTATION = "Total background expectation"
+TOTAL_SYSTEMATIC = "Total background systematic"
+MC_STAT = "mcstat"
+
+def passline(line) :
+    '''
+    Whether a (raw) line of the table is a row with systematic numbers
+    '''
+    passes = True
+    if "&" not in line : passes = False  # lines with sys numbers must have & since it is a latex table!
+    if line.startswith("%") : passes = False # ignore any column entries for latex-commented out lines
+    if "(MC)" in line : passes = False
+    return passes
+
+def parse_pm_cell(cell) :
+    '''
+    (value, percent) of a "$\pm value\ [percent\%]$" cell,
+    NaN for the parts that are not there
+    '''
+    match = _PM_CELL_RE.search(cell)
+    if not match : return float('nan'), float('nan')
+    value, percent = match.groups()
+    return float(value), (float(percent) if percent is not None else float('nan'))
+
+def parse_plain_cell(cell) :
+    ''' The number of a "$ value $" cell, NaN if it is not a number '''
+    cell = cell.replace("$", "").replace("\\\\", "").strip()
+    try :
+        return float(cell)
+    except ValueError :
+        return float('nan')
+
+class SysTableRow(object) :
+    '''
+    One row of a table: its label and, for each process column,
+    the +/- value, its percentage and the plain number of the cell
+    '''
+    __slots__ = ('line', 'label', 'passes', 'pm', 'percent', 'plain')
+    def __init__(self, line) :
+        self.passes = passline(line)
+        self.line = line.strip()
+        fields = self.line.split("&")
+        self.label = fields[0]
+        cells = fields[1:]
+        parsed = [parse_pm_cell(c) for c in cells]
+        self.pm = [p[0] for p in parsed]
+        self.percent = [p[1] for p in parsed]
+        self.plain = [parse_plain_cell(c) for c in cells]
+
+class SysTable(object) :
+    '''
+    The rows of a SysTable .tex file, parsed once
+    '''
+    def __init__(self, path, text=None) :
+        self.path = path
+        if text is None :
+            with open(path) as f :
+                text = f.read()
+        self.rows = [SysTableRow(line) for line in text.splitlines() if "&" in line]
+        self._systematics = {}
+
+    def _check(self, row, values, what) :
+        if any(math.isnan(v) for v in values) :
+            raise ValueError("SysTable error: cannot read the %s of row '%s' in %s"%(what, row.label.strip(), self.path))
+        return values
+
+    def find_row(self, name) :
+        '''
+        The first systematics row whose label contains "name"
+        (None if there is none)
+        '''
+        for row in self.rows :
+            if row.passes and name in row.label :
+                return row
+        return None
+
+    def systematic(self, name) :
+        '''
+        The variation (in number of events) of the systematic "name",
+        summed over the background processes (i.e. treating them as
+        correlated), or None if the table has no such row
+        '''
+        if name not in self._systematics :
+            row = self.find_row(name)
+            value = None
+            if row is not None :
+                value = float(sum(self._check(row, row.pm, "+/- values")))
+            self._systematics[name] = value
+        return self._systematics[name]
+
+    def systematics(self, names) :
+        ''' { name : variation } for each of the systematics '''
+        return dict((name, self.systematic(name)) for name in names)
+
+    def group_error(self, names) :
+        '''
+        The systematics "names" added in quadrature
+        '''
+        return math.sqrt(sum(self.systematic(name)**2 for name in names))
+
+    def total_expectation(self) :
+        '''
+        Total background expectation, summed over the processes
+        '''
+        for row in self.rows :
+            if TOTAL_EXPECTATION in row.line :
+                return float(sum(self._check(row, row.plain, "yields")))
+        return None
+
+    def total_stat_err(self) :
+        '''
+        Total statistical uncertainty: the "mcstat" values of each
+        background process added in quadrature
+        '''
+        total = 0.0
+        for row in self.rows :
+            if not row.passes or MC_STAT not in row.line : continue
+            values = self._check(row, row.pm, "+/- values")
+            total += sum(v*v for v in values)
+        return math.sqrt(total)
+
+    def total_sys_err(self) :
+        '''
+        Total systematic uncertainty: the "Total background systematic"
+        of each background process added in quadrature
+        '''
+        total = 0.0
+        for row in self.rows :
+            if TOTAL_SYSTEMATIC not in row.line : continue
+            values = self._check(row, row.pm, "+/- values")
+            total += sum(v*v for v in values)
+        return math.sqrt(total)
+
+# in-process tables { path : (stamp, SysTable) }
+_tables = {}
+
+def default_cache_dir() :
+    return os.path.join(cache_base_dir(), 'systables')
+
+@profiled("systable")
+def load_systable(path, use_cache=True) :
+    '''
+    The SysTable of a .tex file, parsed only if neither the
+    in-process nor the on-disk copy is current
+    '''
+    realpath = os.path.realpath(path)
+    stamp = file_stamp(realpath)
+    if realpath in _tables and _tables[realpath][0] == stamp :
+        return _tables[realpath][1]
+    pickle_path = os.path.join(default_cache_dir(), "%s.pkl"%hashlib.sha1(realpath).hexdigest())
+    table = load_stamped_pickle(pickle_path, stamp) if use_cache else None
+    if table is None :
+        table = SysTable(path)
+        if use_cache : store_stamped_pickle(pickle_path, stamp, table)
+    table.path = path
+    _tables[realpath] = (stamp, table)
+    return table
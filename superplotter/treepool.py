@@ -0,0 +1,84 @@
+#
+# Bounded pool of open input trees
+#
+# The trees of the signal points are opened lazily, the first time
+# they are needed, and at most "max_open" of them are kept open at
+# a time. When the pool is full the least recently used tree is
+# released (which closes its file) and it is transparently reopened
+# if it is asked for again. This keeps the number of open files and
+# the memory held by their baskets flat however many points a
+# grid has.
+#
+# The default size of the pool is $SUPERPLOTTER_MAX_OPEN_FILES if
+# set, otherwise 32.
+#
+
+import os
+from collections import OrderedDict
+
+from superplotter.lazy_root import ROOT as r
+
+from superplotter.profiling import stage
+
+DEFAULT_MAX_OPEN = int(os.environ.get('SUPERPLOTTER_MAX_OPEN_FILES', 32))
+
+class TreePool(object) :
+    '''
+    LRU cache of the open trees, keyed by (file, tree name)
+    '''
+    def __init__(self, max_open=DEFAULT_MAX_OPEN) :
+        if max_open < 1 :
+            raise ValueError("TreePool error: max_open must be at least 1 (got %s)"%max_open)
+        self.max_open = max_open
+        self._trees = OrderedDict()
+        self.n_opened = 0
+
+    def __len__(self) :
+        return len(self._trees)
+
+    def __contains__(self, key) :
+        return key in self._trees
+
+    def get(self, file, tree_name) :
+        '''
+        The tree "tree_name" of "file", opening it (and closing the
+        least recently used tree if the pool is full) if needed.
+
+        Do not hold on to the returned tree while getting others
+        from the pool: ask the pool for it again instead.
+        '''
+        key = (file, tree_name)
+        if key in self._trees :
+            tree = self._trees.pop(key)
+            self._trees[key] = tree
+            return tree
+        while len(self._trees) >= self.max_open :
+            self._trees.popitem(last=False)
+        with stage("open file") :
+            chain = r.TChain(tree_name)
+            chain.Add(file)
+            # TChain::Add does not open the file: do it here, so that
+            # opening it and reading its header are timed in this stage
+            chain.GetEntries()
+        self._trees[key] = chain
+        self.n_opened += 1
+        return chain
+
+    def release(self, file, tree_name) :
+        ''' Close the tree "tree_name" of "file" if it is open '''
+        self._trees.pop((file, tree_name), None)
+
+    def resize(self, max_open) :
+        ''' Change the maximum number of open trees '''
+        if max_open < 1 :
+            raise ValueError("TreePool error: max_open must be at least 1 (got %s)"%max_open)
+        self.max_open = max_open
+        while len(self._trees) > self.max_open :
+            self._trees.popitem(last=False)
+
+    def clear(self) :
+        ''' Close all of the open trees '''
+        self._trees.clear()
+
+# the pool shared by all of the Signal objects of a process
+tree_pool = TreePool()
@@ -1,6 +1,70 @@
 import os
-import commands
+import shutil
+import cPickle as pickle
+from contextlib import contextmanager
+
+from superplotter.output import ensure_dir
  
+''' -------------------------------------------'''
+'''  Caches                                    '''
+''' -------------------------------------------'''
+def cache_base_dir() :
+    '''
+    Top directory of the on-disk caches of superplotter:
+    $SUPERPLOTTER_CACHE_DIR if set, otherwise ~/.superplotter_cache
+    '''
+    return os.environ.get('SUPERPLOTTER_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.superplotter_cache'))
+
+def file_stamp(path) :
+    ''' (size, mtime) of a file, to tell if it changed '''
+    stat = os.stat(path)
+    return (stat.st_size, stat.st_mtime)
+
+@contextmanager
+def atomic_write(path) :
+    '''
+    Context giving a file, open for binary writing, that replaces "path"
+    once it is complete. It is written under a temporary name of this
+    process first, so that readers (or other processes writing "path")
+    never see a partial file. Nothing is replaced if writing fails.
+    '''
+    tmp = "%s.%d.tmp"%(path, os.getpid())
+    try :
+        with open(tmp, 'wb') as f :
+            yield f
+        os.rename(tmp, path)
+    finally :
+        if os.path.exists(tmp) : os.remove(tmp)
+
+def load_stamped_pickle(pickle_path, stamp) :
+    '''
+    The object pickled by store_stamped_pickle with the same
+    stamp, or None if there is none (or it is unreadable)
+    '''
+    if not os.path.isfile(pickle_path) : return None
+    try :
+        with open(pickle_path, 'rb') as f :
+            cached_stamp, obj = pickle.load(f)
+    except Exception :
+        return None
+    if cached_stamp != stamp : return None
+    return obj
+
+def store_stamped_pickle(pickle_path, stamp, obj) :
+    '''
+    Pickle "obj" along with "stamp" (e.g. the file_stamp of the file
+    it was made from). Failures are ignored: the caches are only an
+    optimisation.
+    '''
+    try :
+        cache_dir = os.path.dirname(pickle_path)
+        if not os.path.isdir(cache_dir) : os.makedirs(cache_dir)
+        with atomic_write(pickle_path) as f :
+            pickle.dump((stamp, obj), f, pickle.HIGHEST_PROTOCOL)
+    except (IOError, OSError, pickle.PicklingError) :
+        pass
+
+
 ''' -------------------------------------------'''
 '''  OS/Shell Methods                          '''
 ''' -------------------------------------------'''
@@ -9,25 +73,15 @@ def mkdir_if_needed(destdir, dbg) :
     Given a requested output directory, test if it already exists.
     If not, make it.
     '''
-    if not os.path.isdir(destdir) :
-        if dbg : print "Making directory %s" % str(destdir)
-        cmd = "mkdir -p %s" % str(destir)
-        print cmd
-        commands.getoutput(cmd)
-        
+    ensure_dir(str(destdir), dbg)
+
 def mv_file_to_dir(filename, destdir, dbg) :
     '''
     Move a specified file to a given destination directory.
     First check if the directory exists. If not, make it.
     '''
-    if not os.path.isdir(destdir) :
-        if dbg : print "Making directory %s" % str(destdir)
-        cmd = "mkdir -p %s" % str(destdir) 
-        print cmd
-        commands.getoutput(cmd)
-    cmd = "mv %s %s" % (filename, destdir)
-    print cmd
-    commands.getoutput(cmd)
-        
-     
-    
+    destdir = str(destdir)
+    ensure_dir(destdir, dbg)
+    dest = os.path.join(destdir, os.path.basename(filename))
+    if dbg : print "Moving %s to %s" % (filename, dest)
+    shutil.move(filename, dest)
@@ -0,0 +1,54 @@
+#
+# Registry of the plotted variables
+#
+# Each variable is described once: the tree leaf it is read from,
+# the factor its values are divided by (e.g. 1000 for MeV -> GeV),
+# its binning and its axis title. Plotting code looks the variables
+# up here instead of hard-coding them.
+#
+
+from collections import OrderedDict
+
+from superplotter.histogram import Hist1D
+
+class Variable(object) :
+    '''
+    A plotted variable: "branch"/"scale" in nbins bins in [xlow, xhigh)
+    '''
+    def __init__(self, name, branch, nbins, xlow, xhigh, xtitle, scale=1.0, ytitle="entries") :
+        self.name = name
+        self.branch = branch
+        self.nbins = nbins
+        self.xlow = xlow
+        self.xhigh = xhigh
+        self.xtitle = xtitle
+        self.scale = scale
+        self.ytitle = ytitle
+
+    def expression(self) :
+        ''' The TTreeFormula giving the value that is histogrammed '''
+        if self.scale == 1.0 : return self.branch
+        return "%s/%s"%(self.branch, "%g"%self.scale)
+
+    def book(self, name="", title="") :
+        ''' An empty Hist1D with the binning and titles of the variable '''
+        return Hist1D.uniform(self.nbins, self.xlow, self.xhigh, name, title, self.xtitle, self.ytitle)
+
+def make_registry(variables) :
+    ''' { name : Variable }, in the order given '''
+    return OrderedDict((v.name, v) for v in variables)
+
+# the variables of the ISR re-weighting plots (momenta and masses in GeV)
+GeV = 1000.
+isr_variables = make_registry([
+    Variable("lept1Pt", "lept1Pt",           15, 10, 100, "p_{T}^{lead lep} [GeV]",      scale=GeV),
+    Variable("lept2Pt", "lept2Pt",            8, 10,  90, "p_{T}^{sub-lead lep} [GeV]",  scale=GeV),
+    Variable("mDeltaR", "mDeltaR",            8,  0,  80, "M_{#Delta}^{R} [GeV]",        scale=GeV),
+    Variable("jet1Pt",  "jet1Pt",            10, 20, 200, "p_{T}^{lead jet} [GeV]",      scale=GeV),
+    Variable("mll",     "mll",               11, 20, 240, "m_{ll} [GeV]",                scale=GeV),
+    Variable("dpb",     "dphi_ll_vBetaT",    10,  0, 3.0, "#Delta#phi_{#beta}^{R}"),
+    Variable("R2",      "R2",                10,  0, 1.0, "R_{2}"),
+    Variable("met",     "met",               15,  0, 175, "E_{T}^{miss} [GeV]",          scale=GeV),
+    Variable("njets",   "nCentralLightJets",  5,  0,   5, "N_{jets}^{CL20}"),
+    Variable("pTll",    "pTll",              12, 10,  80, "p_{T}^{ll} [GeV]",            scale=GeV),
+])
@@ -0,0 +1,197 @@
+#
+# Region yields computed in a single pass over a tree
+#
+# Every region in superplotter.region is a TCut. Rather than
+# running one TTree::Draw per region (one full scan of the
+# ntuple each), all of the regions and the event weights are
+# compiled into one SelectionProgram (superplotter.selection)
+# and evaluated over chunks of the tree's leaves as arrays.
+#
+# Without root_numpy the leaves can only be read event by event
+# from python, so instead encode for each event which regions it
+# passes as a bit pattern and draw that pattern together with all
+# of the weights, in one TTree::Draw per chunk of entries. The
+# weights of the entries with each region's bit set are then summed
+# into the per-region sum-of-weights and sumw2.
+#
+
+import numpy as np
+
+from superplotter.region import regions
+from superplotter.profiling import profiled
+from superplotter.selection import SelectionProgram, as_mask, as_weight
+from superplotter.columns import have_root_numpy, iter_chunks, iter_entry_chunks, iter_draw_chunks, ENTRY_NUMBER, DEFAULT_CHUNK_SIZE
+from superplotter.cache import attach_entries
+
+# each region takes one bit of a pattern, drawn as a double:
+# cap the number of regions sharing one pattern so that it is exact
+MAX_REGIONS_PER_PATTERN = 30
+
+def region_bitmask_expression(region_names, region_dict=regions) :
+    '''
+    Build the TTreeFormula giving, per event, the bit pattern
+    of the regions passed:
+        bit i is set <==> event passes region_names[i]
+    '''
+    terms = []
+    for i, reg in enumerate(region_names) :
+        terms.append("((%s)!=0)*%d"%(region_dict[reg], 1 << i))
+    return " + ".join(terms)
+
+def get_region_yields_from_pattern(tree, weights, region_names, region_dict=regions,
+                                    chunk_size=DEFAULT_CHUNK_SIZE, cache=None, source=None) :
+    '''
+    TTree::Draw based get_multi_weight_yields: the tree is read once,
+    with one TTree::Draw per chunk of entries giving, for each entry,
+    the bit pattern of the regions it passes (one pattern per
+    MAX_REGIONS_PER_PATTERN regions) and the value of each weight.
+
+    If an EntryListCache (superplotter.cache) is given, along with the
+    file the tree is read from, the selected entries of each region are
+    taken from it. If all of them are cached the tree is restricted to
+    these entries and only the weights are drawn. Otherwise the selected
+    entries of the regions not yet cached are stored.
+    '''
+    use_cache = cache is not None and source is not None
+    selected = {}
+    if use_cache :
+        for reg in region_names :
+            entries = cache.get(source, tree.GetName(), region_dict[reg])
+            if entries is not None : selected[reg] = entries
+    skip_selection = len(region_names) > 0 and len(selected) == len(region_names)
+    groups = []
+    if not skip_selection :
+        groups = [region_names[first : first+MAX_REGIONS_PER_PATTERN]
+                  for first in xrange(0, len(region_names), MAX_REGIONS_PER_PATTERN)]
+    keys = list(weights)
+    expressions = [region_bitmask_expression(names, region_dict) for names in groups]
+    expressions += [weights[key] for key in keys]
+    if use_cache : expressions.append(ENTRY_NUMBER)
+
+    sumw = dict(((key, reg), 0.0) for key in keys for reg in region_names)
+    sumw2 = dict(((key, reg), 0.0) for key in keys for reg in region_names)
+    found = dict((reg, []) for reg in region_names if reg not in selected)
+    if skip_selection :
+        attach_entries(tree, source, reduce(np.union1d, [selected[reg] for reg in region_names]))
+    try :
+        for values in iter_draw_chunks(tree, expressions, chunk_size) :
+            if use_cache : entries = values[-1].astype(np.int64)
+            if skip_selection :
+                index = dict((reg, np.in1d(entries, selected[reg])) for reg in region_names)
+            else :
+                index = {}
+                for names, pattern in zip(groups, values) :
+                    pattern = pattern.astype(np.int64)
+                    for i, reg in enumerate(names) :
+                        index[reg] = (pattern & (1 << i)) != 0
+                if use_cache :
+                    for reg in found :
+                        found[reg].append(entries[index[reg]])
+            for key, w in zip(keys, values[len(groups):]) :
+                for reg in region_names :
+                    w_pass = w[index[reg]]
+                    sumw[(key, reg)] += float(w_pass.sum())
+                    sumw2[(key, reg)] += float((w_pass * w_pass).sum())
+    finally :
+        if skip_selection : tree.SetEntryList(0)
+    if use_cache :
+        for reg in found :
+            entries = np.concatenate(found[reg]) if found[reg] else np.zeros(0, dtype=np.int64)
+            cache.put(source, tree.GetName(), region_dict[reg], entries)
+    return dict((key, dict((reg, (sumw[(key, reg)], sumw2[(key, reg)])) for reg in region_names))
+                for key in keys)
+
+def get_region_yields_from_columns(tree, weights, region_names, region_dict=regions,
+                                    chunk_size=DEFAULT_CHUNK_SIZE, cache=None, source=None) :
+    '''
+    Array based get_multi_weight_yields: the tree is read once, chunk
+    by chunk, and all of the regions and weights are evaluated on
+    each chunk.
+
+    If an EntryListCache (superplotter.cache) is given, along with the
+    file the tree is read from, the selected entries of each region are
+    taken from it. If all of them are cached the selection is skipped
+    and only the leaves entering the weights are read, for the cached
+    entries only. Otherwise the selected entries of the regions not yet
+    cached are stored.
+    '''
+    cached = {}
+    if cache is not None and source is not None :
+        for reg in region_names :
+            entries = cache.get(source, tree.GetName(), region_dict[reg])
+            if entries is not None : cached[reg] = entries
+    skip_selection = len(region_names) > 0 and len(cached) == len(region_names)
+
+    program = SelectionProgram()
+    if not skip_selection :
+        for reg in region_names :
+            program.add(reg, region_dict[reg])
+    for key, weight in weights.items() :
+        program.add(('weight', key), weight) # cannot clash with a region name
+
+    sumw = dict(((key, reg), 0.0) for key in weights for reg in region_names)
+    sumw2 = dict(((key, reg), 0.0) for key in weights for reg in region_names)
+    selected = dict((reg, []) for reg in region_names if reg not in cached)
+    if skip_selection :
+        # only read the entries passing one of the regions
+        union = reduce(np.union1d, [cached[reg] for reg in region_names])
+        chunks = iter_entry_chunks(tree, program.variables(), union, chunk_size)
+    else :
+        chunks = iter_chunks(tree, program.variables(), chunk_size)
+    start = 0
+    for n, columns in chunks :
+        values = program.evaluate(columns)
+        if skip_selection :
+            # the entries of this chunk are union[start:start+n]
+            entries = union[start:start+n]
+            index = dict((reg, np.in1d(entries, cached[reg])) for reg in region_names)
+        else :
+            index = dict((reg, as_mask(values[reg], n)) for reg in region_names)
+            for reg in selected :
+                selected[reg].append(np.nonzero(index[reg])[0] + start)
+        for key in weights :
+            w = as_weight(values[('weight', key)], n)
+            for reg in region_names :
+                w_pass = w[index[reg]]
+                sumw[(key, reg)] += float(w_pass.sum())
+                sumw2[(key, reg)] += float((w_pass * w_pass).sum())
+        start += n
+    if cache is not None and source is not None :
+        for reg in selected :
+            entries = np.concatenate(selected[reg]) if selected[reg] else np.zeros(0, dtype=np.int64)
+            cache.put(source, tree.GetName(), region_dict[reg], entries)
+    return dict((key, dict((reg, (sumw[(key, reg)], sumw2[(key, reg)])) for reg in region_names))
+                for key in weights)
+
+@profiled("selection")
+def get_multi_weight_yields(tree, weights, region_names=None, region_dict=regions, cache=None, source=None) :
+    '''
+    Compute the yield (sum of weights) and sumw2 for each of the
+    requested regions (default: all of them) under each of the
+    weights given as { key : weight expression }, accumulating
+    all of them in a single pass over the tree (with root_numpy or
+    with TTree::Draw).
+
+    "cache" (an EntryListCache) and "source" (the file holding the
+    tree) allow the selected entries of each region to be re-used
+    between runs, with or without root_numpy.
+
+    Returns { key : { region : (sumw, sumw2) } }
+    '''
+    if region_names is None : region_names = sorted(region_dict.keys())
+    if have_root_numpy() :
+        return get_region_yields_from_columns(tree, weights, region_names, region_dict,
+                                              cache=cache, source=source)
+    return get_region_yields_from_pattern(tree, weights, region_names, region_dict,
+                                          cache=cache, source=source)
+
+def get_region_yields(tree, weight, region_names=None, region_dict=regions, cache=None, source=None) :
+    '''
+    Compute the yield (sum of weights) and sumw2 for each of the
+    requested regions (default: all of them) in a single pass
+    over the tree.
+
+    Returns { region : (sumw, sumw2) }
+    '''
+    return get_multi_weight_yields(tree, { 'weight' : weight }, region_names, region_dict,
+                                   cache, source)['weight']